@@ -22,6 +22,11 @@ print("Exportando documentos...")
 docs = coleccion.stream()
 for doc in docs:
     data = doc.to_dict()
+    # Mensajes en la subcoleccion "mensajes" (esquema actual) + array "historial" (anterior)
+    mensajes = [m.to_dict() for m in doc.reference.collection("mensajes").stream()]
+    data["historial"] = sorted(
+        data.get("historial", []) + mensajes, key=lambda m: m.get("timestamp", "")
+    )
     file_name = os.path.join(EXPORT_FOLDER, f"{doc.id}.json")
     with open(file_name, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
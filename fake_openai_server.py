@@ -0,0 +1,281 @@
+"""
+Servidor local compatible con la API de OpenAI para pruebas de carga y de regresion.
+
+Atiende POST /v1/chat/completions (con y sin streaming SSE) sin llamar a
+OpenAI, para ejercitar webhook() -> get_response de punta a punta y medir
+throughput y comportamiento ante fallos. Cada respuesta se resuelve en orden:
+
+1. Grabaciones: respuestas grabadas por el servicio con
+   LLM_GRABAR_RESPUESTAS, buscadas por huella del prompt (huella_prompt).
+2. Guion: reglas {"si_contiene": "...", "respuesta": ...} evaluadas sobre el
+   ultimo mensaje del usuario; si la respuesta es un objeto se envia como JSON.
+3. Respuestas por defecto: JSON del clasificador o del agente de campanas si
+   se pidio response_format json_object, "no" para los detectores si/no
+   (max_tokens muy bajo) y un texto fijo para el resto.
+
+La latencia de cada respuesta sale de una distribucion configurable y se
+pueden inyectar errores HTTP (429/500/503) y cuelgues que superan el timeout
+del cliente.
+
+Uso:
+    python fake_openai_server.py --puerto 8090 --grabaciones respuestas.jsonl \\
+        --guion guion.json --latencia lognormal:-0.7,0.5 --tasa-errores 0.02
+
+    # En el servicio:
+    OPENAI_BASE_URL=http://localhost:8090/v1 OPENAI_API_KEY=falsa python src/server.py
+"""
+
+import argparse
+import json
+import math
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from flask import Flask, Response, jsonify, request
+
+from src.services.prompt_builder import huella_prompt
+
+# === CONFIGURACION POR DEFECTO ===
+# Se puede cambiar por linea de comandos (ver --help).
+CONFIGURACION: Dict[str, Any] = {
+    "latencia": "fija:0.3",           # Hasta la respuesta (o el primer fragmento)
+    "demora_fragmento_seg": 0.02,     # Entre fragmentos en streaming
+    "tasa_errores": 0.0,              # Probabilidad de responder con un error HTTP
+    "codigos_error": [429, 500, 503],
+    "tasa_cuelgues": 0.0,             # Probabilidad de no responder a tiempo
+    "cuelgue_seg": 60.0,
+}
+
+RESPUESTA_TEXTO_DEFECTO = (
+    "Esta es una respuesta simulada del servidor local. "
+    "Google Ads te ayuda a que más clientes encuentren tu negocio cuando buscan lo que vendes."
+)
+RESPUESTA_AGENTE_DEFECTO = {
+    "mensaje_respuesta": "¿Cómo se llama tu negocio y qué vendes?",
+    "datos": {
+        "campaign_name": "",
+        "titles": [],
+        "descriptions": [],
+        "keywords": [],
+        "requested_budget": "",
+    },
+    "estado": "en_proceso",
+}
+
+# === ESTADO ===
+_grabaciones: Dict[str, str] = {}
+_guion: List[Dict[str, Any]] = []
+_contadores: Dict[str, int] = {"solicitudes": 0, "grabadas": 0, "guion": 0, "defecto": 0, "errores": 0, "cuelgues": 0}
+
+app = Flask(__name__)
+
+
+# === CARGA DE DATOS ===
+def cargar_grabaciones(ruta: str) -> None:
+    """Lee el JSONL grabado por el servicio; por huella se queda con la respuesta mas larga."""
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            if not linea.strip():
+                continue
+            registro = json.loads(linea)
+            anterior = _grabaciones.get(registro["huella"], "")
+            if len(registro["contenido"]) >= len(anterior):
+                _grabaciones[registro["huella"]] = registro["contenido"]
+    print(f"[FAKE OPENAI] {len(_grabaciones)} respuestas grabadas cargadas desde {ruta}")
+
+
+def cargar_guion(ruta: str) -> None:
+    """Lee la lista de reglas {"si_contiene": texto, "respuesta": texto u objeto}."""
+    with open(ruta, encoding="utf-8") as archivo:
+        _guion.extend(json.load(archivo))
+    print(f"[FAKE OPENAI] {len(_guion)} reglas de guion cargadas desde {ruta}")
+
+
+# === LATENCIA Y ERRORES ===
+def muestrear_latencia(especificacion: str) -> float:
+    """
+    Segundos de latencia segun la distribucion configurada.
+
+    Formatos: fija:S, uniforme:A,B, normal:MEDIA,DESVIO, lognormal:MU,SIGMA
+    (parametros de la normal subyacente, en segundos).
+    """
+    nombre, _, parametros = especificacion.partition(":")
+    valores = [float(v) for v in parametros.split(",") if v]
+    if nombre == "fija":
+        segundos = valores[0]
+    elif nombre == "uniforme":
+        segundos = random.uniform(valores[0], valores[1])
+    elif nombre == "normal":
+        segundos = random.gauss(valores[0], valores[1])
+    elif nombre == "lognormal":
+        segundos = random.lognormvariate(valores[0], valores[1])
+    else:
+        raise ValueError(f"Distribucion de latencia desconocida: {especificacion}")
+    return max(segundos, 0.0)
+
+
+def _error_inyectado() -> Optional[Response]:
+    """Respuesta de error HTTP con el formato de OpenAI, segun tasa_errores."""
+    if random.random() >= CONFIGURACION["tasa_errores"]:
+        return None
+    codigo = random.choice(CONFIGURACION["codigos_error"])
+    _contadores["errores"] += 1
+    cuerpo = {
+        "error": {
+            "message": f"Error simulado {codigo}",
+            "type": "rate_limit_error" if codigo == 429 else "server_error",
+            "code": None,
+        }
+    }
+    return Response(json.dumps(cuerpo), status=codigo, mimetype="application/json")
+
+
+# === RESOLUCION DE LA RESPUESTA ===
+def _tokens(texto: str) -> int:
+    """Estimacion de tokens (1 cada 4 caracteres), suficiente para el reporte de uso."""
+    return max(1, math.ceil(len(texto) / 4))
+
+
+def resolver_contenido(cuerpo: Dict[str, Any]) -> str:
+    """Contenido de la respuesta: grabacion, guion o respuesta por defecto."""
+    mensajes = cuerpo.get("messages", [])
+    grabada = _grabaciones.get(huella_prompt(mensajes))
+    if grabada is not None:
+        _contadores["grabadas"] += 1
+        return grabada
+
+    ultimo_usuario = next((m.get("content") or "" for m in reversed(mensajes) if m.get("role") == "user"), "")
+    for regla in _guion:
+        if regla["si_contiene"].lower() in ultimo_usuario.lower():
+            _contadores["guion"] += 1
+            respuesta = regla["respuesta"]
+            return respuesta if isinstance(respuesta, str) else json.dumps(respuesta, ensure_ascii=False)
+
+    _contadores["defecto"] += 1
+    sistema = " ".join(m.get("content") or "" for m in mensajes if m.get("role") == "system")
+    if (cuerpo.get("response_format") or {}).get("type") == "json_object":
+        if "intenciones" in sistema and "mensaje_respuesta" not in sistema:
+            return json.dumps({"intenciones": []})
+        return json.dumps(RESPUESTA_AGENTE_DEFECTO, ensure_ascii=False)
+    if (cuerpo.get("max_tokens") or 1000) <= 5:
+        return "no"
+    return RESPUESTA_TEXTO_DEFECTO
+
+
+def _uso(cuerpo: Dict[str, Any], contenido: str) -> Dict[str, int]:
+    prompt_tokens = sum(_tokens(m.get("content") or "") + 4 for m in cuerpo.get("messages", []))
+    completion_tokens = _tokens(contenido)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def _fragmentos(contenido: str) -> List[str]:
+    """Divide el texto en fragmentos de una palabra (con su espacio) como un stream real."""
+    palabras = contenido.split(" ")
+    return [p + (" " if i < len(palabras) - 1 else "") for i, p in enumerate(palabras)]
+
+
+def _stream(cuerpo: Dict[str, Any], contenido: str, id_respuesta: str, creado: int):
+    """Eventos SSE chat.completion.chunk, con el chunk de uso si se pidio."""
+    def _chunk(choices: List[Dict[str, Any]], uso: Optional[Dict[str, int]] = None) -> str:
+        datos = {
+            "id": id_respuesta,
+            "object": "chat.completion.chunk",
+            "created": creado,
+            "model": cuerpo.get("model"),
+            "choices": choices,
+            "usage": uso,
+        }
+        return f"data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+    yield _chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+    for fragmento in _fragmentos(contenido):
+        time.sleep(CONFIGURACION["demora_fragmento_seg"])
+        yield _chunk([{"index": 0, "delta": {"content": fragmento}, "finish_reason": None}])
+    yield _chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if (cuerpo.get("stream_options") or {}).get("include_usage"):
+        yield _chunk([], _uso(cuerpo, contenido))
+    yield "data: [DONE]\n\n"
+
+
+# === RUTAS ===
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    """Equivalente local de chat.completions.create."""
+    _contadores["solicitudes"] += 1
+    cuerpo = request.get_json(force=True)
+
+    if random.random() < CONFIGURACION["tasa_cuelgues"]:
+        _contadores["cuelgues"] += 1
+        time.sleep(CONFIGURACION["cuelgue_seg"])
+    time.sleep(muestrear_latencia(CONFIGURACION["latencia"]))
+
+    error = _error_inyectado()
+    if error is not None:
+        return error
+
+    contenido = resolver_contenido(cuerpo)
+    id_respuesta = f"chatcmpl-falso-{uuid.uuid4().hex[:12]}"
+    creado = int(time.time())
+    if cuerpo.get("stream"):
+        return Response(_stream(cuerpo, contenido, id_respuesta, creado), mimetype="text/event-stream")
+
+    return jsonify({
+        "id": id_respuesta,
+        "object": "chat.completion",
+        "created": creado,
+        "model": cuerpo.get("model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": contenido},
+            "finish_reason": "stop",
+        }],
+        "usage": _uso(cuerpo, contenido),
+    })
+
+
+@app.route("/estadisticas")
+def estadisticas():
+    """Solicitudes atendidas por origen de la respuesta y fallos inyectados."""
+    return jsonify(_contadores)
+
+
+# === EJECUCION ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local compatible con OpenAI (chat.completions)")
+    parser.add_argument("--puerto", type=int, default=8090)
+    parser.add_argument("--grabaciones", help="JSONL grabado con LLM_GRABAR_RESPUESTAS")
+    parser.add_argument("--guion", help="JSON con reglas si_contiene/respuesta")
+    parser.add_argument("--latencia", default=CONFIGURACION["latencia"],
+                        help="fija:S | uniforme:A,B | normal:MEDIA,DESVIO | lognormal:MU,SIGMA")
+    parser.add_argument("--demora-fragmento", type=float, default=CONFIGURACION["demora_fragmento_seg"])
+    parser.add_argument("--tasa-errores", type=float, default=CONFIGURACION["tasa_errores"])
+    parser.add_argument("--codigos-error", default="429,500,503")
+    parser.add_argument("--tasa-cuelgues", type=float, default=CONFIGURACION["tasa_cuelgues"])
+    parser.add_argument("--cuelgue-seg", type=float, default=CONFIGURACION["cuelgue_seg"])
+    parser.add_argument("--semilla", type=int, help="Semilla aleatoria para corridas repetibles")
+    args = parser.parse_args()
+
+    muestrear_latencia(args.latencia)  # Valida el formato antes de arrancar.
+    CONFIGURACION.update({
+        "latencia": args.latencia,
+        "demora_fragmento_seg": args.demora_fragmento,
+        "tasa_errores": args.tasa_errores,
+        "codigos_error": [int(c) for c in args.codigos_error.split(",") if c],
+        "tasa_cuelgues": args.tasa_cuelgues,
+        "cuelgue_seg": args.cuelgue_seg,
+    })
+    if args.semilla is not None:
+        random.seed(args.semilla)
+    if args.grabaciones:
+        cargar_grabaciones(args.grabaciones)
+    if args.guion:
+        cargar_guion(args.guion)
+
+    app.run(host="0.0.0.0", port=args.puerto, threaded=True)
@@ -0,0 +1,28 @@
+"""
+Genera los pools de respuestas pre-generadas de las intenciones de contenido fijo.
+
+Para cada helper con pool (creador, que es Google Ads, costo) genera
+POOL_RESPUESTAS_K variantes de tono a partir de su PROMPT_SISTEMA y las guarda
+en Firestore (coleccion pool_respuestas) junto con la version del prompt.
+Conviene ejecutarlo despues de modificar el prompt de un helper; si no se
+ejecuta, el servicio intenta regenerar el pool en segundo plano al detectar el
+cambio, con espera entre intentos (POOL_RESPUESTAS_REINTENTO_SEG).
+
+Uso:
+    python generate_response_pools.py
+"""
+
+from src.config import POOL_RESPUESTAS_K
+from src.services.helpers import helper_costo_google_ads, helper_creador, helper_que_es_google_ads
+from src.services.response_pool import regenerar_pool
+
+HELPERS_CON_POOL = [helper_creador, helper_que_es_google_ads, helper_costo_google_ads]
+
+
+if __name__ == "__main__":
+    for helper in HELPERS_CON_POOL:
+        print(f"Generando {POOL_RESPUESTAS_K} variantes para '{helper.ETIQUETA_POOL}'...")
+        variantes = regenerar_pool(helper.ETIQUETA_POOL, helper.PROMPT_SISTEMA, helper.PREGUNTA_POOL)
+        print(f"  {len(variantes)} variantes guardadas")
+
+    print("\n✅ Pools de respuestas actualizados")
@@ -9,6 +9,7 @@ an OpenAI client using the environment-provided API key.
 import os
 from typing import Optional
 
+import httpx
 from dotenv import load_dotenv
 from openai import OpenAI
 
@@ -25,7 +26,28 @@ PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
 # === OPENAI API ===
 # API key used to initialize the OpenAI client.
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# Pooled HTTP client (keep-alive) shared by all calls. The SDK does not retry:
+# timeouts, retries and the circuit breaker live in src/services/llm.py.
+LLM_MAX_CONEXIONES = int(os.getenv("LLM_MAX_CONEXIONES", "32"))
+_openai_http_client = httpx.Client(
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONEXIONES,
+        max_keepalive_connections=LLM_MAX_CONEXIONES,
+    ),
+    timeout=httpx.Timeout(30.0, connect=5.0),
+)
+# Endpoint compatible con OpenAI. Vacio = OpenAI; para pruebas de carga y de
+# regresion sin OpenAI: http://localhost:8090/v1 (fake_openai_server.py).
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+openai_client = OpenAI(
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    http_client=_openai_http_client,
+    max_retries=0,
+)
+# Archivo JSONL donde el gateway graba cada respuesta completa junto con la
+# huella del prompt, para reproducirla despues con fake_openai_server.py.
+LLM_GRABAR_RESPUESTAS = os.getenv("LLM_GRABAR_RESPUESTAS") or None
 
 # === GPT MODEL CONFIGURATION ===
 # Model selection per task profile.
@@ -44,6 +66,81 @@ TEMPERATURA_AGENTE = 0.0                        # Para Agente
 # Por compatibilidad con codigo actual.
 GPT_MODEL = GPT_MODEL_GENERAL
 
+# === PROMPTS: PRESUPUESTO DE TOKENS ===
+# Tokens maximos de prompt (system + historial + mensaje) por modelo; el
+# historial se recorta desde lo mas antiguo hasta entrar en el presupuesto.
+PRESUPUESTO_TOKENS_PROMPT = {
+    GPT_MODEL_GENERAL: 1500,
+    GPT_MODEL_PRECISO: 1500,
+    GPT_MODEL_AVANZADO: 2500,
+    GPT_MODEL_AGENTE: 4000,
+}
+PRESUPUESTO_TOKENS_DEFECTO = 2000
+
+# === LLM: TIMEOUTS, REINTENTOS Y CIRCUIT BREAKER ===
+# Plazo total por llamada (incluye reintentos y espera de cupo), segun el tipo.
+LLM_TIMEOUTS_SEG = {
+    "deteccion": 4.0,
+    "helper": 12.0,
+    "fusion": 15.0,
+    "general": 12.0,
+    "agente": 25.0,
+    "resumen": 20.0,
+}
+LLM_REINTENTOS = 2                              # Reintentos ante timeouts, 429 y 5xx
+LLM_BACKOFF_BASE_SEG = 0.3                      # Backoff exponencial con jitter completo
+LLM_BACKOFF_MAX_SEG = 2.0
+# Llamadas simultaneas al proveedor en todo el proceso.
+LLM_MAX_EN_VUELO = int(os.getenv("LLM_MAX_EN_VUELO", "24"))
+# Fallos seguidos que abren el circuito y segundos que permanece abierto.
+LLM_CIRCUITO_FALLOS = 5
+LLM_CIRCUITO_ENFRIAMIENTO_SEG = 30.0
+
+# === LLM: RUTEO DE MODELOS POR TIPO DE LLAMADA ===
+# Modelos en orden de preferencia (del mas capaz/caro al mas rapido/barato) y
+# presupuesto de latencia p95 por tipo. Si el p95 reciente del preferido supera
+# el presupuesto, se usa el siguiente nivel; las muestras vencen para volver a
+# probar el preferido cuando el proveedor se recupera.
+RUTEO_MODELOS = {
+    "deteccion": {"modelos": [GPT_MODEL_PRECISO, GPT_MODEL_GENERAL], "p95_seg": 1.5},
+    "helper": {"modelos": [GPT_MODEL_AVANZADO, GPT_MODEL_GENERAL], "p95_seg": 5.0},
+    "fusion": {"modelos": [GPT_MODEL_AVANZADO, GPT_MODEL_GENERAL], "p95_seg": 6.0},
+    "general": {"modelos": [GPT_MODEL_AVANZADO, GPT_MODEL_GENERAL], "p95_seg": 3.0},
+    "agente": {"modelos": [GPT_MODEL_AGENTE, GPT_MODEL_AVANZADO], "p95_seg": 10.0},
+    "resumen": {"modelos": [GPT_MODEL_GENERAL], "p95_seg": 8.0},
+}
+RUTEO_MAX_MUESTRAS = 100                        # Latencias recordadas por tipo y modelo
+RUTEO_MIN_MUESTRAS = 10                         # Menos muestras = sin datos, se usa el modelo
+RUTEO_VENTANA_SEG = 5 * 60                      # Antiguedad maxima de una muestra
+
+# Cache por contenido de llamadas deterministas (temperatura 0, p. ej. el agente):
+# mismo prompt + modelo + parametros -> misma respuesta sin llamar a OpenAI.
+CACHE_DETERMINISTA_MAX_ENTRADAS = 500
+CACHE_DETERMINISTA_TTL_SEG = 30 * 60
+
+# === LLM: HEDGING (SOLICITUD DUPLICADA ANTE LA COLA LENTA) ===
+# Si una llamada de estos tipos no respondio tras el percentil de latencia
+# reciente de su modelo, se lanza un duplicado y se usa la primera respuesta.
+# Desactivado por defecto: cada duplicado se factura.
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_HEDGING_TIPOS = ("general", "agente")
+LLM_HEDGING_PERCENTIL = 0.90                    # Espera antes de duplicar
+LLM_HEDGING_DEMORA_DEFECTO_SEG = 3.0            # Espera sin muestras suficientes
+LLM_HEDGING_DEMORA_MIN_SEG = 0.5
+LLM_HEDGING_MAX_TASA = 0.10                     # Maximo de duplicados por llamada cubierta
+
+# === CONVERSACION: RESUMEN INCREMENTAL ===
+# Resumen compacto por usuario (negocio, ciudad, datos ya dados...) que se
+# actualiza en segundo plano cada RESUMEN_CADA_TURNOS turnos y reemplaza en los
+# prompts al historial ya resumido.
+RESUMEN_CONVERSACION = os.getenv("RESUMEN_CONVERSACION", "true").lower() == "true"
+RESUMEN_CADA_TURNOS = 4
+RESUMEN_MENSAJES_RECIENTES = 4                  # Mensajes crudos que siempre acompanan al resumen
+RESUMEN_MAX_MENSAJES_NUEVOS = 40                # Mensajes nuevos leidos por actualizacion
+RESUMEN_MAX_PALABRAS = 150
+RESUMEN_CACHE_MAX_ENTRADAS = 2000
+RESUMEN_CACHE_TTL_SEG = 10 * 60
+
 # === STORAGE CONTROL ===
 # True = usa Firestore (en la nube)
 # False = usa JSON local (en carpeta /data/conversations)
@@ -52,6 +149,103 @@ USAR_FIRESTORE = True
 # USAR_FIRESTORE = True
 # USAR_FIRESTORE = False
 
+# === STORAGE: ESCRITURA DIFERIDA (WRITE-BEHIND) ===
+# Los mensajes se encolan en memoria y se escriben en Firestore en segundo
+# plano (un commit por usuario con todos sus mensajes pendientes), cada
+# ESCRITURA_DIFERIDA_INTERVALO_SEG y al apagar la instancia. Las lecturas del
+# mismo proceso ven los mensajes aun no escritos.
+ESCRITURA_DIFERIDA = os.getenv("ESCRITURA_DIFERIDA", "true").lower() == "true"
+ESCRITURA_DIFERIDA_INTERVALO_SEG = 0.5
+# Con mas mensajes pendientes se escribe en el mismo hilo (contrapresion).
+ESCRITURA_DIFERIDA_MAX_PENDIENTES = 500
+
+# === STORAGE: CACHE DE HISTORIAL ===
+# Ventana reciente de cada usuario en memoria: se relee de Firestore al inicio
+# de cada turno (procesar_turno) y se actualiza al guardar cada mensaje, asi un
+# turno lee Firestore una sola vez. Es por proceso: con varias instancias o
+# WEBHOOK_MODO_POOL="processes" solo es confiable dentro del turno, y las
+# lecturas fuera de un turno pueden atrasarse hasta HISTORIAL_CACHE_TTL_SEG.
+HISTORIAL_CACHE = os.getenv("HISTORIAL_CACHE", "true").lower() == "true"
+HISTORIAL_CACHE_MAX_ENTRADAS = 2000
+HISTORIAL_CACHE_TTL_SEG = 5 * 60
+
+# === STORAGE: DEDUPLICACION DE MENSAJES ===
+# Los message_id procesados se registran con create() atomico y un campo
+# "expira_en" para la politica TTL de Firestore (WhatsApp reintenta un
+# webhook hasta 7 dias). Los IDs vistos por esta instancia se recuerdan en
+# memoria para descartar reentregas sin ir a Firestore.
+DEDUPLICACION_TTL_SEG = 7 * 24 * 3600
+DEDUPLICACION_CACHE_MAX_ENTRADAS = 20000
+
+# === INTENCIONES: EJECUCION EN PARALELO ===
+# Threads por pool de intenciones (uno para deteccion y otro para los helpers).
+INTENCIONES_WORKERS = int(os.getenv("INTENCIONES_WORKERS", "16"))
+# Plazo por turno para la deteccion; un detector que no responde a tiempo cuenta como "no".
+INTENCIONES_DEADLINE_SEG = float(os.getenv("INTENCIONES_DEADLINE_SEG", "6.0"))
+# True = una sola llamada multi-etiqueta para todas las intenciones; si falla,
+# se usan los detectores si/no individuales en paralelo.
+INTENCIONES_CLASIFICADOR_UNICO = os.getenv("INTENCIONES_CLASIFICADOR_UNICO", "true").lower() == "true"
+# True = con varias intenciones, una sola llamada responde todas a partir de las
+# instrucciones de cada helper; False = un helper por intencion y luego la fusion.
+INTENCIONES_GENERACION_UNICA = os.getenv("INTENCIONES_GENERACION_UNICA", "true").lower() == "true"
+
+# === INTENCIONES: CACHE DE DETECCION ===
+# Resultados del clasificador por texto normalizado + version del prompt.
+CACHE_INTENCIONES_TTL_SEG = 7 * 24 * 3600
+CACHE_INTENCIONES_MAX_ENTRADAS = 5000
+# True = segundo nivel en Firestore compartido por todas las instancias.
+CACHE_INTENCIONES_COMPARTIDO = True
+
+# === INTENCIONES: CACHE SEMANTICO DE RESPUESTAS ===
+# Similitud coseno minima (pregunta + contexto) para reutilizar una respuesta.
+CACHE_SEMANTICO_UMBRAL = 0.85
+# Variantes guardadas por intencion; el TTL lo declara cada INTENCION.
+CACHE_SEMANTICO_MAX_POR_INTENCION = 50
+
+# === INTENCIONES: POOL DE RESPUESTAS PRE-GENERADAS ===
+# True = las intenciones de contenido fijo responden desde su pool (sin GPT).
+POOL_RESPUESTAS = os.getenv("POOL_RESPUESTAS", "true").lower() == "true"
+POOL_RESPUESTAS_K = 8                           # Variantes de tono por intencion
+POOL_RESPUESTAS_REFRESCO_SEG = 10 * 60          # Relectura del pool desde Firestore
+# Regeneracion en el servicio si el pool falta o quedo desactualizado: como
+# maximo un intento por intencion cada POOL_RESPUESTAS_REINTENTO_SEG; tras cada
+# intento fallido la espera se duplica hasta POOL_RESPUESTAS_REINTENTO_MAX_SEG.
+POOL_RESPUESTAS_REINTENTO_SEG = 10 * 60
+POOL_RESPUESTAS_REINTENTO_MAX_SEG = 2 * 3600
+# True = una llamada corta agrega una frase puente con el historial reciente.
+POOL_RESPUESTAS_PUENTE = False
+
+# === INTENCIONES: PREFILTRO LOCAL ===
+# True = reglas + modelo TF-IDF local resuelven los casos obvios sin llamar a GPT.
+PREFILTRO_LOCAL = os.getenv("PREFILTRO_LOCAL", "true").lower() == "true"
+# Umbrales por defecto; cada INTENCION puede declarar los suyos.
+PREFILTRO_UMBRAL_POSITIVO = 0.90                # p >= umbral -> positivo sin GPT
+PREFILTRO_UMBRAL_NEGATIVO = 0.05                # p <= umbral -> negativo sin GPT
+# Modelo generado por train_intent_prefilter.py (opcional).
+RUTA_MODELO_PREFILTRO = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "modelos", "prefiltro_intenciones.joblib"
+)
+
+# === WEBHOOK: PROCESAMIENTO EN SEGUNDO PLANO ===
+# True = el webhook valida, encola y responde 200 de inmediato.
+# False = procesa el turno dentro del request (util para depurar localmente).
+WEBHOOK_ASINCRONO = os.getenv("WEBHOOK_ASINCRONO", "true").lower() == "true"
+# "threads" o "processes" (los procesos se crean con spawn: requieren tareas
+# serializables y cada uno abre sus propias conexiones a Firestore y OpenAI).
+WEBHOOK_MODO_POOL = os.getenv("WEBHOOK_MODO_POOL", "threads")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+# Maximo de tareas pendientes (en cola + en ejecucion) antes de aplicar backpressure.
+WEBHOOK_MAX_PENDIENTES = int(os.getenv("WEBHOOK_MAX_PENDIENTES", "64"))
+# Segundos que el request espera por un lugar libre antes de responder 503.
+WEBHOOK_ESPERA_COLA_SEG = float(os.getenv("WEBHOOK_ESPERA_COLA_SEG", "0.5"))
+# Ventana de agrupacion: mensajes seguidos del mismo usuario dentro de esta
+# ventana se unen en un solo turno (0 = desactivado). Cada turno de un solo
+# mensaje espera la ventana completa, por eso es corta: alcanza para los
+# mensajes que WhatsApp entrega juntos o casi juntos.
+WEBHOOK_VENTANA_AGRUPACION_SEG = float(os.getenv("WEBHOOK_VENTANA_AGRUPACION_SEG", "0.8"))
+# Espera maxima desde el primer mensaje agrupado, aunque sigan llegando mensajes.
+WEBHOOK_ESPERA_MAXIMA_AGRUPACION_SEG = float(os.getenv("WEBHOOK_ESPERA_MAXIMA_AGRUPACION_SEG", "6.0"))
+
 
 def _mask(value: Optional[str]) -> str:
     """Return a masked version of a sensitive string for human-friendly debugging."""
@@ -180,3 +180,79 @@ def obtener_nombre(numero: str) -> Optional[str]:
 
     nombre = datos.get("nombre", "")
     return nombre if nombre.lower() != "usuario" else None
+
+
+# === RESUMEN DE CONVERSACION ===
+def leer_mensajes_desde(numero: str, desde: str, limite: int) -> List[Dict[str, Any]]:
+    """Lee los mensajes posteriores a un timestamp desde disco.
+
+    Args:
+        numero: Identificador del usuario.
+        desde: Timestamp ISO exclusivo ("" para leer desde el inicio).
+        limite: Maximo de mensajes; si hay mas se devuelven los mas recientes.
+
+    Returns:
+        Mensajes en orden cronologico.
+
+    Efectos secundarios:
+        Lee el archivo JSON del usuario si existe.
+    """
+    ruta = ruta_archivo(numero)
+    if not os.path.exists(ruta):
+        return []
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        datos = json.load(f)
+
+    nuevos = [m for m in datos.get("historial", []) if m.get("timestamp", "") > desde]
+    return nuevos[-limite:]
+
+
+def leer_resumen(numero: str) -> Optional[Dict[str, str]]:
+    """Lee el resumen incremental de la conversacion desde disco.
+
+    Args:
+        numero: Identificador del usuario.
+
+    Returns:
+        Diccionario con "texto" y "hasta", o None si todavia no hay resumen.
+
+    Efectos secundarios:
+        Lee el archivo JSON del usuario si existe.
+    """
+    ruta = ruta_archivo(numero)
+    if not os.path.exists(ruta):
+        return None
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        datos = json.load(f)
+
+    if not datos.get("resumen"):
+        return None
+    return {"texto": datos["resumen"], "hasta": datos.get("resumen_hasta", "")}
+
+
+def guardar_resumen(numero: str, texto: str, hasta: str) -> None:
+    """Guarda el resumen incremental de la conversacion en el archivo JSON.
+
+    Args:
+        numero: Identificador del usuario.
+        texto: Resumen actualizado.
+        hasta: Timestamp del ultimo mensaje incluido en el resumen.
+
+    Returns:
+        None
+
+    Efectos secundarios:
+        Lee y escribe el archivo JSON del usuario.
+    """
+    inicializar_conversacion(numero)
+    ruta = ruta_archivo(numero)
+    with open(ruta, "r", encoding="utf-8") as f:
+        datos = json.load(f)
+
+    datos["resumen"] = texto
+    datos["resumen_hasta"] = hasta
+
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=2)
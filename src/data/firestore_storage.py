@@ -2,15 +2,35 @@
 Storage de conversaciones en Firestore.
 
 Inicializa Firebase Admin una sola vez y expone operaciones para guardar y leer
-historiales. Incluye control de duplicados por message_id.
+historiales (una ventana reciente pequena para el camino caliente y un archivo
+con un documento por mensaje). Incluye control de duplicados por message_id
+(individual y en bloque por payload) y un cache compartido entre instancias.
 """
 
+import atexit
 import os
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from src.config import (
+    DEDUPLICACION_CACHE_MAX_ENTRADAS,
+    DEDUPLICACION_TTL_SEG,
+    ESCRITURA_DIFERIDA,
+    ESCRITURA_DIFERIDA_INTERVALO_SEG,
+    ESCRITURA_DIFERIDA_MAX_PENDIENTES,
+    HISTORIAL_CACHE,
+    HISTORIAL_CACHE_MAX_ENTRADAS,
+    HISTORIAL_CACHE_TTL_SEG,
+)
+from src.services.cache import CacheTTL
 
 # === CREDENCIALES E INICIALIZACION FIREBASE ===
 RUTA_CREDENCIALES = os.path.join(os.path.dirname(__file__), "../../CredentialsGoogleFirestore.json")
@@ -27,14 +47,150 @@ db = firestore.client()
 
 # === CONFIGURACION Y COLECCIONES ===
 COLECCION_CONVERSACIONES = "conversations"
+SUBCOLECCION_MENSAJES = "mensajes"
+COLECCION_VENTANA_RECIENTE = "ventana_reciente"
 MAX_MENSAJES_USUARIO = 6
 MAX_MENSAJES_BOT = 6
+# Mensajes por rol en la ventana reciente (cubre los cupos por defecto).
+VENTANA_MAX_POR_ROL = max(MAX_MENSAJES_USUARIO, MAX_MENSAJES_BOT)
+# Limite de Firestore por commit en lote.
+MAX_ESCRITURAS_POR_LOTE = 500
 
 
 # === API DE CONVERSACIONES ===
+# Esquema en dos niveles:
+# - Caliente: ventana_reciente/{numero} guarda solo los ultimos
+#   VENTANA_MAX_POR_ROL mensajes de cada rol (buffer circular actualizado en
+#   la misma transaccion que cada mensaje). leer_historial lee solo ese
+#   documento, sin importar el largo de la conversacion.
+# - Frio: conversations/{numero}/mensajes es el archivo completo, solo de
+#   agregado, con un documento por mensaje y un ID que ordena
+#   cronologicamente. El padre guarda nombre, resumen y ultima_actualizacion.
+#
+# Las conversaciones anteriores a este esquema tienen sus mensajes en el array
+# "historial" del padre; al detectarlo, se copian al archivo en segundo plano
+# y se borra el array.
+#
+# Las consultas por role sobre el archivo requieren el indice compuesto
+# (role ASC, timestamp DESC) sobre el grupo de colecciones "mensajes".
+def _id_mensaje(timestamp: str, sufijo: Optional[str] = None) -> str:
+    """ID ordenable del documento de un mensaje: timestamp compacto + sufijo."""
+    compacto = timestamp.replace("-", "").replace(":", "").replace(".", "")
+    return f"{compacto}-{sufijo or uuid.uuid4().hex[:8]}"
+
+
+def _mensajes_ref(numero: str):
+    return db.collection(COLECCION_CONVERSACIONES).document(numero).collection(SUBCOLECCION_MENSAJES)
+
+
+def _historial_legado(numero: str) -> List[Dict[str, Any]]:
+    """Mensajes del array "historial" del documento padre (esquema anterior)."""
+    doc = db.collection(COLECCION_CONVERSACIONES).document(numero).get()
+    if not doc.exists:
+        return []
+    legado = [m for m in doc.to_dict().get("historial", []) if isinstance(m, dict)]
+    if legado:
+        _compactar_en_segundo_plano(numero)
+    return legado
+
+
+def _ultimos_por_rol(numero: str, role: str, maximo: int) -> List[Dict[str, Any]]:
+    """Ultimos mensajes de un rol en el archivo (del mas nuevo al mas viejo).
+
+    Si el archivo no llena el cupo se completa con el array del esquema
+    anterior, mientras no se haya compactado.
+    """
+    consulta = (
+        _mensajes_ref(numero)
+        .where(filter=FieldFilter("role", "==", role))
+        .order_by("timestamp", direction=firestore.Query.DESCENDING)
+        .limit(maximo)
+    )
+    ultimos = [snap.to_dict() for snap in consulta.stream()]
+    if len(ultimos) < maximo:
+        mas_viejo = ultimos[-1]["timestamp"] if ultimos else None
+        anteriores = [
+            m for m in reversed(_historial_legado(numero))
+            if m.get("role") == role and (mas_viejo is None or m.get("timestamp", "") < mas_viejo)
+        ]
+        ultimos.extend(anteriores[:maximo - len(ultimos)])
+    return ultimos
+
+
+def _leer_ventana(numero: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Lee el documento de la ventana reciente (None si todavia no existe)."""
+    snap = db.collection(COLECCION_VENTANA_RECIENTE).document(numero).get()
+    if not snap.exists:
+        return None
+    datos = snap.to_dict()
+    return {"user": datos.get("user") or [], "assistant": datos.get("assistant") or []}
+
+
+def _ventana_desde_archivo(numero: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Arma la ventana reciente desde el archivo (cuando todavia no existe)."""
+    return {
+        role: list(reversed(_ultimos_por_rol(numero, role, VENTANA_MAX_POR_ROL)))
+        for role in ("user", "assistant")
+    }
+
+
+@firestore.transactional
+def _agregar_en_transaccion(
+    transaccion: Any,
+    numero: str,
+    mensajes: List[Dict[str, Any]],
+    semilla: Optional[Dict[str, List[Dict[str, Any]]]],
+) -> bool:
+    """Agrega los mensajes al archivo y a la ventana reciente de forma atomica.
+
+    Returns:
+        False (sin escribir) si la ventana no existe y no se paso semilla.
+    """
+    ventana_ref = db.collection(COLECCION_VENTANA_RECIENTE).document(numero)
+    snap = ventana_ref.get(transaction=transaccion)
+    if snap.exists:
+        ventana = snap.to_dict()
+    elif semilla is not None:
+        ventana = semilla
+    else:
+        return False
+
+    for mensaje in mensajes:
+        role = mensaje["role"]
+        ventana[role] = (list(ventana.get(role) or []) + [mensaje])[-VENTANA_MAX_POR_ROL:]
+        transaccion.set(_mensajes_ref(numero).document(_id_mensaje(mensaje["timestamp"])), mensaje)
+    transaccion.set(ventana_ref, {
+        "user": ventana.get("user") or [],
+        "assistant": ventana.get("assistant") or [],
+        "ultima_actualizacion": mensajes[-1]["timestamp"]
+    })
+    transaccion.set(db.collection(COLECCION_CONVERSACIONES).document(numero), {
+        "ultima_actualizacion": mensajes[-1]["timestamp"]
+    }, merge=True)
+    return True
+
+
+def _escribir_mensajes(numero: str, mensajes: List[Dict[str, Any]]) -> None:
+    """Escribe en una transaccion los mensajes de un usuario (archivo + ventana).
+
+    La primera vez que un usuario escribe con este esquema, la ventana se
+    arma desde el archivo.
+    """
+    if not _agregar_en_transaccion(db.transaction(), numero, mensajes, None):
+        semilla = _ventana_desde_archivo(numero)
+        _agregar_en_transaccion(db.transaction(), numero, mensajes, semilla)
+
+
 def guardar_mensaje(numero: str, role: str, mensaje: str) -> None:
     """Guarda un mensaje en el historial del usuario.
 
+    Con ESCRITURA_DIFERIDA el mensaje se encola y se escribe en segundo plano
+    junto con los demas pendientes del usuario (el llamador no espera a
+    Firestore); las lecturas de este proceso lo ven de inmediato. Sin ella se
+    escribe en el momento. En ambos casos la escritura es una transaccion que
+    agrega al archivo y a la ventana reciente (buffer circular por rol) y lee
+    solo la ventana: el costo no crece con el largo de la conversacion.
+
     Args:
         numero: Identificador del usuario.
         role: Rol del mensaje ("user" o "assistant").
@@ -44,72 +200,289 @@ def guardar_mensaje(numero: str, role: str, mensaje: str) -> None:
         None
 
     Efectos secundarios:
-        Lee y escribe documentos en Firestore.
+        Encola el mensaje o lee y escribe documentos en Firestore.
     """
-    doc_ref = db.collection(COLECCION_CONVERSACIONES).document(numero)
-    doc = doc_ref.get()
     nuevo_mensaje = {
         "role": role,
         "content": mensaje,
         "timestamp": datetime.utcnow().isoformat()
     }
-
-    if doc.exists:
-        datos = doc.to_dict()
-        historial = datos.get("historial", [])
-        historial.append(nuevo_mensaje)
-        doc_ref.update({
-            "historial": historial,
-            "ultima_actualizacion": nuevo_mensaje["timestamp"]
-        })
+    if ESCRITURA_DIFERIDA:
+        _encolar(numero, nuevo_mensaje)
     else:
-        doc_ref.set({
-            "nombre": "Usuario",
-            "historial": [nuevo_mensaje],
-            "ultima_actualizacion": nuevo_mensaje["timestamp"]
-        })
+        _escribir_mensajes(numero, [nuevo_mensaje])
+    _actualizar_ventana_cacheada(numero, nuevo_mensaje)
 
 
 def leer_historial(
     numero: str,
     max_user: int = MAX_MENSAJES_USUARIO,
     max_bot: int = MAX_MENSAJES_BOT,
+    refrescar: bool = False,
 ) -> List[Dict[str, Any]]:
     """Lee el historial combinado del usuario.
 
+    Con los cupos por defecto se usa la ventana reciente: desde el cache en
+    memoria si esta vigente o, si no, leyendo un documento (y cacheandolo).
+    Si se piden mas mensajes que los de la ventana, se consulta el archivo.
+
     Args:
         numero: Identificador del usuario.
         max_user: Maximo de mensajes de usuario a incluir.
         max_bot: Maximo de mensajes del bot a incluir.
+        refrescar: Ignora el cache y relee la ventana (que queda cacheada).
+            Se usa al inicio de cada turno: el turno anterior del usuario
+            pudo correr en otra instancia o en otro proceso del pool.
 
     Returns:
         Lista de mensajes combinados y ordenados por timestamp.
 
     Efectos secundarios:
-        Lee documentos en Firestore.
+        Lee documentos en Firestore (salvo acierto del cache).
     """
-    doc_ref = db.collection(COLECCION_CONVERSACIONES).document(numero)
-    doc = doc_ref.get()
-    if not doc.exists:
-        return []
-
-    datos = doc.to_dict()
-    historial = datos.get("historial", [])
-
-    ultimos_usuario = [
-        m for m in reversed(historial)
-        if isinstance(m, dict) and m.get("role") == "user"
-    ][:max_user]
+    # Lo encolado y aun no escrito tambien es historial (read-your-writes).
+    # Se toma antes de leer Firestore: lo que un vaciado saque de la cola
+    # despues ya estaba confirmado cuando empezo la lectura.
+    pendientes = _pendientes_de(numero)
+
+    ventana = None
+    if max_user <= VENTANA_MAX_POR_ROL and max_bot <= VENTANA_MAX_POR_ROL:
+        ventana = _ventana_reciente(numero, refrescar)
+
+    if ventana is not None:
+        ultimos_usuario = ventana.get("user") or []
+        ultimos_bot = ventana.get("assistant") or []
+    else:
+        ultimos_usuario = list(reversed(_ultimos_por_rol(numero, "user", max_user))) if max_user else []
+        ultimos_bot = list(reversed(_ultimos_por_rol(numero, "assistant", max_bot))) if max_bot else []
 
-    ultimos_bot = [
-        m for m in reversed(historial)
-        if isinstance(m, dict) and m.get("role") == "assistant"
-    ][:max_bot]
+    if pendientes:
+        ultimos_usuario = _con_pendientes(ultimos_usuario, [m for m in pendientes if m["role"] == "user"])
+        ultimos_bot = _con_pendientes(ultimos_bot, [m for m in pendientes if m["role"] == "assistant"])
 
+    ultimos_usuario = ultimos_usuario[-max_user:] if max_user else []
+    ultimos_bot = ultimos_bot[-max_bot:] if max_bot else []
     combinados = sorted(ultimos_usuario + ultimos_bot, key=lambda x: x.get("timestamp", ""))
     return combinados
 
 
+# === CACHE DE HISTORIAL ===
+# numero -> {"user": [...], "assistant": [...]}, la ventana reciente ya escrita
+# o encolada. Se cachea con los pendientes ya mezclados: el vaciado los saca
+# de la cola sin tocar el cache, y la ventana cacheada debe seguir
+# incluyendolos (es la misma que queda en Firestore tras el vaciado).
+#
+# Solo se actualiza con guardar_mensaje de este proceso, y los turnos de un
+# mismo usuario pueden caer en otra instancia o en otro proceso del pool
+# (WEBHOOK_MODO_POOL="processes"). Por eso procesar_turno lee con
+# refrescar=True: cada turno hace una lectura de Firestore y las demas
+# lecturas del turno (inyeccion, helpers, agente) salen del cache.
+_cache_historial = CacheTTL(HISTORIAL_CACHE_MAX_ENTRADAS, HISTORIAL_CACHE_TTL_SEG)
+_lock_cache_historial = threading.Lock()
+# Mensajes guardados por usuario; una lectura que termina despues de un
+# guardado concurrente no cachea su resultado (podria no incluir el mensaje).
+_guardados_por_usuario: Dict[str, int] = {}
+
+
+def _ventana_reciente(numero: str, refrescar: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """Ventana reciente del usuario, desde el cache o desde Firestore."""
+    if HISTORIAL_CACHE and not refrescar:
+        ventana = _cache_historial.obtener(numero)
+        if ventana is not None:
+            return ventana
+    with _lock_cache_historial:
+        guardados = _guardados_por_usuario.get(numero, 0)
+    pendientes = _pendientes_de(numero)
+
+    ventana = _leer_ventana(numero)
+    if ventana is None:
+        # Sin ventana todavia (usuario nuevo o esquema anterior): se arma del archivo.
+        ventana = _ventana_desde_archivo(numero)
+    for role in ("user", "assistant"):
+        ventana[role] = _con_pendientes(ventana[role], [m for m in pendientes if m["role"] == role])[-VENTANA_MAX_POR_ROL:]
+
+    if HISTORIAL_CACHE:
+        with _lock_cache_historial:
+            if _guardados_por_usuario.get(numero, 0) == guardados:
+                _cache_historial.guardar(numero, ventana)
+    return ventana
+
+
+def _actualizar_ventana_cacheada(numero: str, mensaje: Dict[str, Any]) -> None:
+    """Agrega el mensaje a la ventana cacheada del usuario (si la hay)."""
+    if not HISTORIAL_CACHE:
+        return
+    with _lock_cache_historial:
+        _guardados_por_usuario[numero] = _guardados_por_usuario.get(numero, 0) + 1
+        ventana = _cache_historial.obtener(numero)
+        if ventana is None:
+            return
+        role = mensaje["role"]
+        actualizada = dict(ventana)
+        actualizada[role] = (list(ventana.get(role) or []) + [mensaje])[-VENTANA_MAX_POR_ROL:]
+        _cache_historial.guardar(numero, actualizada)
+
+
+def estadisticas_cache_historial() -> Dict[str, Any]:
+    """Aciertos y tamanio del cache de historial."""
+    return {"activo": HISTORIAL_CACHE, **_cache_historial.estadisticas()}
+
+
+# === ESCRITURA DIFERIDA (WRITE-BEHIND) ===
+_pendientes: Dict[str, List[Dict[str, Any]]] = {}
+# Mensajes tomados por un vaciado y aun no confirmados por Firestore.
+_en_escritura: Dict[str, List[Dict[str, Any]]] = {}
+_lock_pendientes = threading.Lock()
+_lock_vaciado = threading.Lock()
+_hilo_vaciado: Optional[threading.Thread] = None
+_contadores_escritura: Dict[str, int] = {"encolados": 0, "escritos": 0, "commits": 0, "errores": 0}
+
+
+def _pendientes_de(numero: str) -> List[Dict[str, Any]]:
+    """Mensajes del usuario aun no escritos en Firestore, en orden."""
+    with _lock_pendientes:
+        return list(_en_escritura.get(numero, [])) + list(_pendientes.get(numero, []))
+
+
+def _con_pendientes(guardados: List[Dict[str, Any]], pendientes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Agrega los pendientes que la lectura todavia no incluye (sin duplicar)."""
+    vistos = {(m.get("timestamp"), m.get("content")) for m in guardados}
+    return list(guardados) + [m for m in pendientes if (m["timestamp"], m["content"]) not in vistos]
+
+
+def _bucle_vaciado() -> None:
+    while True:
+        time.sleep(ESCRITURA_DIFERIDA_INTERVALO_SEG)
+        try:
+            vaciar_pendientes()
+        except Exception as e:
+            print(f"[FIRESTORE] Error en el vaciado de escrituras diferidas: {e}")
+
+
+def _encolar(numero: str, mensaje: Dict[str, Any]) -> None:
+    """Encola un mensaje y arranca el hilo de vaciado la primera vez."""
+    global _hilo_vaciado
+    with _lock_pendientes:
+        _pendientes.setdefault(numero, []).append(mensaje)
+        _contadores_escritura["encolados"] += 1
+        total = sum(len(mensajes) for mensajes in _pendientes.values())
+        if _hilo_vaciado is None:
+            _hilo_vaciado = threading.Thread(target=_bucle_vaciado, name="firestore-vaciado", daemon=True)
+            _hilo_vaciado.start()
+            atexit.register(vaciar_pendientes)
+    if total >= ESCRITURA_DIFERIDA_MAX_PENDIENTES:
+        vaciar_pendientes()
+
+
+def vaciar_pendientes() -> int:
+    """Escribe todos los mensajes pendientes: un commit por usuario.
+
+    Si la escritura de un usuario falla, sus mensajes vuelven a la cola (antes
+    de los que llegaron mientras tanto) y se reintentan en el proximo vaciado.
+
+    Returns:
+        Cantidad de mensajes escritos.
+
+    Efectos secundarios:
+        Lee y escribe documentos en Firestore.
+    """
+    with _lock_vaciado:
+        with _lock_pendientes:
+            lote = dict(_pendientes)
+            _pendientes.clear()
+            _en_escritura.update(lote)
+
+        escritos = 0
+        for numero, mensajes in lote.items():
+            error = None
+            try:
+                _escribir_mensajes(numero, mensajes)
+            except Exception as e:
+                error = e
+            with _lock_pendientes:
+                _en_escritura.pop(numero, None)
+                if error is None:
+                    escritos += len(mensajes)
+                    _contadores_escritura["escritos"] += len(mensajes)
+                    _contadores_escritura["commits"] += 1
+                else:
+                    _pendientes[numero] = mensajes + _pendientes.get(numero, [])
+                    _contadores_escritura["errores"] += 1
+            if error is not None:
+                print(f"[FIRESTORE] Error al escribir {len(mensajes)} mensajes de {numero}, se reintenta: {error}")
+        return escritos
+
+
+def estadisticas_escritura() -> Dict[str, Any]:
+    """Mensajes pendientes y contadores de la escritura diferida."""
+    with _lock_pendientes:
+        return {
+            "activa": ESCRITURA_DIFERIDA,
+            "pendientes": sum(len(m) for m in _pendientes.values()) + sum(len(m) for m in _en_escritura.values()),
+            **_contadores_escritura,
+        }
+
+
+# === COMPACTACION DEL ESQUEMA ANTERIOR (SEGUNDO PLANO) ===
+_compactando: Set[str] = set()
+_lock_compactacion = threading.Lock()
+
+
+def compactar_historial_legado(numero: str) -> int:
+    """Copia el array "historial" del padre al archivo y borra el array.
+
+    Los IDs de los mensajes copiados son deterministas, asi que repetirla
+    (por ejemplo, desde otra instancia) no duplica mensajes.
+
+    Args:
+        numero: Identificador del usuario.
+
+    Returns:
+        Cantidad de mensajes copiados.
+
+    Efectos secundarios:
+        Lee y escribe documentos en Firestore (commits por lotes).
+    """
+    padre_ref = db.collection(COLECCION_CONVERSACIONES).document(numero)
+    doc = padre_ref.get()
+    if not doc.exists:
+        return 0
+    legado = [m for m in doc.to_dict().get("historial", []) if isinstance(m, dict) and m.get("timestamp")]
+
+    for inicio in range(0, len(legado), MAX_ESCRITURAS_POR_LOTE):
+        batch = db.batch()
+        for i, mensaje in enumerate(legado[inicio:inicio + MAX_ESCRITURAS_POR_LOTE], start=inicio):
+            ref = _mensajes_ref(numero).document(_id_mensaje(mensaje["timestamp"], f"legado{i:05d}"))
+            batch.set(ref, {
+                "role": mensaje.get("role"),
+                "content": mensaje.get("content"),
+                "timestamp": mensaje["timestamp"]
+            })
+        batch.commit()
+    padre_ref.update({"historial": firestore.DELETE_FIELD})
+    return len(legado)
+
+
+def _compactar_en_segundo_plano(numero: str) -> None:
+    """Dispara una sola compactacion por usuario en este proceso."""
+    with _lock_compactacion:
+        if numero in _compactando:
+            return
+        _compactando.add(numero)
+
+    def _ejecutar() -> None:
+        try:
+            copiados = compactar_historial_legado(numero)
+            print(f"[FIRESTORE] Historial legado de {numero} compactado: {copiados} mensajes archivados")
+        except Exception as e:
+            print(f"[FIRESTORE] Error al compactar historial legado de {numero}: {e}")
+        finally:
+            with _lock_compactacion:
+                _compactando.discard(numero)
+
+    threading.Thread(target=_ejecutar, daemon=True).start()
+
+
 def actualizar_nombre(numero: str, nombre: str) -> None:
     """Actualiza el nombre del usuario en Firestore.
 
@@ -133,7 +506,6 @@ def actualizar_nombre(numero: str, nombre: str) -> None:
     else:
         doc_ref.set({
             "nombre": nombre,
-            "historial": [],
             "ultima_actualizacion": datetime.utcnow().isoformat()
         })
 
@@ -155,13 +527,113 @@ def obtener_nombre(numero: str) -> Optional[str]:
     if not doc.exists:
         return None
     datos = doc.to_dict()
-    nombre = datos.get("nombre", "")
+    nombre = datos.get("nombre") or "Usuario"
     return nombre if nombre.lower() != "usuario" else None
 
 
+# === RESUMEN DE CONVERSACION ===
+def leer_mensajes_desde(numero: str, desde: str, limite: int) -> List[Dict[str, Any]]:
+    """Lee los mensajes posteriores a un timestamp.
+
+    Args:
+        numero: Identificador del usuario.
+        desde: Timestamp ISO exclusivo ("" para leer desde el inicio).
+        limite: Maximo de mensajes; si hay mas se devuelven los mas recientes.
+
+    Returns:
+        Mensajes en orden cronologico.
+
+    Efectos secundarios:
+        Lee documentos en Firestore (y el array del esquema anterior solo si
+        la consulta no llena el limite).
+    """
+    # Antes de la consulta, como en leer_historial (un vaciado concurrente).
+    pendientes = [m for m in _pendientes_de(numero) if m["timestamp"] > desde]
+    consulta = (
+        _mensajes_ref(numero)
+        .where(filter=FieldFilter("timestamp", ">", desde))
+        .order_by("timestamp", direction=firestore.Query.DESCENDING)
+        .limit(limite)
+    )
+    nuevos = [snap.to_dict() for snap in consulta.stream()]
+    if len(nuevos) < limite:
+        mas_viejo = nuevos[-1]["timestamp"] if nuevos else None
+        legado = [
+            m for m in _historial_legado(numero)
+            if m.get("timestamp", "") > desde and (mas_viejo is None or m.get("timestamp", "") < mas_viejo)
+        ]
+        nuevos.extend(reversed(legado[-(limite - len(nuevos)):]))
+    nuevos.reverse()
+    return _con_pendientes(nuevos, pendientes)[-limite:]
+
+
+def leer_resumen(numero: str) -> Optional[Dict[str, str]]:
+    """Lee el resumen incremental de la conversacion.
+
+    Args:
+        numero: Identificador del usuario.
+
+    Returns:
+        Diccionario con "texto" y "hasta" (timestamp del ultimo mensaje
+        resumido), o None si todavia no hay resumen.
+
+    Efectos secundarios:
+        Lee documentos en Firestore.
+    """
+    doc = db.collection(COLECCION_CONVERSACIONES).document(numero).get()
+    if not doc.exists:
+        return None
+    datos = doc.to_dict()
+    if not datos.get("resumen"):
+        return None
+    return {"texto": datos["resumen"], "hasta": datos.get("resumen_hasta", "")}
+
+
+def guardar_resumen(numero: str, texto: str, hasta: str) -> None:
+    """Guarda el resumen incremental de la conversacion.
+
+    Args:
+        numero: Identificador del usuario.
+        texto: Resumen actualizado.
+        hasta: Timestamp del ultimo mensaje incluido en el resumen.
+
+    Returns:
+        None
+
+    Efectos secundarios:
+        Escribe documentos en Firestore (merge, sin tocar el historial).
+    """
+    db.collection(COLECCION_CONVERSACIONES).document(numero).set({
+        "resumen": texto,
+        "resumen_hasta": hasta,
+    }, merge=True)
+
+
 # === CONTROL DE MENSAJES DUPLICADOS ===
+# Cada ID se registra con create(), que falla con AlreadyExists si el
+# documento existe: registrar y comprobar es una sola operacion atomica, aun
+# con reentregas simultaneas en varias instancias. La coleccion necesita una
+# politica TTL sobre "expira_en" para no crecer sin limite.
 COLECCION_MENSAJES_PROCESADOS = "mensajes_procesados"
 
+# IDs ya registrados o rechazados por esta instancia (sin ir a Firestore).
+_ids_vistos = CacheTTL(DEDUPLICACION_CACHE_MAX_ENTRADAS, DEDUPLICACION_TTL_SEG)
+_lock_deduplicacion = threading.Lock()
+_contadores_deduplicacion: Dict[str, int] = {"registrados": 0, "duplicados_memoria": 0, "duplicados_firestore": 0}
+
+
+def _contar_deduplicacion(clave: str, cantidad: int = 1) -> None:
+    with _lock_deduplicacion:
+        _contadores_deduplicacion[clave] += cantidad
+
+
+def _datos_id_procesado(numero: str) -> Dict[str, Any]:
+    return {
+        "numero": numero,
+        "timestamp": datetime.utcnow().isoformat(),
+        "expira_en": datetime.now(timezone.utc) + timedelta(seconds=DEDUPLICACION_TTL_SEG)
+    }
+
 
 def ya_procesado(message_id: str) -> bool:
     """Indica si un message_id ya fue procesado.
@@ -173,13 +645,15 @@ def ya_procesado(message_id: str) -> bool:
         True si ya existe; False si no existe.
 
     Efectos secundarios:
-        Lee documentos en Firestore.
+        Lee documentos en Firestore (salvo que el ID ya se haya visto aqui).
     """
+    if _ids_vistos.obtener(message_id) is not None:
+        return True
     return db.collection(COLECCION_MENSAJES_PROCESADOS).document(message_id).get().exists
 
 
 def registrar_id_procesado(message_id: str, numero: str) -> bool:
-    """Registra un message_id si no existe previamente.
+    """Registra un message_id si no existe previamente (create atomico).
 
     Args:
         message_id: Identificador del mensaje.
@@ -189,17 +663,171 @@ def registrar_id_procesado(message_id: str, numero: str) -> bool:
         False si el id ya estaba registrado; True si se registro en esta llamada.
 
     Efectos secundarios:
-        Lee y escribe documentos en Firestore.
+        Escribe un documento en Firestore (salvo que el ID ya se haya visto aqui).
     """
-    doc_ref = db.collection(COLECCION_MENSAJES_PROCESADOS).document(message_id)
-    if doc_ref.get().exists:
+    if _ids_vistos.obtener(message_id) is not None:
+        _contar_deduplicacion("duplicados_memoria")
         return False
 
-    doc_ref.set({
-        "numero": numero,
+    try:
+        db.collection(COLECCION_MENSAJES_PROCESADOS).document(message_id).create(_datos_id_procesado(numero))
+    except AlreadyExists:
+        _ids_vistos.guardar(message_id, True)
+        _contar_deduplicacion("duplicados_firestore")
+        return False
+    _ids_vistos.guardar(message_id, True)
+    _contar_deduplicacion("registrados")
+    return True
+
+
+def registrar_ids_procesados(mensajes: List[Tuple[str, str]]) -> Set[str]:
+    """Registra en bloque los message_id que aun no fueron procesados.
+
+    Los IDs ya vistos por esta instancia se descartan en memoria. El resto se
+    crea en un solo commit por lotes; si alguno ya existia el lote entero se
+    rechaza y se registran de a uno con create().
+
+    Args:
+        mensajes: Pares (message_id, numero) de un mismo payload del webhook.
+
+    Returns:
+        Conjunto de message_id registrados en esta llamada (los nuevos).
+
+    Efectos secundarios:
+        Normalmente un solo commit por lotes en Firestore; ninguno si todos
+        los IDs ya se habian visto en esta instancia.
+    """
+    pendientes: Dict[str, str] = {}
+    for message_id, numero in mensajes:
+        if message_id in pendientes:
+            continue
+        if _ids_vistos.obtener(message_id) is not None:
+            _contar_deduplicacion("duplicados_memoria")
+            continue
+        pendientes[message_id] = numero
+    if not pendientes:
+        return set()
+
+    coleccion = db.collection(COLECCION_MENSAJES_PROCESADOS)
+    try:
+        batch = db.batch()
+        for message_id, numero in pendientes.items():
+            batch.create(coleccion.document(message_id), _datos_id_procesado(numero))
+        batch.commit()
+        nuevos = set(pendientes)
+    except AlreadyExists:
+        nuevos = set()
+        for message_id, numero in pendientes.items():
+            try:
+                coleccion.document(message_id).create(_datos_id_procesado(numero))
+                nuevos.add(message_id)
+            except AlreadyExists:
+                _contar_deduplicacion("duplicados_firestore")
+
+    for message_id in pendientes:
+        _ids_vistos.guardar(message_id, True)
+    _contar_deduplicacion("registrados", len(nuevos))
+    return nuevos
+
+
+def estadisticas_deduplicacion() -> Dict[str, Any]:
+    """IDs registrados, duplicados descartados (en memoria o por Firestore) y cache."""
+    with _lock_deduplicacion:
+        contadores = dict(_contadores_deduplicacion)
+    return {**contadores, "cache": _ids_vistos.estadisticas()}
+
+
+# === CACHE COMPARTIDO ENTRE INSTANCIAS ===
+def leer_cache_compartido(coleccion: str, clave: str) -> Optional[Any]:
+    """Lee un valor cacheado por otra instancia si no expiro.
+
+    Args:
+        coleccion: Coleccion de Firestore del cache.
+        clave: ID del documento (hash de la clave logica).
+
+    Returns:
+        El valor guardado, o None si no existe o ya expiro.
+
+    Efectos secundarios:
+        Lee documentos en Firestore.
+    """
+    doc = db.collection(coleccion).document(clave).get()
+    if not doc.exists:
+        return None
+    datos = doc.to_dict()
+    expira_en = datos.get("expira_en")
+    if expira_en is not None and expira_en <= datetime.now(timezone.utc):
+        return None
+    return datos.get("valor")
+
+
+def guardar_cache_compartido(coleccion: str, clave: str, valor: Any, ttl_seg: float) -> None:
+    """Guarda un valor cacheado para todas las instancias.
+
+    El campo "expira_en" es un Timestamp para poder activar una politica TTL
+    de Firestore sobre la coleccion y que los documentos vencidos se borren solos.
+
+    Args:
+        coleccion: Coleccion de Firestore del cache.
+        clave: ID del documento (hash de la clave logica).
+        valor: Valor serializable por Firestore.
+        ttl_seg: Segundos de vida del valor.
+
+    Returns:
+        None
+
+    Efectos secundarios:
+        Escribe documentos en Firestore.
+    """
+    db.collection(coleccion).document(clave).set({
+        "valor": valor,
+        "expira_en": datetime.now(timezone.utc) + timedelta(seconds=ttl_seg),
         "timestamp": datetime.utcnow().isoformat()
     })
-    return True
 
 
+
+# === POOL DE RESPUESTAS PRE-GENERADAS ===
+COLECCION_POOL_RESPUESTAS = "pool_respuestas"
+
+
+def leer_pool_respuestas(etiqueta: str) -> Optional[Dict[str, Any]]:
+    """Lee el pool de variantes pre-generadas de una intencion.
+
+    Args:
+        etiqueta: Intencion (ID del documento).
+
+    Returns:
+        Diccionario con "version" y "variantes", o None si no existe.
+
+    Efectos secundarios:
+        Lee documentos en Firestore.
+    """
+    doc = db.collection(COLECCION_POOL_RESPUESTAS).document(etiqueta).get()
+    if not doc.exists:
+        return None
+    datos = doc.to_dict()
+    return {"version": datos.get("version"), "variantes": datos.get("variantes", [])}
+
+
+def guardar_pool_respuestas(etiqueta: str, version: str, variantes: List[str]) -> None:
+    """Reemplaza el pool de variantes de una intencion.
+
+    Args:
+        etiqueta: Intencion (ID del documento).
+        version: Huella del prompt y modelo con que se generaron las variantes.
+        variantes: Respuestas generadas.
+
+    Returns:
+        None
+
+    Efectos secundarios:
+        Escribe documentos en Firestore.
+    """
+    db.collection(COLECCION_POOL_RESPUESTAS).document(etiqueta).set({
+        "version": version,
+        "variantes": variantes,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
 # LEGACY (deprecated): versiones anteriores disponibles en el historial de Git.
@@ -1,22 +1,30 @@
 """
 WhatsApp webhook blueprint.
 
-Handles GET verification and POST message delivery. Flow: verification -> parse
-payload -> deduplication -> history -> welcome/normal response.
+Handles GET verification and POST message delivery. The request extracts every
+message in the payload, deduplicates them in bulk and enqueues them, grouping
+bursts from the same sender into one turn; the turn (history -> welcome/normal
+response) runs in the background worker pool.
 """
 
+import multiprocessing
 import traceback
+from typing import Any, Dict, List
 
 from flask import Blueprint, jsonify, request
 
 from src.chatbot import get_response
-from src.config import VERIFY_TOKEN
+from src.config import VERIFY_TOKEN, WEBHOOK_ASINCRONO
 from src.data.chatbot_sheet_connector import create_user_if_not_exists
 from src.data.firestore_storage import (
     guardar_mensaje as agregar_mensaje,
     leer_historial,
-    registrar_id_procesado  # ?Y'^ usamos directamente esto ahora
+    registrar_ids_procesados,
+    vaciar_pendientes,
 )
+from src.services import conversation_summary
+from src.services.dispatcher import estado_cola
+from src.services.message_coalescer import Mensaje, agregar_lote
 from src.services.message_service import send_message
 
 # === CONSTANTS ===
@@ -29,11 +37,108 @@ MENSAJE_BIENVENIDA = (
 webhook_bp = Blueprint("webhook", __name__)
 
 
+# === EXTRACCION Y DEDUPLICACION DEL PAYLOAD ===
+def extraer_mensajes(data: Dict[str, Any]) -> List[Mensaje]:
+    """
+    Recorre todas las entries/changes/messages del payload de WhatsApp.
+
+    Payload esperado:
+        data["entry"][...]["changes"][...]["value"]["messages"][...]
+        -> from, text.body, id
+
+    Returns:
+        Lista de (sender_id, texto, message_id) en orden de llegada; se omiten
+        mensajes sin texto (estados, multimedia, etc.).
+    """
+    mensajes: List[Mensaje] = []
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            for message in change.get("value", {}).get("messages", []):
+                sender_id = message.get("from")
+                message_text = message.get("text", {}).get("body")
+                message_id = message.get("id")
+                if sender_id and message_text and message_id:
+                    mensajes.append((sender_id, message_text, message_id))
+    return mensajes
+
+
+def deduplicar_mensajes(mensajes: List[Mensaje]) -> List[Mensaje]:
+    """Filtra en bloque los mensajes ya procesados (una sola ida a Firestore)."""
+    # 🔒 Verificación de duplicados usando el ID de cada mensaje
+    nuevos_ids = registrar_ids_procesados(
+        [(message_id, sender_id) for sender_id, _, message_id in mensajes]
+    )
+    nuevos: List[Mensaje] = []
+    for sender_id, message_text, message_id in mensajes:
+        if message_id in nuevos_ids:
+            nuevos.append((sender_id, message_text, message_id))
+            # Un mismo ID repetido dentro del payload se procesa una sola vez.
+            nuevos_ids.discard(message_id)
+        else:
+            print(f"[IGNORADO] Ya procesado (registro duplicado): {message_id}")
+    return nuevos
+
+
+# === PROCESAMIENTO DE UN TURNO (FUERA DEL REQUEST) ===
+def procesar_turno(sender_id: str, textos: List[str], message_ids: List[str]) -> None:
+    """
+    Ejecuta un turno completo para uno o varios mensajes nuevos del usuario.
+
+    Flujo: historial -> bienvenida o respuesta normal -> envio. Los mensajes
+    llegan ya deduplicados. Corre en el pool de segundo plano (o inline si
+    WEBHOOK_ASINCRONO=False), serializado por sender_id para no pisar el
+    historial del mismo usuario. Los textos agrupados se guardan y se
+    responden como un solo mensaje del usuario.
+    """
+    try:
+        _ejecutar_turno(sender_id, textos, message_ids)
+    finally:
+        # Con WEBHOOK_MODO_POOL="processes" el buffer de escritura diferida
+        # vive en este proceso hijo: /_ah/stop solo vacia el del proceso
+        # principal y atexit no corre en los workers de multiprocessing, asi
+        # que se escribe al terminar cada turno (despues de responder).
+        if multiprocessing.parent_process() is not None:
+            vaciar_pendientes()
+
+
+def _ejecutar_turno(sender_id: str, textos: List[str], message_ids: List[str]) -> None:
+    """Cuerpo de procesar_turno: historial, bienvenida o respuesta y envio."""
+    # Leer historial del usuario desde Firestore (sin cache: el turno anterior
+    # pudo correr en otra instancia; el resto del turno usa lo leido aqui)
+    historial = leer_historial(sender_id, refrescar=True)
+
+    # Guardar el turno como un solo mensaje: es el mismo texto que recibe
+    # get_response, y construir_prompt lo excluye del historial (si se
+    # guardaran por separado, una rafaga llegaria dos veces al modelo)
+    mensaje_usuario = "\n".join(textos)
+    agregar_mensaje(sender_id, "user", mensaje_usuario)
+
+    # 🟢 Primer mensaje del usuario (no hay historial previo)
+    if not historial:
+        # Registrar automáticamente el número en Google Sheets
+        create_user_if_not_exists(sender_id)
+
+        # Mensaje de bienvenida alineado con el agente
+        send_message(sender_id, MENSAJE_BIENVENIDA)
+        return
+
+    # 🔁 Flujo normal desde el segundo mensaje
+    if len(textos) > 1:
+        print(f"[AGRUPADO] {len(textos)} mensajes de {sender_id} en un solo turno: {message_ids}")
+    respuesta = get_response(mensaje_usuario, sender_id)
+    send_message(sender_id, respuesta)
+
+    # Cada RESUMEN_CADA_TURNOS turnos se actualiza el resumen en segundo plano
+    conversation_summary.registrar_turno(sender_id)
+
+
 @webhook_bp.route("/webhook", methods=["GET", "POST"])
 def webhook():
     """
     GET: valida el webhook de WhatsApp usando verify_token/challenge.
-    POST: procesa mensajes entrantes y envia respuesta al usuario.
+    POST: extrae todos los mensajes del payload, los deduplica en bloque, los
+    agrupa/encola y responde 200 de inmediato. Si el pool esta saturado
+    responde 503 (sin registrar IDs) para que Meta reintente la entrega.
     """
     if request.method == "GET":
         verify_token = request.args.get("hub.verify_token")
@@ -48,44 +153,21 @@ def webhook():
             if not data or "entry" not in data:
                 return jsonify({"error": "Datos de entrada no válidos"}), 400
 
-            for entry in data["entry"]:
-                for change in entry.get("changes", []):
-                    if "messages" in change.get("value", {}):
-                        # Payload esperado:
-                        # data["entry"][...]["changes"][...]["value"]["messages"][0]
-                        # -> from, text.body, id
-                        message = change["value"]["messages"][0]
-                        sender_id = message.get("from")
-                        message_text = message.get("text", {}).get("body")
-                        message_id = message.get("id")
-
-                        if sender_id and message_text and message_id:
-                            # 🔒 Verificación de duplicados usando el ID del mensaje
-                            if not registrar_id_procesado(message_id, sender_id):
-                                print(f"[IGNORADO] Ya procesado (registro duplicado): {message_id}")
-                                return "Ya procesado", 200
-
-                            # Leer historial del usuario desde Firestore
-                            historial = leer_historial(sender_id)
-
-                            # 🟢 Primer mensaje del usuario (no hay historial previo)
-                            if not historial:
-                                # Guardar el primer mensaje del usuario
-                                agregar_mensaje(sender_id, "user", message_text)
-
-                                # Registrar automáticamente el número en Google Sheets
-                                create_user_if_not_exists(sender_id)
-
-                                # Mensaje de bienvenida alineado con el agente
-                                mensaje_bienvenida = MENSAJE_BIENVENIDA
-
-                                send_message(sender_id, mensaje_bienvenida)
-                                return "Bienvenida enviada", 200
-
-                            # 🔁 Flujo normal desde el segundo mensaje
-                            agregar_mensaje(sender_id, "user", message_text)
-                            respuesta = get_response(message_text, sender_id)
-                            send_message(sender_id, respuesta)
+            mensajes = extraer_mensajes(data)
+            if not mensajes:
+                return "Evento recibido", 200
+
+            if not WEBHOOK_ASINCRONO:
+                # Modo inline: un turno por remitente, en orden de llegada.
+                por_remitente: Dict[str, List[Mensaje]] = {}
+                for mensaje in deduplicar_mensajes(mensajes):
+                    por_remitente.setdefault(mensaje[0], []).append(mensaje)
+                for sender_id, propios in por_remitente.items():
+                    procesar_turno(sender_id, [m[1] for m in propios], [m[2] for m in propios])
+            elif not agregar_lote(procesar_turno, mensajes, deduplicar_mensajes):
+                # Backpressure: sin registrar los IDs, Meta reintenta mas tarde.
+                print(f"[SATURADO] Pool lleno, se rechazan {len(mensajes)} mensajes: {estado_cola()}")
+                return "Servicio saturado", 503
 
             return "Evento recibido", 200
 
@@ -2,12 +2,23 @@
 Flask entrypoint for Chatbot Ads Manager.
 
 Registers the WhatsApp webhook blueprint and exposes basic health/diagnostic
-endpoints, including the App Engine stop handler.
+endpoints (including internal metrics), plus the App Engine stop handler.
 """
 
-from flask import Flask
+from flask import Flask, jsonify
 
+from src.data import firestore_storage
 from src.routes import webhook_bp
+from src.services import (
+    conversation_summary,
+    dispatcher,
+    intent_cache,
+    llm,
+    message_coalescer,
+    prompt_builder,
+    response_pool,
+    semantic_cache,
+)
 
 # === APP SETUP ===
 app = Flask(__name__)
@@ -18,10 +29,35 @@ def home():
     """Endpoint de salud simple para confirmar disponibilidad del servicio."""
     return "Chatbot Ads Manager está en línea y listo para recibir mensajes por WhatsApp."
 
+
+@app.route("/metricas")
+def metricas():
+    """Metricas internas del servicio (profundidad de cola del webhook, etc.)."""
+    return jsonify({
+        "cola_webhook": dispatcher.estado_cola(),
+        "escritura_diferida": firestore_storage.estadisticas_escritura(),
+        "cache_historial": firestore_storage.estadisticas_cache_historial(),
+        "deduplicacion": firestore_storage.estadisticas_deduplicacion(),
+        "agrupacion": message_coalescer.estado(),
+        "cache_intenciones": intent_cache.estadisticas(),
+        "cache_semantico": semantic_cache.estadisticas(),
+        "resumen_conversacion": conversation_summary.estadisticas(),
+        "pool_respuestas": response_pool.estadisticas(),
+        "llm": llm.estadisticas(),
+        "prefijos_prompt": prompt_builder.prefijos(),
+    })
+
 # === APP ENGINE SPECIAL ROUTES ===
 @app.route("/_ah/stop")
 def stop_handler():
-    """Evita errores 404/500 cuando App Engine emite la senal de stop."""
+    """Evita errores 404/500 cuando App Engine emite la senal de stop.
+
+    Antes de responder despacha los grupos abiertos, drena el pool de segundo
+    plano y escribe los mensajes pendientes para no perder turnos.
+    """
+    message_coalescer.vaciar()
+    dispatcher.apagar(esperar=True)
+    firestore_storage.vaciar_pendientes()
     return "OK", 200
 
 # === WEBHOOK ROUTES ===
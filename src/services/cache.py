@@ -0,0 +1,72 @@
+"""
+Cache en memoria LRU con expiracion (TTL) y contadores de aciertos.
+
+Es thread-safe y no hace I/O; los caches compartidos entre instancias se
+arman encima de esta clase usando Firestore como segundo nivel.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class CacheTTL:
+    """Cache LRU acotado por cantidad de entradas y por tiempo de vida.
+
+    Args:
+        max_entradas: Maximo de entradas; al superarlo se descarta la menos usada.
+        ttl_seg: Segundos de vida por defecto de cada entrada.
+    """
+
+    def __init__(self, max_entradas: int, ttl_seg: float) -> None:
+        self.max_entradas = max_entradas
+        self.ttl_seg = ttl_seg
+        self._datos: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor vigente de la clave o default (cuenta acierto/fallo)."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] <= ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.fallos += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave: Hashable, valor: Any, ttl_seg: Optional[float] = None) -> None:
+        """Guarda el valor con el TTL indicado (o el por defecto)."""
+        expira = time.monotonic() + (self.ttl_seg if ttl_seg is None else ttl_seg)
+        with self._lock:
+            self._datos[clave] = (expira, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar(self, clave: Hashable) -> None:
+        """Quita la clave si existe."""
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._datos)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Aciertos, fallos, tasa de aciertos y tamanio actual."""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 3) if total else 0.0,
+            }
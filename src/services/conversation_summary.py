@@ -0,0 +1,204 @@
+"""
+Resumen incremental de la conversacion por usuario.
+
+Los lectores de historial solo ven los ultimos mensajes, asi que el modelo
+olvida datos dados antes (rubro, ciudad, nombre del negocio) y el agente los
+vuelve a preguntar. Este modulo mantiene un resumen compacto por usuario:
+
+- Cada RESUMEN_CADA_TURNOS turnos se actualiza en segundo plano con una
+  llamada al modelo general: resumen anterior + mensajes nuevos -> resumen
+  nuevo. Se guarda en el documento de la conversacion junto con el timestamp
+  del ultimo mensaje resumido.
+- Al armar un prompt, preparar_contexto() quita del historial los mensajes ya
+  resumidos (dejando siempre los RESUMEN_MENSAJES_RECIENTES ultimos) y
+  devuelve el resumen como contexto para construir_prompt.
+
+Los resumenes se cachean en memoria (RESUMEN_CACHE_TTL_SEG) para no leer
+Firestore en cada llamada.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import (
+    GPT_MODEL_GENERAL,
+    RESUMEN_CACHE_MAX_ENTRADAS,
+    RESUMEN_CACHE_TTL_SEG,
+    RESUMEN_CADA_TURNOS,
+    RESUMEN_CONVERSACION,
+    RESUMEN_MAX_MENSAJES_NUEVOS,
+    RESUMEN_MAX_PALABRAS,
+    RESUMEN_MENSAJES_RECIENTES,
+    USAR_FIRESTORE,
+)
+from src.services import llm
+from src.services.cache import CacheTTL
+from src.services.prompt_builder import prefijo_estatico
+
+# Import condicional para seleccionar el backend de almacenamiento.
+if USAR_FIRESTORE:
+    from src.data.firestore_storage import guardar_resumen, leer_mensajes_desde, leer_resumen
+else:
+    from src.data.conversation_storage import guardar_resumen, leer_mensajes_desde, leer_resumen
+
+# === PROMPT DEL SISTEMA ===
+PROMPT_RESUMEN = prefijo_estatico("resumen_conversacion", GPT_MODEL_GENERAL, (
+    "Mantienes la memoria de una conversación de WhatsApp entre un usuario y Chatbot Ads Manager, "
+    "un asistente que ayuda a crear campañas de Google Ads.\n\n"
+    "Recibirás el resumen actual (puede estar vacío) y los mensajes nuevos. "
+    "Devuelve el resumen actualizado.\n\n"
+    "INSTRUCCIONES:\n"
+    "- Conserva todos los datos concretos del usuario y su negocio: nombre, rubro, productos, ciudad, "
+    "público, presupuesto, preferencias y datos de campaña ya entregados.\n"
+    "- Anota qué temas ya se explicaron y qué preguntas quedaron pendientes.\n"
+    "- Si un dato nuevo contradice uno anterior, quédate con el nuevo.\n"
+    "- No inventes nada que no esté en el resumen o en los mensajes.\n"
+    f"- Máximo {RESUMEN_MAX_PALABRAS} palabras, en frases cortas, en tercera persona.\n"
+    "- Responde solo con el resumen, sin títulos ni comentarios."
+))
+
+# Marca de "sin resumen" en el cache (CacheTTL devuelve None si no hay entrada).
+_SIN_RESUMEN: Dict[str, str] = {}
+
+# === ESTADO ===
+_cache = CacheTTL(RESUMEN_CACHE_MAX_ENTRADAS, RESUMEN_CACHE_TTL_SEG)
+_lock = threading.Lock()
+_turnos: Dict[str, int] = {}
+_actualizando: set = set()
+_contadores: Dict[str, int] = {"actualizaciones": 0, "errores": 0, "mensajes_omitidos": 0}
+
+
+# === LECTURA ===
+def obtener_resumen(numero: str) -> Optional[Dict[str, str]]:
+    """Resumen vigente del usuario ({"texto", "hasta"}) o None si no hay."""
+    resumen = _cache.obtener(numero)
+    if resumen is None:
+        try:
+            resumen = leer_resumen(numero) or _SIN_RESUMEN
+        except Exception as e:
+            print(f"[RESUMEN] Error al leer resumen de {numero}: {e}")
+            return None
+        _cache.guardar(numero, resumen)
+    return resumen or None
+
+
+def preparar_contexto(numero: str, historial: List[Any]) -> Tuple[List[Any], Optional[str]]:
+    """
+    Reemplaza el historial ya resumido por el resumen.
+
+    Args:
+        numero: Identificador del usuario.
+        historial: Historial cronologico que se iba a pasar al prompt.
+
+    Returns:
+        (historial, contexto): los mensajes posteriores al resumen mas los
+        RESUMEN_MENSAJES_RECIENTES ultimos, y el texto para el parametro
+        contexto de construir_prompt (None si no hay resumen).
+    """
+    if not RESUMEN_CONVERSACION:
+        return historial, None
+    resumen = obtener_resumen(numero)
+    if resumen is None:
+        return historial, None
+
+    corte = max(len(historial) - RESUMEN_MENSAJES_RECIENTES, 0)
+    # Los mensajes sin timestamp (p. ej. el actual, agregado en memoria) son nuevos.
+    anteriores = [
+        m for m in historial[:corte]
+        if not isinstance(m, dict) or m.get("timestamp") is None or m["timestamp"] > resumen["hasta"]
+    ]
+    omitidos = corte - len(anteriores)
+    if omitidos:
+        with _lock:
+            _contadores["mensajes_omitidos"] += omitidos
+    contexto = f"Resumen de la conversación anterior con este usuario:\n{resumen['texto']}"
+    return anteriores + historial[corte:], contexto
+
+
+# === ACTUALIZACION EN SEGUNDO PLANO ===
+def _transcripcion(mensajes: List[Dict[str, Any]]) -> str:
+    return "\n".join(
+        f"{'Usuario' if m.get('role') == 'user' else 'Asistente'}: {m.get('content', '')}"
+        for m in mensajes
+    )
+
+
+def actualizar_resumen(numero: str) -> Optional[Dict[str, str]]:
+    """
+    Incorpora al resumen los mensajes posteriores al ultimo resumido.
+
+    Returns:
+        El resumen nuevo, o None si no habia mensajes nuevos o fallo GPT (en
+        ese caso se conserva el anterior y se reintenta en la proxima ronda).
+    """
+    actual = leer_resumen(numero)
+    desde = actual["hasta"] if actual else ""
+    nuevos = [m for m in leer_mensajes_desde(numero, desde, RESUMEN_MAX_MENSAJES_NUEVOS) if m.get("content")]
+    if not nuevos:
+        return None
+
+    mensajes = [
+        {"role": "system", "content": PROMPT_RESUMEN},
+        {"role": "system", "content": f"Resumen actual:\n{actual['texto'] if actual else '(vacío)'}"},
+        {"role": "user", "content": f"Mensajes nuevos:\n{_transcripcion(nuevos)}"},
+    ]
+    try:
+        texto = llm.completar(
+            tipo="resumen",
+            messages=mensajes,
+            temperature=0,
+            max_tokens=2 * RESUMEN_MAX_PALABRAS + 50
+        ).choices[0].message.content.strip()
+    except Exception as e:
+        with _lock:
+            _contadores["errores"] += 1
+        print(f"[ERROR GPT - resumen de conversación] {e}")
+        return None
+    if not texto:
+        return None
+
+    resumen = {"texto": texto, "hasta": nuevos[-1]["timestamp"]}
+    guardar_resumen(numero, resumen["texto"], resumen["hasta"])
+    _cache.guardar(numero, resumen)
+    with _lock:
+        _contadores["actualizaciones"] += 1
+    print(f"[RESUMEN] Resumen de {numero} actualizado con {len(nuevos)} mensajes nuevos")
+    return resumen
+
+
+def registrar_turno(numero: str) -> None:
+    """
+    Cuenta un turno del usuario y, cada RESUMEN_CADA_TURNOS, actualiza su
+    resumen en segundo plano (una sola actualizacion a la vez por usuario).
+    """
+    if not RESUMEN_CONVERSACION:
+        return
+    with _lock:
+        _turnos[numero] = _turnos.get(numero, 0) + 1
+        if _turnos[numero] < RESUMEN_CADA_TURNOS or numero in _actualizando:
+            return
+        _turnos[numero] = 0
+        _actualizando.add(numero)
+
+    def _ejecutar() -> None:
+        try:
+            actualizar_resumen(numero)
+        except Exception as e:
+            with _lock:
+                _contadores["errores"] += 1
+            print(f"[RESUMEN] Error al actualizar resumen de {numero}: {e}")
+        finally:
+            with _lock:
+                _actualizando.discard(numero)
+
+    threading.Thread(target=_ejecutar, daemon=True).start()
+
+
+def estadisticas() -> Dict[str, Any]:
+    """Actualizaciones, errores, mensajes reemplazados por resumenes y cache."""
+    with _lock:
+        return {
+            **_contadores,
+            "actualizando": len(_actualizando),
+            "cache": _cache.estadisticas(),
+        }
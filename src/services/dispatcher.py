@@ -0,0 +1,227 @@
+"""
+Pool de trabajo en segundo plano para el webhook de WhatsApp.
+
+El webhook solo valida y encola; este modulo ejecuta las tareas (respuesta +
+envio) fuera del request en un pool acotado de threads o procesos. Lleva la
+cuenta de tareas pendientes para exponer la profundidad de cola y rechaza
+trabajo nuevo cuando el pool esta saturado (backpressure).
+
+Las tareas encoladas con una clave (p. ej. el sender_id) pasan por un buzon
+por clave: los turnos de un mismo usuario se ejecutan en orden y de a uno,
+mientras que usuarios distintos avanzan en paralelo. El buzon vive en el
+proceso que recibe el webhook, por lo que el orden se garantiza por instancia
+(por eso la concurrencia se escala con WEBHOOK_WORKERS y no con workers de
+gunicorn).
+
+Con WEBHOOK_MODO_POOL="processes" los procesos se crean con "spawn", no con
+fork: al importar, los modulos ya abrieron canales gRPC (Firestore) y el
+cliente HTTP de OpenAI, y un fork los copiaria a medio usar. Cada proceso
+importa el modulo de la tarea al arrancar y crea sus propios clientes.
+"""
+
+import importlib
+import multiprocessing
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from src.config import (
+    WEBHOOK_ESPERA_COLA_SEG,
+    WEBHOOK_MAX_PENDIENTES,
+    WEBHOOK_MODO_POOL,
+    WEBHOOK_WORKERS,
+)
+
+Tarea = Tuple[Callable[..., Any], Tuple[Any, ...]]
+
+# === ESTADO DEL POOL ===
+_executor: Optional[Executor] = None
+_lock = threading.Lock()
+_sin_pendientes = threading.Condition(_lock)
+_cupos = threading.BoundedSemaphore(WEBHOOK_MAX_PENDIENTES)
+_pendientes = 0
+_rechazadas = 0
+_cerrando = False
+
+# Buzones por clave: solo existe entrada mientras la clave tiene una tarea en
+# ejecucion; la deque guarda las tareas que esperan su turno.
+_buzones: Dict[str, Deque[Tarea]] = {}
+
+
+# === UTILIDADES INTERNAS ===
+def _iniciar_proceso(modulo: str) -> None:
+    """Inicializador de cada proceso del pool: importa el modulo de la tarea.
+
+    Asi los clientes que se crean al importar (Firebase, OpenAI) se arman en
+    el proceso hijo antes del primer turno.
+    """
+    importlib.import_module(modulo)
+
+
+def _obtener_executor(funcion: Callable[..., Any]) -> Executor:
+    """Crea el executor de forma perezosa (una sola vez por proceso)."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            if WEBHOOK_MODO_POOL == "processes":
+                _executor = ProcessPoolExecutor(
+                    max_workers=WEBHOOK_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_iniciar_proceso,
+                    initargs=(funcion.__module__,),
+                )
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=WEBHOOK_WORKERS,
+                    thread_name_prefix="webhook-worker",
+                )
+        return _executor
+
+
+def _liberar(cantidad: int = 1) -> None:
+    """Devuelve cupos al pool y notifica si ya no quedan tareas pendientes."""
+    global _pendientes
+    with _lock:
+        _pendientes -= cantidad
+        if _pendientes == 0:
+            _sin_pendientes.notify_all()
+    for _ in range(cantidad):
+        _cupos.release()
+
+
+def _enviar(tarea: Tarea, clave: Optional[str]) -> None:
+    """Envia la tarea al executor y agenda el siguiente turno del buzon."""
+    funcion, args = tarea
+    future = _obtener_executor(funcion).submit(funcion, *args)
+    future.add_done_callback(partial(_al_terminar, clave))
+
+
+def _al_terminar(clave: Optional[str], future: Future) -> None:
+    """Libera el cupo, registra errores y despacha el siguiente turno de la clave."""
+    error = future.exception()
+    if error is not None:
+        print("[DISPATCHER] Error en tarea de segundo plano:")
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    siguiente: Optional[Tarea] = None
+    if clave is not None:
+        with _lock:
+            buzon = _buzones.get(clave)
+            if buzon:
+                siguiente = buzon.popleft()
+            else:
+                _buzones.pop(clave, None)
+
+    _liberar()
+
+    if siguiente is not None:
+        try:
+            _enviar(siguiente, clave)
+        except Exception as e:
+            # Executor apagado: se descartan los turnos restantes de la clave.
+            with _lock:
+                descartadas = 1 + len(_buzones.pop(clave, ()))
+            print(f"[DISPATCHER] No se pudo despachar el buzon de {clave}: {e}")
+            _liberar(descartadas)
+
+
+# === API PUBLICA ===
+def reservar() -> bool:
+    """Reserva un cupo del pool para una tarea que se encolara mas tarde.
+
+    Returns:
+        True si se obtuvo el cupo; False si el pool esta saturado o cerrando.
+    """
+    global _pendientes, _rechazadas
+    if _cerrando or not _cupos.acquire(timeout=WEBHOOK_ESPERA_COLA_SEG):
+        with _lock:
+            _rechazadas += 1
+        return False
+    with _lock:
+        _pendientes += 1
+    return True
+
+
+def liberar_reserva() -> None:
+    """Devuelve un cupo reservado con reservar() que no llego a encolarse."""
+    _liberar()
+
+
+def encolar(
+    funcion: Callable[..., Any],
+    *args: Any,
+    clave: Optional[str] = None,
+    reservado: bool = False,
+) -> bool:
+    """Encola una tarea en el pool si hay capacidad disponible.
+
+    Args:
+        funcion: Funcion a ejecutar (nivel de modulo si el pool usa procesos).
+        *args: Argumentos posicionales para la funcion.
+        clave: Si se indica, la tarea espera en el buzon de esa clave hasta que
+            terminen las anteriores (orden FIFO por clave).
+        reservado: True si el cupo ya fue tomado con reservar().
+
+    Returns:
+        True si la tarea fue encolada; False si el pool esta saturado o cerrando.
+    """
+    if not reservado and not reservar():
+        return False
+
+    tarea: Tarea = (funcion, args)
+    with _lock:
+        if clave is not None:
+            if clave in _buzones:
+                _buzones[clave].append(tarea)
+                return True
+            _buzones[clave] = deque()
+
+    try:
+        _enviar(tarea, clave)
+    except Exception:
+        with _lock:
+            if clave is not None and not _buzones.get(clave):
+                _buzones.pop(clave, None)
+        _liberar()
+        raise
+    return True
+
+
+def estado_cola() -> Dict[str, Any]:
+    """Devuelve metricas del pool (profundidad de cola, buzones, rechazos)."""
+    with _lock:
+        pendientes = _pendientes
+        rechazadas = _rechazadas
+        buzones_activos = len(_buzones)
+        en_buzones = sum(len(b) for b in _buzones.values())
+    return {
+        "modo": WEBHOOK_MODO_POOL,
+        "workers": WEBHOOK_WORKERS,
+        "pendientes": pendientes,
+        "en_cola": max(0, pendientes - WEBHOOK_WORKERS),
+        "capacidad": WEBHOOK_MAX_PENDIENTES,
+        "buzones_activos": buzones_activos,
+        "esperando_en_buzones": en_buzones,
+        "rechazadas": rechazadas,
+    }
+
+
+def apagar(esperar: bool = True, timeout: Optional[float] = None) -> None:
+    """Detiene el pool.
+
+    Con esperar=True deja de aceptar tareas y drena las pendientes (incluidos
+    los turnos que esperan en buzones) antes de cerrar el executor.
+    """
+    global _executor, _cerrando
+    with _lock:
+        _cerrando = True
+        if esperar:
+            _sin_pendientes.wait_for(lambda: _pendientes == 0, timeout=timeout)
+        executor = _executor
+        _executor = None
+        _cerrando = False
+    if executor is not None:
+        executor.shutdown(wait=esperar)
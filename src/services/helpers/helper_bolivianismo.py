@@ -1,52 +1,61 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
+from src.config import GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
 from src.data.firestore_storage import leer_historial
+from src.services import conversation_summary, llm
+from src.services.prompt_builder import construir_prompt, prefijo_estatico
+
+# === PROMPT DEL SISTEMA ===
+PROMPT_SISTEMA = prefijo_estatico("helper_bolivianismo", GPT_MODEL_AVANZADO, (
+    "El usuario ha utilizado expresiones típicas del español hablado en Bolivia, como 'caserita', 'pahuichi', 'feria', "
+    "'almacén', 'boliche' u otras similares, en un contexto relacionado al comercio local o informal.\n\n"
+    "INSTRUCCIONES:\n"
+    "- Responde con claridad, respeto y cercanía.\n"
+    "- Usa un ejemplo sencillo si ayuda, como una tienda de barrio, un negocio en la feria o un pahuichi.\n"
+    "- Evita repetir literalmente las expresiones del usuario.\n"
+    "- No utilices saludos, ni inicies con frases como 'claro', 'por supuesto' o 'sí te explico'.\n"
+    "- Si fluye naturalmente, puedes incluir una expresión boliviana, pero no la fuerces.\n"
+    "- El tono debe ser cálido y profesional, sin tecnicismos innecesarios.\n"
+    "- No incluyas emojis salvo que aporten claridad."
+))
 
 def obtener_respuesta_bolivianismo(numero_usuario):
     """
     Genera una respuesta adaptada al uso de bolivianismos relacionados al comercio local,
     utilizando el historial real del usuario como contexto para sonar natural y útil.
+
+    Returns:
+        (texto, origen): origen es "generada" (GPT en vivo con el historial o
+        el resumen del usuario), "generica" (GPT en vivo solo con el prompt
+        del sistema) o "respaldo" (texto fijo si fallo GPT).
     """
 
     historial_completo = leer_historial(numero_usuario)
+    # Lo ya resumido se reemplaza por el resumen de la conversacion
+    historial_completo, resumen = conversation_summary.preparar_contexto(numero_usuario, historial_completo)
 
-    # Extraer últimos mensajes del usuario y del chatbot
-    ultimos_usuario = [m for m in historial_completo if m["role"] == "user"][-6:]
-    ultimos_chatbot = [m for m in historial_completo if m["role"] == "assistant"][-6:]
+    # Historial mas reciente que entra en el presupuesto de tokens del modelo
+    # que se va a llamar (el ruteo puede elegir uno mas rapido)
+    modelo = llm.elegir_modelo("helper")
+    mensajes = construir_prompt(PROMPT_SISTEMA, historial_completo, modelo, contexto=resumen)
 
-    historial_reciente = sorted(ultimos_usuario + ultimos_chatbot, key=lambda x: x.get("timestamp", ""))
-
-    # DEBUG: mostrar historial que se usará en el prompt
+    # DEBUG: mostrar historial que GPT usará
     print("[DEBUG - HISTORIAL BOLIVIANISMO] Mensajes recientes para el prompt:")
-    for i, h in enumerate(historial_reciente):
+    for i, h in enumerate(mensajes[1:]):
         print(f"[{i}] ({h['role']}) → {h['content']}")
 
-    mensajes = [
-        {"role": "system", "content": (
-            "El usuario ha utilizado expresiones típicas del español hablado en Bolivia, como 'caserita', 'pahuichi', 'feria', "
-            "'almacén', 'boliche' u otras similares, en un contexto relacionado al comercio local o informal.\n\n"
-            "INSTRUCCIONES:\n"
-            "- Responde con claridad, respeto y cercanía.\n"
-            "- Usa un ejemplo sencillo si ayuda, como una tienda de barrio, un negocio en la feria o un pahuichi.\n"
-            "- Evita repetir literalmente las expresiones del usuario.\n"
-            "- No utilices saludos, ni inicies con frases como 'claro', 'por supuesto' o 'sí te explico'.\n"
-            "- Si fluye naturalmente, puedes incluir una expresión boliviana, pero no la fuerces.\n"
-            "- El tono debe ser cálido y profesional, sin tecnicismos innecesarios.\n"
-            "- No incluyas emojis salvo que aporten claridad."
-        )}
-    ]
-
-    mensajes.extend(historial_reciente)
-
     try:
         print("[GPT] Generando respuesta para intención 'bolivianismo'...")
-        respuesta = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        respuesta = llm.completar(
+            model=modelo,
+            tipo="helper",
             messages=mensajes,
             temperature=TEMPERATURA_CONVERSACION,
             max_tokens=220
         )
         print("[GPT] Respuesta generada exitosamente para intención 'bolivianismo'.")
-        return respuesta.choices[0].message.content.strip()
+        # Sin historial ni resumen en el prompt la respuesta no tiene nada
+        # de este usuario (se puede reutilizar con otros)
+        origen = "generada" if len(mensajes) > 1 else "generica"
+        return respuesta.choices[0].message.content.strip(), origen
 
     except Exception as e:
         print(f"[ERROR GPT - helper_bolivianismo] {e}")
@@ -54,7 +63,7 @@ def obtener_respuesta_bolivianismo(numero_usuario):
             "Entiendo que tienes un negocio local y estás buscando formas de promocionarlo. "
             "Google Ads puede ayudarte a que más personas encuentren lo que ofreces, ya sea en tu tienda, feria o incluso en tu pahuichi. "
             "Te puedo guiar paso a paso para crear un anuncio efectivo, sin necesidad de tener experiencia previa."
-        )
+        ), "respaldo"
 
 
 
@@ -1,55 +1,74 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
+from src.config import GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
 from src.data.firestore_storage import leer_historial
+from src.services import conversation_summary, llm, response_pool
+from src.services.prompt_builder import construir_prompt, prefijo_estatico
+
+# === POOL DE VARIANTES PRE-GENERADAS ===
+ETIQUETA_POOL = "costo_google_ads"
+PREGUNTA_POOL = "¿Cuánto cuesta usar Google Ads?"
+
+# === PROMPT DEL SISTEMA ===
+# Estatico: su huella versiona el pool de variantes pre-generadas.
+PROMPT_SISTEMA = prefijo_estatico("helper_costo_google_ads", GPT_MODEL_AVANZADO, (
+    "El usuario acaba de preguntar cuánto cuesta usar Google Ads. Tu tarea es responder de forma clara, "
+    "accesible y tranquilizadora. Debes explicar que no hay un precio fijo, y que se puede empezar con montos bajos "
+    "como 5 Bs por día o incluso menos, hacer una prueba por una semana y luego decidir si continuar o detenerlo. \n\n"
+
+    "INSTRUCCIONES:\n"
+    "- No digas saludos ni repitas la pregunta.\n"
+    "- Menciona que cada persona elige su presupuesto.\n"
+    "- Usa ejemplos como: gastar Bs 5 al día, gastar Bs 35 en una semana, o invertir solo Bs 100 al mes.\n"
+    "- Aclara que si no le convence, puede detener la campaña cuando quiera.\n"
+    "- Escribe como en un chat: directo, cálido, frases cortas.\n"
+    "- Puedes usar un emoji, pero solo uno.\n"
+    "- No más de 6 líneas visibles en WhatsApp."
+))
 
 def obtener_respuesta_costo_google_ads(numero_usuario):
     """
     Genera una respuesta natural y contextualizada para explicar cuánto cuesta Google Ads,
     mostrando que se puede empezar con montos bajos y evaluar resultados antes de continuar.
+
+    Returns:
+        (texto, origen): origen es "generada" (GPT en vivo con el historial o
+        el resumen del usuario), "generica" (GPT en vivo solo con el prompt
+        del sistema, sin nada del usuario), "pool" (variante pre-generada,
+        quizas con frase puente) o "respaldo" (texto fijo si fallo GPT).
     """
 
-    historial_completo = leer_historial(numero_usuario)
+    # Respuesta pre-generada (sin latencia de GPT) si el pool esta vigente.
+    variante = response_pool.responder_desde_pool(ETIQUETA_POOL, PROMPT_SISTEMA, PREGUNTA_POOL, numero_usuario)
+    if variante:
+        return variante, "pool"
 
-    # Separar mensajes por rol
-    ultimos_usuario = [m for m in historial_completo if m["role"] == "user"][-6:]
-    ultimos_chatbot = [m for m in historial_completo if m["role"] == "assistant"][-6:]
+    historial_completo = leer_historial(numero_usuario)
+    # Lo ya resumido se reemplaza por el resumen de la conversacion
+    historial_completo, resumen = conversation_summary.preparar_contexto(numero_usuario, historial_completo)
 
-    # Fusionar y ordenar cronológicamente
-    historial_reciente = sorted(ultimos_usuario + ultimos_chatbot, key=lambda x: x.get("timestamp", ""))
+    # Historial mas reciente que entra en el presupuesto de tokens del modelo
+    # que se va a llamar (el ruteo puede elegir uno mas rapido)
+    modelo = llm.elegir_modelo("helper")
+    mensajes = construir_prompt(PROMPT_SISTEMA, historial_completo, modelo, contexto=resumen)
 
-    # DEBUG: mostrar historial usado para esta intención
+    # DEBUG: mostrar historial que GPT usará
     print("[DEBUG - HISTORIAL COSTO_GOOGLE_ADS] Mensajes recientes para el prompt:")
-    for i, h in enumerate(historial_reciente):
+    for i, h in enumerate(mensajes[1:]):
         print(f"[{i}] ({h['role']}) → {h['content']}")
 
-    mensajes = [
-        {"role": "system", "content": (
-            "El usuario acaba de preguntar cuánto cuesta usar Google Ads. Tu tarea es responder de forma clara, "
-            "accesible y tranquilizadora. Debes explicar que no hay un precio fijo, y que se puede empezar con montos bajos "
-            "como 5 Bs por día o incluso menos, hacer una prueba por una semana y luego decidir si continuar o detenerlo. \n\n"
-
-            "INSTRUCCIONES:\n"
-            "- No digas saludos ni repitas la pregunta.\n"
-            "- Menciona que cada persona elige su presupuesto.\n"
-            "- Usa ejemplos como: gastar Bs 5 al día, gastar Bs 35 en una semana, o invertir solo Bs 100 al mes.\n"
-            "- Aclara que si no le convence, puede detener la campaña cuando quiera.\n"
-            "- Escribe como en un chat: directo, cálido, frases cortas.\n"
-            "- Puedes usar un emoji, pero solo uno.\n"
-            "- No más de 6 líneas visibles en WhatsApp."
-        )}
-    ]
-
-    mensajes.extend(historial_reciente)
-
     try:
         print("[GPT] Generando respuesta para intención 'costo Google Ads'...")
-        respuesta = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        respuesta = llm.completar(
+            model=modelo,
+            tipo="helper",
             messages=mensajes,
             temperature=TEMPERATURA_CONVERSACION,
             max_tokens=220
         )
         print("[GPT] Respuesta generada exitosamente para intención 'costo Google Ads'.")
-        return respuesta.choices[0].message.content.strip()
+        # Sin historial ni resumen en el prompt la respuesta no tiene nada
+        # de este usuario (se puede reutilizar con otros)
+        origen = "generada" if len(mensajes) > 1 else "generica"
+        return respuesta.choices[0].message.content.strip(), origen
 
     except Exception as e:
         print(f"[ERROR GPT - helper_costo_google_ads] {e}")
@@ -57,7 +76,7 @@ def obtener_respuesta_costo_google_ads(numero_usuario):
             "Google Ads no tiene un costo fijo. Tú decides cuánto invertir según tu bolsillo. "
             "Por ejemplo, puedes empezar con solo Bs 5 al día (Bs 35 a la semana), ver los resultados, y luego decidir. "
             "Si no te convence, puedes pausar o cambiar el anuncio en cualquier momento. 😊"
-        )
+        ), "respaldo"
 
 
 
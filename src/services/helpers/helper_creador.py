@@ -1,60 +1,78 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
+from src.config import GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
 from src.data.firestore_storage import leer_historial
+from src.services import conversation_summary, llm, response_pool
+from src.services.prompt_builder import construir_prompt, prefijo_estatico
+
+# === POOL DE VARIANTES PRE-GENERADAS ===
+ETIQUETA_POOL = "creador"
+PREGUNTA_POOL = "¿Quién te creó?"
+
+# === PROMPT DEL SISTEMA ===
+# Estatico: su huella versiona el pool de variantes pre-generadas.
+PROMPT_SISTEMA = prefijo_estatico("helper_creador", GPT_MODEL_AVANZADO, (
+    "El usuario quiere saber quién creó este chatbot. "
+    "Tu respuesta debe ser fluida, cálida y coherente con el flujo conversacional reciente.\n\n"
+    "INSTRUCCIONES:\n"
+    "- No empieces con saludos.\n"
+    "- No repitas la pregunta.\n"
+    "- No uses frases como 'Claro', 'Sí, te cuento' o 'Por supuesto'.\n"
+    "- Deja claro que este chatbot fue creado por Jesús H. Tito A., con el apoyo de Héctor A. Machicado C.\n"
+    "- Explica que su objetivo es ayudar a personas con campañas en Google Ads.\n"
+    "- Usa lenguaje natural como si estuvieras en un chat real."
+))
 
 def obtener_respuesta_creador_dinamica(numero_usuario):
     """
     Genera una respuesta conversacional y natural sobre quién creó el chatbot,
     basada en el historial reciente del usuario para mantener coherencia.
+
+    Returns:
+        (texto, origen): origen es "generada" (GPT en vivo con el historial o
+        el resumen del usuario), "generica" (GPT en vivo solo con el prompt
+        del sistema, sin nada del usuario), "pool" (variante pre-generada,
+        quizas con frase puente) o "respaldo" (texto fijo si fallo GPT).
     """
 
-    historial_completo = leer_historial(numero_usuario)
+    # Respuesta pre-generada (sin latencia de GPT) si el pool esta vigente.
+    variante = response_pool.responder_desde_pool(ETIQUETA_POOL, PROMPT_SISTEMA, PREGUNTA_POOL, numero_usuario)
+    if variante:
+        return variante, "pool"
 
-    # Separar mensajes por roles
-    ultimos_usuario = [m for m in historial_completo if m["role"] == "user"][-6:]
-    ultimos_chatbot = [m for m in historial_completo if m["role"] == "assistant"][-6:]
+    historial_completo = leer_historial(numero_usuario)
+    # Lo ya resumido se reemplaza por el resumen de la conversacion
+    historial_completo, resumen = conversation_summary.preparar_contexto(numero_usuario, historial_completo)
 
-    # Fusionar y ordenar cronológicamente
-    historial_reciente = sorted(ultimos_usuario + ultimos_chatbot, key=lambda x: x.get("timestamp", ""))
+    # Historial mas reciente que entra en el presupuesto de tokens del modelo
+    # que se va a llamar (el ruteo puede elegir uno mas rapido)
+    modelo = llm.elegir_modelo("helper")
+    mensajes = construir_prompt(PROMPT_SISTEMA, historial_completo, modelo, contexto=resumen)
 
-    # DEBUG: mostrar historial real que usará GPT
+    # DEBUG: mostrar historial que GPT usará
     print("[DEBUG - HISTORIAL CREADOR] Mensajes recientes para el prompt:")
-    for i, h in enumerate(historial_reciente):
+    for i, h in enumerate(mensajes[1:]):
         print(f"[{i}] ({h['role']}) → {h['content']}")
 
-    # Crear el prompt con contexto ajustado y tono cálido
-    mensajes = [
-        {"role": "system", "content": (
-            "El usuario quiere saber quién creó este chatbot. "
-            "Tu respuesta debe ser fluida, cálida y coherente con el flujo conversacional reciente.\n\n"
-            "INSTRUCCIONES:\n"
-            "- No empieces con saludos.\n"
-            "- No repitas la pregunta.\n"
-            "- No uses frases como 'Claro', 'Sí, te cuento' o 'Por supuesto'.\n"
-            "- Deja claro que este chatbot fue creado por Jesús H. Tito A., con el apoyo de Héctor A. Machicado C.\n"
-            "- Explica que su objetivo es ayudar a personas con campañas en Google Ads.\n"
-            "- Usa lenguaje natural como si estuvieras en un chat real."
-        )}
-    ]
-
-    mensajes.extend(historial_reciente)
-
     try:
         print("[GPT] Generando respuesta con información del creador...")
-        respuesta = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        respuesta = llm.completar(
+            model=modelo,
+            tipo="helper",
             messages=mensajes,
             temperature=TEMPERATURA_CONVERSACION,
             max_tokens=180
         )
         print("[GPT] Respuesta generada exitosamente para intención 'creador'.")
-        return respuesta.choices[0].message.content.strip()
+        # Sin historial ni resumen en el prompt la respuesta no tiene nada
+        # de este usuario (se puede reutilizar con otros)
+        origen = "generada" if len(mensajes) > 1 else "generica"
+        return respuesta.choices[0].message.content.strip(), origen
 
     except Exception as e:
         print(f"[ERROR GPT - helper_creador dinámico] {e}")
         return (
             "Fui creado por Jesús H. Tito A., con el apoyo de Héctor A. Machicado C., "
             "como parte de un proyecto para ayudarte con campañas en Google Ads."
-        )
+        ), "respaldo"
 
 
 
@@ -1,54 +1,72 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
+from src.config import GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
 from src.data.firestore_storage import leer_historial
+from src.services import conversation_summary, llm, response_pool
+from src.services.prompt_builder import construir_prompt, prefijo_estatico
+
+# === POOL DE VARIANTES PRE-GENERADAS ===
+ETIQUETA_POOL = "que_es_google_ads"
+PREGUNTA_POOL = "¿Qué es Google Ads?"
+
+# === PROMPT DEL SISTEMA ===
+# Estatico: su huella versiona el pool de variantes pre-generadas.
+PROMPT_SISTEMA = prefijo_estatico("helper_que_es_google_ads", GPT_MODEL_AVANZADO, (
+    "El usuario quiere saber qué es Google Ads. Tu tarea es explicarlo de forma natural y coherente "
+    "con el flujo de conversación actual. No respondas como un robot ni repitas su pregunta.\n\n"
+
+    "INSTRUCCIONES:\n"
+    "- Explica qué es Google Ads de forma sencilla y cercana.\n"
+    "- Usa ejemplos bolivianos: una pastelería, ferretería o tienda de repuestos en La Paz.\n"
+    "- Escribe en frases cortas, claras y cálidas, como si estuvieras en un chat.\n"
+    "- No digas 'claro', 'por supuesto' o saludos. Solo responde directo.\n"
+    "- Puedes usar un emoji si es útil, pero solo uno.\n"
+    "- Máximo 6 líneas visibles en WhatsApp."
+))
 
 def obtener_respuesta_que_es_google_ads(numero_usuario):
     """
     Genera una respuesta natural y contextualizada para explicar qué es Google Ads,
     usando el historial reciente del usuario para que la respuesta sea fluida y coherente.
+
+    Returns:
+        (texto, origen): origen es "generada" (GPT en vivo con el historial o
+        el resumen del usuario), "generica" (GPT en vivo solo con el prompt
+        del sistema, sin nada del usuario), "pool" (variante pre-generada,
+        quizas con frase puente) o "respaldo" (texto fijo si fallo GPT).
     """
 
-    historial_completo = leer_historial(numero_usuario)
+    # Respuesta pre-generada (sin latencia de GPT) si el pool esta vigente.
+    variante = response_pool.responder_desde_pool(ETIQUETA_POOL, PROMPT_SISTEMA, PREGUNTA_POOL, numero_usuario)
+    if variante:
+        return variante, "pool"
 
-    # Separar mensajes por rol
-    ultimos_usuario = [m for m in historial_completo if m["role"] == "user"][-6:]
-    ultimos_chatbot = [m for m in historial_completo if m["role"] == "assistant"][-6:]
+    historial_completo = leer_historial(numero_usuario)
+    # Lo ya resumido se reemplaza por el resumen de la conversacion
+    historial_completo, resumen = conversation_summary.preparar_contexto(numero_usuario, historial_completo)
 
-    # Fusionar y ordenar cronológicamente
-    historial_reciente = sorted(ultimos_usuario + ultimos_chatbot, key=lambda x: x.get("timestamp", ""))
+    # Historial mas reciente que entra en el presupuesto de tokens del modelo
+    # que se va a llamar (el ruteo puede elegir uno mas rapido)
+    modelo = llm.elegir_modelo("helper")
+    mensajes = construir_prompt(PROMPT_SISTEMA, historial_completo, modelo, contexto=resumen)
 
     # DEBUG: mostrar historial que GPT usará
     print("[DEBUG - HISTORIAL QUE_ES_GOOGLE_ADS] Mensajes recientes para el prompt:")
-    for i, h in enumerate(historial_reciente):
+    for i, h in enumerate(mensajes[1:]):
         print(f"[{i}] ({h['role']}) → {h['content']}")
 
-    # Crear el prompt ajustado
-    mensajes = [
-        {"role": "system", "content": (
-            "El usuario quiere saber qué es Google Ads. Tu tarea es explicarlo de forma natural y coherente "
-            "con el flujo de conversación actual. No respondas como un robot ni repitas su pregunta.\n\n"
-
-            "INSTRUCCIONES:\n"
-            "- Explica qué es Google Ads de forma sencilla y cercana.\n"
-            "- Usa ejemplos bolivianos: una pastelería, ferretería o tienda de repuestos en La Paz.\n"
-            "- Escribe en frases cortas, claras y cálidas, como si estuvieras en un chat.\n"
-            "- No digas 'claro', 'por supuesto' o saludos. Solo responde directo.\n"
-            "- Puedes usar un emoji si es útil, pero solo uno.\n"
-            "- Máximo 6 líneas visibles en WhatsApp."
-        )}
-    ]
-
-    mensajes.extend(historial_reciente)
-
     try:
         print("[GPT] Generando respuesta para intención 'qué es Google Ads' (contextualizada)...")
-        respuesta = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        respuesta = llm.completar(
+            model=modelo,
+            tipo="helper",
             messages=mensajes,
             temperature=TEMPERATURA_CONVERSACION,
             max_tokens=220
         )
         print("[GPT] Respuesta generada exitosamente para intención 'Google Ads'.")
-        return respuesta.choices[0].message.content.strip()
+        # Sin historial ni resumen en el prompt la respuesta no tiene nada
+        # de este usuario (se puede reutilizar con otros)
+        origen = "generada" if len(mensajes) > 1 else "generica"
+        return respuesta.choices[0].message.content.strip(), origen
 
     except Exception as e:
         print(f"[ERROR GPT - helper_que_es_google_ads] {e}")
@@ -56,7 +74,7 @@ def obtener_respuesta_que_es_google_ads(numero_usuario):
             "Google Ads es una herramienta de Google que te ayuda a promocionar tu negocio en internet. "
             "Por ejemplo, si tienes una ferretería en La Paz, puedes hacer que tu anuncio aparezca cuando alguien busca clavos, cemento o herramientas. "
             "Así más personas encuentran tu negocio fácilmente. 😉"
-        )
+        ), "respaldo"
 
 
 
@@ -0,0 +1,101 @@
+"""
+Cache de resultados de deteccion de intenciones.
+
+Los prompts de deteccion son deterministas en la practica (temperatura baja y
+respuesta de pocos tokens): el mismo texto normalizado ("que es google ads",
+"cuanto cuesta") siempre obtiene la misma etiqueta. Este cache evita repetir
+esas llamadas:
+
+- Nivel 1: LRU + TTL en memoria del proceso.
+- Nivel 2: coleccion de Firestore compartida por todas las instancias.
+
+La clave combina un espacio de nombres (clasificador o detector), la version
+del prompt y el texto normalizado; al cambiar el prompt cambia la version y las
+entradas viejas dejan de usarse.
+"""
+
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from src.config import (
+    CACHE_INTENCIONES_COMPARTIDO,
+    CACHE_INTENCIONES_MAX_ENTRADAS,
+    CACHE_INTENCIONES_TTL_SEG,
+)
+from src.data.firestore_storage import guardar_cache_compartido, leer_cache_compartido
+from src.services.cache import CacheTTL
+from src.services.texto import normalizar_texto
+
+COLECCION_CACHE_INTENCIONES = "cache_intenciones"
+
+# === ESTADO ===
+_cache_local = CacheTTL(CACHE_INTENCIONES_MAX_ENTRADAS, CACHE_INTENCIONES_TTL_SEG)
+_lock = threading.Lock()
+_aciertos_compartidos = 0
+
+
+# === UTILIDADES ===
+def version_prompt(*partes: Any) -> str:
+    """Huella corta de un prompt (y su modelo) para versionar las claves."""
+    return hashlib.sha1(repr(partes).encode("utf-8")).hexdigest()[:10]
+
+
+def _clave(espacio: str, version: str, texto: str) -> str:
+    """ID estable del documento: hash de espacio + version + texto normalizado."""
+    base = f"{espacio}|{version}|{normalizar_texto(texto)}"
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()
+
+
+# === API PUBLICA ===
+def obtener(espacio: str, version: str, texto: str) -> Optional[Any]:
+    """Devuelve el resultado cacheado (local o compartido) o None si no existe."""
+    global _aciertos_compartidos
+    clave = _clave(espacio, version, texto)
+    valor = _cache_local.obtener(clave)
+    if valor is not None or not CACHE_INTENCIONES_COMPARTIDO:
+        return valor
+
+    try:
+        valor = leer_cache_compartido(COLECCION_CACHE_INTENCIONES, clave)
+    except Exception as e:
+        print(f"[CACHE INTENCIONES] Error al leer cache compartido: {e}")
+        return None
+
+    if valor is not None:
+        _cache_local.guardar(clave, valor)
+        with _lock:
+            _aciertos_compartidos += 1
+    return valor
+
+
+def guardar(espacio: str, version: str, texto: str, valor: Any) -> None:
+    """Guarda el resultado en memoria y, en segundo plano, en el cache compartido."""
+    clave = _clave(espacio, version, texto)
+    _cache_local.guardar(clave, valor)
+    if not CACHE_INTENCIONES_COMPARTIDO:
+        return
+
+    def _escribir() -> None:
+        try:
+            guardar_cache_compartido(COLECCION_CACHE_INTENCIONES, clave, valor, CACHE_INTENCIONES_TTL_SEG)
+        except Exception as e:
+            print(f"[CACHE INTENCIONES] Error al escribir cache compartido: {e}")
+
+    threading.Thread(target=_escribir, daemon=True).start()
+
+
+def estadisticas() -> Dict[str, Any]:
+    """Metricas del cache: aciertos locales, compartidos y fallos totales."""
+    local = _cache_local.estadisticas()
+    with _lock:
+        compartidos = _aciertos_compartidos
+    consultas = local["aciertos"] + local["fallos"]
+    aciertos = local["aciertos"] + compartidos
+    return {
+        "entradas_locales": local["entradas"],
+        "aciertos_locales": local["aciertos"],
+        "aciertos_compartidos": compartidos,
+        "fallos": local["fallos"] - compartidos,
+        "tasa_aciertos": round(aciertos / consultas, 3) if consultas else 0.0,
+    }
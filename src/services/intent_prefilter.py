@@ -0,0 +1,168 @@
+"""
+Prefiltro local de intenciones (sin llamadas de red).
+
+Resuelve en el proceso, en pocos milisegundos, los casos obvios antes de pagar
+por el clasificador GPT:
+
+1) Reglas por intencion declaradas en el registro, sobre el texto
+   normalizado y sus lemas (spaCy, es_core_news_sm):
+   - "patrones": frases completas ("quien te creo") -> positivo seguro.
+   - "lemas_clave" e "indicios": una palabra suelta ("creador") o una frase
+     corta que tambien aparece en otros contextos ("tu dueno") -> ambiguo,
+     siempre se escala a GPT ("soy creador de contenido" no es la intencion).
+2) Charla trivial ("hola", "ok", "gracias") -> negativo para todas.
+3) Modelo TF-IDF + regresion logistica por intencion, entrenado offline con
+   train_intent_prefilter.py a partir de conversaciones exportadas. Cada
+   intencion define sus umbrales: p >= umbral_positivo -> positivo,
+   p <= umbral_negativo -> negativo; en medio -> ambiguo.
+
+Solo las intenciones ambiguas se escalan a GPT. Si spaCy o el modelo no estan
+disponibles, el prefiltro se degrada a reglas sobre tokens normalizados.
+"""
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.config import (
+    PREFILTRO_UMBRAL_NEGATIVO,
+    PREFILTRO_UMBRAL_POSITIVO,
+    RUTA_MODELO_PREFILTRO,
+)
+from src.services.texto import normalizar_texto
+
+# === CHARLA TRIVIAL ===
+# Mensajes formados solo por estas palabras no activan ninguna intencion.
+PALABRAS_TRIVIALES = {
+    "hola", "ok", "okay", "oki", "gracias", "muchas", "si", "no", "buenas", "buenos",
+    "buen", "dia", "dias", "tardes", "noches", "listo", "vale", "perfecto", "bien",
+    "muy", "claro", "dale", "chau", "adios", "ya", "jaja", "jajaja", "genial",
+    "excelente", "entendido", "de", "acuerdo", "bueno", "super", "gracia",
+}
+
+# === ESTADO PEREZOSO (spaCy y modelo) ===
+_lock = threading.Lock()
+_nlp: Any = None
+_nlp_cargado = False
+_modelo: Optional[Dict[str, Any]] = None
+_modelo_cargado = False
+
+
+# === PREPROCESAMIENTO ===
+def _obtener_nlp() -> Any:
+    """Carga es_core_news_sm una sola vez (solo tagger/lemmatizer)."""
+    global _nlp, _nlp_cargado
+    with _lock:
+        if not _nlp_cargado:
+            _nlp_cargado = True
+            try:
+                import spacy
+                _nlp = spacy.load("es_core_news_sm", disable=["parser", "ner"])
+            except Exception as e:
+                print(f"[PREFILTRO] spaCy no disponible, se usan tokens normalizados: {e}")
+                _nlp = None
+        return _nlp
+
+
+def lematizar(texto: str) -> List[str]:
+    """Devuelve los lemas normalizados del texto (o sus tokens si no hay spaCy)."""
+    nlp = _obtener_nlp()
+    if nlp is None:
+        return normalizar_texto(texto).split()
+    lemas = (normalizar_texto(token.lemma_) for token in nlp(texto) if not token.is_punct)
+    return [lema for lema in lemas if lema]
+
+
+def preprocesar(texto: str) -> str:
+    """Texto lematizado listo para el vectorizador TF-IDF."""
+    return " ".join(lematizar(texto))
+
+
+# === MODELO ENTRENADO ===
+def _obtener_modelo() -> Optional[Dict[str, Any]]:
+    """Carga el modelo TF-IDF entrenado offline, si existe."""
+    global _modelo, _modelo_cargado
+    with _lock:
+        if not _modelo_cargado:
+            _modelo_cargado = True
+            if os.path.exists(RUTA_MODELO_PREFILTRO):
+                try:
+                    import joblib
+                    _modelo = joblib.load(RUTA_MODELO_PREFILTRO)
+                    print(f"[PREFILTRO] Modelo cargado: {sorted(_modelo['modelos'])}")
+                except Exception as e:
+                    print(f"[PREFILTRO] No se pudo cargar el modelo: {e}")
+                    _modelo = None
+        return _modelo
+
+
+def _probabilidades(texto_preprocesado: str) -> Dict[str, float]:
+    """Probabilidad positiva por etiqueta segun el modelo (vacio si no hay modelo)."""
+    modelo = _obtener_modelo()
+    if modelo is None:
+        return {}
+    matriz = modelo["vectorizador"].transform([texto_preprocesado])
+    return {
+        etiqueta: float(clasificador.predict_proba(matriz)[0][1])
+        for etiqueta, clasificador in modelo["modelos"].items()
+    }
+
+
+# === API PUBLICA ===
+def coincide_reglas(intencion: Dict[str, Any], normalizado: str) -> bool:
+    """Indica si los patrones de frase de la intencion marcan un positivo seguro."""
+    return any(re.search(patron, normalizado) for patron in intencion.get("patrones", ()))
+
+
+def tiene_indicios(intencion: Dict[str, Any], lemas: Set[str], normalizado: str) -> bool:
+    """Indica si el mensaje tiene indicios de la intencion que GPT debe confirmar."""
+    if lemas & set(intencion.get("lemas_clave", ())):
+        return True
+    return any(re.search(patron, normalizado) for patron in intencion.get("indicios", ()))
+
+
+def prefiltrar(mensaje_usuario: str, intenciones: List[Dict[str, Any]]) -> Tuple[Set[str], Set[str]]:
+    """
+    Clasifica localmente el mensaje contra las intenciones del registro.
+
+    Args:
+        mensaje_usuario: Texto entrante del usuario.
+        intenciones: Declaraciones INTENCION del router.
+
+    Returns:
+        (positivas, ambiguas): etiquetas resueltas como positivas y etiquetas
+        que deben escalarse a GPT. El resto se considera negativo.
+    """
+    normalizado = normalizar_texto(mensaje_usuario)
+    lemas_lista = lematizar(mensaje_usuario)
+    lemas = set(lemas_lista)
+
+    positivas: Set[str] = set()
+    ambiguas: Set[str] = set()
+    pendientes: List[Dict[str, Any]] = []
+    for intencion in intenciones:
+        if coincide_reglas(intencion, normalizado):
+            positivas.add(intencion["etiqueta"])
+        elif tiene_indicios(intencion, lemas, normalizado):
+            # Ni el modelo ni la charla trivial descartan un indicio.
+            ambiguas.add(intencion["etiqueta"])
+        else:
+            pendientes.append(intencion)
+
+    # Charla trivial: nada mas que resolver.
+    tokens = normalizado.split()
+    if not tokens or all(t in PALABRAS_TRIVIALES for t in tokens):
+        return positivas, ambiguas
+
+    probabilidades = _probabilidades(" ".join(lemas_lista))
+    for intencion in pendientes:
+        etiqueta = intencion["etiqueta"]
+        probabilidad = probabilidades.get(etiqueta)
+        if probabilidad is None:
+            ambiguas.add(etiqueta)
+        elif probabilidad >= intencion.get("umbral_positivo", PREFILTRO_UMBRAL_POSITIVO):
+            positivas.add(etiqueta)
+        elif probabilidad > intencion.get("umbral_negativo", PREFILTRO_UMBRAL_NEGATIVO):
+            ambiguas.add(etiqueta)
+    return positivas, ambiguas
@@ -1,20 +1,43 @@
 ﻿"""
 Router de intenciones para mensajes de usuario.
 
-Detecta intenciones en el texto entrante y puede devolver una respuesta directa,
-una respuesta fusionada o solo actualizar el historial. Usa historial almacenado
-(Firestore) y OpenAI para fusionar respuestas cuando hay multiples intenciones.
+Detecta intenciones en el texto entrante con un solo clasificador multi-etiqueta,
+cuyo prompt se arma desde el registro declarativo de intenciones, y puede devolver
+una respuesta directa, una respuesta combinada o solo actualizar el historial.
+Cuando hay multiples intenciones, una sola llamada a OpenAI las responde todas
+a partir de las instrucciones de cada helper y del historial (Firestore).
 """
 
 # === DEPENDENCIAS Y CONFIGURACION ===
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+
+from src.config import (
+    GPT_MODEL_AVANZADO,
+    GPT_MODEL_PRECISO,
+    INTENCIONES_CLASIFICADOR_UNICO,
+    INTENCIONES_DEADLINE_SEG,
+    INTENCIONES_GENERACION_UNICA,
+    INTENCIONES_WORKERS,
+    LLM_TIMEOUTS_SEG,
+    PREFILTRO_LOCAL,
+    RUTEO_MODELOS,
+    TEMPERATURA_CONVERSACION,
+    TEMPERATURA_INTENCIONES,
+)
 from src.data.firestore_storage import leer_historial
+from src.services import conversation_summary, intent_cache, llm, semantic_cache
+from src.services.intent_prefilter import prefiltrar
+from src.services.prompt_builder import construir_prompt, prefijo_estatico
 
-# === IMPORT DE DETECTORES (INTENCIONES) ===
-from src.services.intentions.intention_bolivianismo import detectar_bolivianismo
-from src.services.intentions.intention_costo_google_ads import detectar_costo_google_ads
-from src.services.intentions.intention_creador import detectar_creador
-from src.services.intentions.intention_que_es_google_ads import detectar_que_es_google_ads
+# === IMPORT DE DECLARACIONES DE INTENCIONES ===
+from src.services.intentions import (
+    intention_bolivianismo,
+    intention_costo_google_ads,
+    intention_creador,
+    intention_que_es_google_ads,
+)
 
 # from src.services.intentions.intention_proposito import detectar_proposito
 # from src.services.intentions.intention_crear_anuncio import detectar_crear_anuncio
@@ -24,17 +47,311 @@ from src.services.intentions.intention_que_es_google_ads import detectar_que_es_
 
 
 # === REGISTRO DE INTENCIONES ACTIVAS ===
+# Cada modulo declara su INTENCION (etiqueta, descripcion, ejemplos, reglas y
+# umbrales del prefiltro local, detector y helper). El helper devuelve
+# (texto, origen) con origen "generada", "pool" o "respaldo". El orden define
+# el orden de las respuestas al fusionar.
 INTENCIONES = [
-    detectar_creador,
-    detectar_que_es_google_ads,
-    detectar_bolivianismo,
-    detectar_costo_google_ads,
+    intention_creador.INTENCION,
+    intention_que_es_google_ads.INTENCION,
+    intention_bolivianismo.INTENCION,
+    intention_costo_google_ads.INTENCION,
     # detectar_proposito,
     # detectar_crear_anuncio
 ]
 
+# Pool de generacion: cada helper es un round trip bloqueante a OpenAI.
+_executor_intenciones = ThreadPoolExecutor(
+    max_workers=INTENCIONES_WORKERS,
+    thread_name_prefix="intenciones",
+)
+# Pool propio de la deteccion (clasificador y detectores): una llamada que se
+# pasa del plazo sigue ocupando su hilo hasta su propio timeout, y no debe
+# quitarle hilos a la generacion de respuestas del turno siguiente.
+_executor_deteccion = ThreadPoolExecutor(
+    max_workers=INTENCIONES_WORKERS,
+    thread_name_prefix="deteccion",
+)
+
+
+def _con_plazo(funcion, mensaje_usuario, limite, si_vencido):
+    """
+    Llama a un detector/clasificador con lo que queda del plazo del turno como
+    timeout de GPT (sin pasar el del tipo "deteccion"). Se calcula al empezar,
+    no al encolar; si el plazo ya vencio en la cola, ni siquiera llama.
+    """
+    restante = min(limite - time.monotonic(), LLM_TIMEOUTS_SEG["deteccion"])
+    if restante <= 0:
+        return si_vencido
+    return funcion(mensaje_usuario, timeout_seg=restante)
+
+
+# === CLASIFICADOR MULTI-ETIQUETA ===
+def _construir_prompt_clasificador(intenciones):
+    """Arma el prompt del clasificador a partir de las declaraciones del registro."""
+    bloques = []
+    for intencion in intenciones:
+        ejemplos_si = "; ".join(f"'{e}'" for e in intencion["ejemplos_si"])
+        ejemplos_no = "; ".join(f"'{e}'" for e in intencion["ejemplos_no"])
+        bloques.append(
+            f"- {intencion['etiqueta']}: {intencion['descripcion']}\n"
+            f"  Sí aplica: {ejemplos_si}\n"
+            f"  No aplica: {ejemplos_no}"
+        )
+    return (
+        "Eres un clasificador de intenciones multi-etiqueta. Tu tarea es analizar el siguiente mensaje "
+        "del usuario y decidir cuáles de estas etiquetas aplican:\n\n"
+        + "\n".join(bloques)
+        + "\n\n"
+        "Un mensaje puede tener varias etiquetas o ninguna.\n"
+        "Responde únicamente con un objeto JSON de la forma {\"intenciones\": [\"etiqueta\", ...]}, "
+        "usando solo las etiquetas de la lista. Si ninguna aplica, responde {\"intenciones\": []}."
+    )
+
+
+PROMPT_CLASIFICADOR = prefijo_estatico(
+    "clasificador_intenciones", GPT_MODEL_PRECISO, _construir_prompt_clasificador(INTENCIONES)
+)
+# Cambia automaticamente si cambia el registro (prompt) o la ruta de modelos.
+VERSION_CLASIFICADOR = intent_cache.version_prompt(PROMPT_CLASIFICADOR, RUTEO_MODELOS["deteccion"]["modelos"])
+
+
+def clasificar_intenciones(mensaje_usuario, timeout_seg=None):
+    """
+    Clasifica el mensaje contra todas las intenciones con una sola llamada a GPT.
+
+    Los resultados se cachean por texto normalizado + version del prompt, de
+    modo que los mensajes repetidos entre usuarios no vuelven a llamar a GPT.
+
+    Args:
+        mensaje_usuario: Texto entrante del usuario.
+        timeout_seg: Plazo de la llamada (por defecto, el del tipo "deteccion").
+
+    Returns:
+        Conjunto de etiquetas detectadas, o None si la llamada o el JSON fallan
+        (el caller puede recurrir a los detectores individuales).
+    """
+    cacheado = intent_cache.obtener("clasificador", VERSION_CLASIFICADOR, mensaje_usuario)
+    if cacheado is not None:
+        return set(cacheado)
+
+    prompt = [
+        {"role": "system", "content": PROMPT_CLASIFICADOR},
+        {"role": "user", "content": mensaje_usuario}
+    ]
+
+    try:
+        response = llm.completar(
+            tipo="deteccion",
+            timeout_seg=timeout_seg,
+            messages=prompt,
+            temperature=TEMPERATURA_INTENCIONES,
+            max_tokens=60,
+            response_format={"type": "json_object"},
+        )
+        contenido = response.choices[0].message.content.strip()
+        etiquetas = json.loads(contenido).get("intenciones", [])
+        validas = {i["etiqueta"] for i in INTENCIONES}
+        resultado = {e for e in etiquetas if isinstance(e, str) and e in validas}
+        # Solo se cachean respuestas validas; los errores devuelven None antes.
+        intent_cache.guardar("clasificador", VERSION_CLASIFICADOR, mensaje_usuario, sorted(resultado))
+        return resultado
+
+    except Exception as e:
+        print(f"[ERROR GPT - clasificador de intenciones] {e}")
+        return None
+
+
+# === EJECUCION EN PARALELO ===
+def _detectar_con_detectores(mensaje_usuario, etiquetas):
+    """
+    Ejecuta los detectores sí/no de las etiquetas dadas en paralelo, con un
+    plazo comun por turno.
+
+    Cada detector cachea su respuesta en intent_cache (texto normalizado +
+    version de su prompt), igual que el clasificador.
+
+    Returns:
+        Conjunto de etiquetas positivas. Los detectores que no terminan a
+        tiempo cuentan como "no"; su llamada a GPT recibe el mismo plazo como
+        timeout, asi que tampoco retienen el hilo mucho despues.
+    """
+    limite = time.monotonic() + INTENCIONES_DEADLINE_SEG
+    futures = {
+        _executor_deteccion.submit(_con_plazo, intencion["detector"], mensaje_usuario, limite, False): intencion["etiqueta"]
+        for intencion in INTENCIONES
+        if intencion["etiqueta"] in etiquetas
+    }
+    terminados, pendientes = wait(futures, timeout=INTENCIONES_DEADLINE_SEG)
+
+    for future in pendientes:
+        # Solo cancela los que no empezaron; los que corren cortan por timeout.
+        future.cancel()
+        print(f"[INTENCIONES] Detector '{futures[future]}' excedio el plazo de {INTENCIONES_DEADLINE_SEG}s")
+
+    # Los detectores ya capturan sus errores y devuelven False.
+    return {etiqueta for future, etiqueta in futures.items() if future in terminados and future.result()}
+
+
+def _detectar_intenciones(mensaje_usuario):
+    """
+    Detecta las intenciones del mensaje.
+
+    Primero aplica el prefiltro local (reglas + modelo TF-IDF); solo las
+    etiquetas ambiguas se escalan al clasificador multi-etiqueta (una sola
+    llamada) si esta habilitado, o a los detectores individuales en paralelo
+    si este falla.
+
+    Returns:
+        Lista de declaraciones INTENCION positivas, en el orden del registro.
+    """
+    inicio = time.monotonic()
+    positivas = set()
+    ambiguas = {intencion["etiqueta"] for intencion in INTENCIONES}
+    if PREFILTRO_LOCAL:
+        positivas, ambiguas = prefiltrar(mensaje_usuario, INTENCIONES)
+        print(f"[INTENCIONES] Prefiltro local: positivas={sorted(positivas)} ambiguas={sorted(ambiguas)}")
+
+    if ambiguas:
+        etiquetas = None
+        if INTENCIONES_CLASIFICADOR_UNICO:
+            limite = time.monotonic() + INTENCIONES_DEADLINE_SEG
+            future = _executor_deteccion.submit(_con_plazo, clasificar_intenciones, mensaje_usuario, limite, None)
+            try:
+                etiquetas = future.result(timeout=INTENCIONES_DEADLINE_SEG)
+            except FuturesTimeoutError:
+                print(f"[INTENCIONES] Clasificador excedio el plazo de {INTENCIONES_DEADLINE_SEG}s")
+                etiquetas = set()
+
+        if etiquetas is None:
+            etiquetas = _detectar_con_detectores(mensaje_usuario, ambiguas)
+
+        # Las etiquetas ya resueltas localmente no cambian por la respuesta de GPT.
+        positivas |= etiquetas & ambiguas
+
+    print(f"[INTENCIONES] Deteccion: {sorted(positivas)} en {time.monotonic() - inicio:.2f}s")
+    return [intencion for intencion in INTENCIONES if intencion["etiqueta"] in positivas]
+
+
+def _generar_respuesta_intencion(intencion, mensaje_usuario, numero_usuario):
+    """
+    Obtiene la respuesta de una intencion activada.
+
+    Las intenciones tipo FAQ (con cache_semantico_ttl_seg) consultan primero el
+    cache semantico; en caso de fallo se llama al helper. El cache se comparte
+    entre usuarios, asi que solo guarda respuestas "generica" (generadas sin
+    historial ni resumen): ni las personalizadas (podrian llevar el nombre del
+    negocio de otro usuario), ni el texto de respaldo (quedaria servido horas
+    despues de que GPT se recupere), ni las del pool (frase puente).
+    """
+    ttl = intencion.get("cache_semantico_ttl_seg")
+    if ttl:
+        cacheada = semantic_cache.buscar(intencion["etiqueta"], mensaje_usuario)
+        if cacheada is not None:
+            print(f"[CACHE SEMANTICO] Respuesta reutilizada para '{intencion['etiqueta']}'")
+            return cacheada
+
+    # Los helpers ya devuelven un texto de respaldo si falla GPT.
+    respuesta, origen = intencion["helper"](numero_usuario)
+    if ttl and origen == "generica":
+        semantic_cache.guardar(intencion["etiqueta"], mensaje_usuario, respuesta, ttl)
+    return respuesta
+
+
+def _generar_respuestas(positivas, mensaje_usuario, numero_usuario):
+    """Genera en paralelo las respuestas de los helpers activados (en orden del registro)."""
+    futures = [
+        _executor_intenciones.submit(
+            _generar_respuesta_intencion, intencion, mensaje_usuario, numero_usuario
+        )
+        for intencion in positivas
+    ]
+    return [future.result() for future in futures]
+
+
+# === RESPUESTA UNICA PARA VARIAS INTENCIONES ===
+# Prompt estatico (prefijo cacheable); las instrucciones de las intenciones
+# detectadas van despues como contexto, y luego el historial y el mensaje.
+PROMPT_MULTI_INTENCION = prefijo_estatico("respuesta_multi_intencion", GPT_MODEL_AVANZADO, (
+    "Eres Chatbot Ads Manager, un asistente conversacional diseñado para responder en WhatsApp "
+    "con tono cálido, claro y natural.\n\n"
+    "El usuario envió un solo mensaje que contiene múltiples preguntas o intenciones.\n"
+    "A continuación recibirás, para cada intención detectada, las instrucciones de cómo responderla, "
+    "luego el historial de conversación y por último el mensaje del usuario.\n\n"
+    "INSTRUCCIONES:\n"
+    "- Responde TODAS las intenciones en un solo mensaje fluido, conversacional y coherente.\n"
+    "- Cumple las instrucciones de cada intención, salvo el largo: el mensaje completo no debe pasar de 10 líneas visibles en WhatsApp.\n"
+    "- No repitas las preguntas del usuario.\n"
+    "- No inicies con saludos como 'Hola' o 'Buenos días' a menos que el usuario ya haya saludado previamente.\n"
+    "- El inicio del mensaje debe estar conectado al historial de conversación de manera natural.\n"
+    "- Usa transiciones naturales entre temas para que la respuesta no se sienta fragmentada.\n"
+    "- No uses listas a menos que sean realmente necesarias.\n"
+    "- Si el usuario ha preguntado algo que ya fue respondido antes, vuelve a explicarlo de forma natural, sin decir que ya se habló de eso."
+))
+
+
+def _generar_respuesta_multi_intencion(positivas, mensaje_usuario, numero_usuario, historial):
+    """
+    Responde varias intenciones con una sola llamada a GPT.
+
+    Reemplaza N llamadas a helpers (cada una releyendo el historial) mas la
+    fusion: las instrucciones de cada intencion se componen en un solo prompt.
+
+    Returns:
+        Texto de la respuesta combinada.
+
+    Raises:
+        Exception: Si la llamada falla o la respuesta llega vacia.
+    """
+    bloques = "\n\n".join(
+        f"### Intención '{intencion['etiqueta']}'\n{intencion['instrucciones']}"
+        for intencion in positivas
+    )
+    contexto = f"Intenciones detectadas en el mensaje:\n\n{bloques}"
+    historial, resumen = conversation_summary.preparar_contexto(numero_usuario, historial)
+    if resumen:
+        contexto = f"{contexto}\n\n{resumen}"
+    modelo = llm.elegir_modelo("fusion")
+    mensajes = construir_prompt(
+        PROMPT_MULTI_INTENCION, historial, modelo, mensaje_usuario, contexto=contexto
+    )
+    respuesta = llm.completar(
+        model=modelo,
+        tipo="fusion",
+        messages=mensajes,
+        temperature=TEMPERATURA_CONVERSACION,
+        max_tokens=400
+    ).choices[0].message.content.strip()
+    if not respuesta:
+        raise ValueError("respuesta vacia")
+    return respuesta
+
 
 # === ROUTER PRINCIPAL ===
+# Prompt estatico de la fusion (prefijo cacheable; el historial va despues).
+PROMPT_FUSIONADOR = prefijo_estatico("fusion_intenciones", GPT_MODEL_AVANZADO, (
+    "Eres Chatbot Ads Manager, un asistente conversacional diseñado para responder en WhatsApp "
+    "con tono cálido, claro y natural.\n\n"
+    "El usuario envió un solo mensaje que contiene múltiples preguntas o intenciones.\n"
+    "Tu tarea es combinar todas las respuestas detectadas en un solo mensaje fluido, conversacional y coherente por favor.\n\n"
+    "INSTRUCCIONES:\n"
+    "- Debes leer y tener en cuenta el historial de conversación que te daré a continuación.\n"
+    "- Luego recibirás una serie de ideas que debes comunicar, generadas por otros componentes del sistema.\n"
+    "- Tu misión es PARAFRASEAR esa información en un solo mensaje cálido, sin copiar literal el contenido.\n"
+    "- Es OBLIGATORIO que utilices toda la información de las respuestas detectadas.\n"
+    "- No repitas las preguntas del usuario.\n"
+    "- No inicies con saludos como 'Hola' o 'Buenos días' a menos que el usuario ya haya saludado previamente.\n"
+    "- El inicio del mensaje debe estar conectado al historial de conversación de manera natural por favor.\n"
+    "- Mantén el estilo de una conversación por WhatsApp: frases cortas, amigables y fáciles de leer.\n"
+    "- Usa transiciones naturales entre temas para que la respuesta no se sienta fragmentada.\n"
+    "- Si vas a dar ejemplos, asegúrate de que se entiendan fácilmente en el contexto boliviano (ej. tienda, ferretería, etc.).\n"
+    "- No uses listas a menos que sean realmente necesarias.\n"
+    "- No expliques demasiado. Sé claro, directo y cálido.\n"
+    "- Siempre prioriza continuidad con el historial reciente.\n"
+    "- Si el usuario ha preguntado algo que ya fue respondido antes, vuelve a explicarlo de forma natural, sin decir que ya se habló de eso."
+))
+
+
 def preparar_historial_con_inyeccion(mensaje_usuario, numero_usuario):
     """
     Detecta intenciones en el mensaje del usuario y prepara el historial.
@@ -48,10 +365,14 @@ def preparar_historial_con_inyeccion(mensaje_usuario, numero_usuario):
 
     Flujo:
         - Lee historial y deduplica por (role, content.strip()).
-        - Ejecuta intenciones y recolecta respuestas.
+        - Resuelve los casos obvios con el prefiltro local y escala los
+          ambiguos al clasificador multi-etiqueta (o a los detectores en
+          paralelo como respaldo).
         - 0 intenciones: solo actualiza historial si no es duplicado.
-        - 1 intencion: devuelve respuesta directa.
-        - N intenciones: fusiona respuestas con GPT usando contexto reciente.
+        - 1 intencion: devuelve la respuesta directa de su helper.
+        - N intenciones: una sola llamada responde todas con las instrucciones
+          de cada helper (o, con INTENCIONES_GENERACION_UNICA desactivado,
+          helpers en paralelo y fusion con GPT).
     """
     historial = leer_historial(numero_usuario)
 
@@ -62,22 +383,18 @@ def preparar_historial_con_inyeccion(mensaje_usuario, numero_usuario):
         if (clave := (m["role"], m["content"].strip())) not in vistos and not vistos.add(clave)
     ]
 
-    respuestas_detectadas = []
-
     # Intenciones silenciosas (no responden, solo registran)
     # detectar_nombre_usuario(mensaje_usuario, numero_usuario)      # Guarda el nombre del usuario si se detecta
     # detectar_ciudad_empresa(mensaje_usuario, numero_usuario)      # Guarda la ciudad o departamento si se detecta
     # detectar_nombre_empresa(mensaje_usuario, numero_usuario)      # Guarda el nombre del negocio si se detecta
 
     # Intenciones con respuesta visible
-    for funcion in INTENCIONES:
-        resultado = funcion(mensaje_usuario, numero_usuario)
-        if resultado:
-            print(f"[INTENCIÓN ACTIVADA] {funcion.__name__} → {mensaje_usuario}")
-            respuestas_detectadas.append(resultado["respuesta"])
+    positivas = _detectar_intenciones(mensaje_usuario)
+    for intencion in positivas:
+        print(f"[INTENCIÓN ACTIVADA] {intencion['etiqueta']} → {mensaje_usuario}")
 
     # 0 intenciones: solo historial (evita duplicar ultimo user)
-    if not respuestas_detectadas:
+    if not positivas:
         if (
             not historial
             or historial[-1]["role"] != "user"
@@ -89,49 +406,45 @@ def preparar_historial_con_inyeccion(mensaje_usuario, numero_usuario):
         }
 
     # 1 intencion: respuesta directa
-    if len(respuestas_detectadas) == 1:
+    if len(positivas) == 1:
         return {
-            "respuesta_directa": respuestas_detectadas[0],
+            "respuesta_directa": _generar_respuestas(positivas, mensaje_usuario, numero_usuario)[0],
             "historial": historial
         }
 
-    # N intenciones: fusion con GPT usando contexto reciente
-    # Contexto corto para mantener continuidad conversacional
-    ultimos_usuario = [m for m in historial if m["role"] == "user"][-6:]
-    ultimos_chatbot = [m for m in historial if m["role"] == "assistant"][-6:]
-    historial_reciente = sorted(ultimos_usuario + ultimos_chatbot, key=lambda x: x.get("timestamp", ""))
+    # N intenciones: una sola llamada con las instrucciones de todas
+    if INTENCIONES_GENERACION_UNICA:
+        try:
+            return {
+                "respuesta_directa": _generar_respuesta_multi_intencion(
+                    positivas, mensaje_usuario, numero_usuario, historial
+                ),
+                "historial": historial
+            }
+        except Exception as e:
+            print(f"[ERROR GPT - respuesta multi-intención] {e}")
+            return {
+                "respuesta_directa": (
+                    "Lo siento, ocurrió un problema al generar la respuesta. "
+                    "¿Podrías repetir tu mensaje mientras lo soluciono?"),
+                "historial": historial
+            }
 
+    # Sin generacion unica: helpers en paralelo y fusion con GPT
+    respuestas_detectadas = _generar_respuestas(positivas, mensaje_usuario, numero_usuario)
     partes_respuesta = "\n".join(f"{i+1}. {r}" for i, r in enumerate(respuestas_detectadas))
 
-    prompt_fusionador = [
-        {"role": "system", "content": (
-            "Eres Chatbot Ads Manager, un asistente conversacional diseñado para responder en WhatsApp "
-            "con tono cálido, claro y natural.\n\n"
-            "El usuario envió un solo mensaje que contiene múltiples preguntas o intenciones.\n"
-            "Tu tarea es combinar todas las respuestas detectadas en un solo mensaje fluido, conversacional y coherente por favor.\n\n"
-            "INSTRUCCIONES:\n"
-            "- Debes leer y tener en cuenta el historial de conversación que te daré a continuación.\n"
-            "- Luego recibirás una serie de ideas que debes comunicar, generadas por otros componentes del sistema.\n"
-            "- Tu misión es PARAFRASEAR esa información en un solo mensaje cálido, sin copiar literal el contenido.\n"
-            "- Es OBLIGATORIO que utilices toda la información de las respuestas detectadas.\n"
-            "- No repitas las preguntas del usuario.\n"
-            "- No inicies con saludos como 'Hola' o 'Buenos días' a menos que el usuario ya haya saludado previamente.\n"
-            "- El inicio del mensaje debe estar conectado al historial de conversación de manera natural por favor.\n"
-            "- Mantén el estilo de una conversación por WhatsApp: frases cortas, amigables y fáciles de leer.\n"
-            "- Usa transiciones naturales entre temas para que la respuesta no se sienta fragmentada.\n"
-            "- Si vas a dar ejemplos, asegúrate de que se entiendan fácilmente en el contexto boliviano (ej. tienda, ferretería, etc.).\n"
-            "- No uses listas a menos que sean realmente necesarias.\n"
-            "- No expliques demasiado. Sé claro, directo y cálido.\n"
-            "- Siempre prioriza continuidad con el historial reciente.\n"
-            "- Si el usuario ha preguntado algo que ya fue respondido antes, vuelve a explicarlo de forma natural, sin decir que ya se habló de eso."
-        )}
-    ]
-    prompt_fusionador.extend(historial_reciente)
-    prompt_fusionador.append({"role": "user", "content": partes_respuesta})
+    # Historial reciente dentro del presupuesto de tokens; las ideas van al final
+    historial_prompt, resumen = conversation_summary.preparar_contexto(numero_usuario, historial)
+    modelo = llm.elegir_modelo("fusion")
+    prompt_fusionador = construir_prompt(
+        PROMPT_FUSIONADOR, historial_prompt, modelo, partes_respuesta, contexto=resumen
+    )
 
     try:
-        respuesta_fusionada = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        respuesta_fusionada = llm.completar(
+            model=modelo,
+            tipo="fusion",
             messages=prompt_fusionador,
             temperature=TEMPERATURA_CONVERSACION,
             max_tokens=400
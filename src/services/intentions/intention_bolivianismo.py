@@ -1,51 +1,66 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_INTENCIONES
-from src.services.helpers.helper_bolivianismo import obtener_respuesta_bolivianismo
+from src.config import RUTEO_MODELOS, TEMPERATURA_INTENCIONES
+from src.services import intent_cache, llm
+from src.services.helpers.helper_bolivianismo import PROMPT_SISTEMA, obtener_respuesta_bolivianismo
 
-def contiene_bolivianismo_comercial(mensaje_usuario):
+# Prompt del detector si/no (fallback del clasificador multi-etiqueta).
+PROMPT_DETECTOR = (
+    "Eres un detector de intenciones culturales. Tu tarea es analizar si el siguiente mensaje del usuario "
+    "usa palabras o expresiones características del español hablado en Bolivia, especialmente en contextos de comercio, ferias, "
+    "mercados o trato popular. Detecta si aparecen términos como:\n\n"
+    "- caserito, caserita\n"
+    "- feria, feriante\n"
+    "- pahuichi\n"
+    "- boliche, bolichero(a)\n"
+    "- almacén, almacenero(a), abarrotero(a)\n"
+    "- chola, birlocha (como comerciante)\n"
+    "- chalona, charque\n"
+    "- yapa, vendaje\n"
+    "- semillería\n"
+    "- chingana\n"
+    "- trufi\n"
+    "- changuito (cuando es contexto comercial o familiar)\n\n"
+    "Responde únicamente con 'sí' o 'no'.\n\n"
+    "Ejemplos:\n"
+    "Usuario: 'Tengo un pahuichi en El Alto y quiero vender más'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Cómo hago publicidad para mi almacén?'\nRespuesta: 'sí'\n"
+    "Usuario: 'Vendo chalona y queso en la feria'\nRespuesta: 'sí'\n"
+    "Usuario: 'Trabajo en una empresa de tecnología'\nRespuesta: 'no'\n"
+    "Usuario: '¿Qué tarjeta necesito para publicar?'\nRespuesta: 'no'\n"
+    "Usuario: 'Mi esposa es caserita en la Rodríguez y quiere vender más'\nRespuesta: 'sí'\n"
+    "Ahora analiza el siguiente mensaje."
+)
+# Cambia si cambia el prompt o la ruta de modelos: invalida el cache.
+VERSION_DETECTOR = intent_cache.version_prompt(PROMPT_DETECTOR, RUTEO_MODELOS["deteccion"]["modelos"])
+
+
+def contiene_bolivianismo_comercial(mensaje_usuario, timeout_seg=None):
     """
     Detecta si el mensaje contiene bolivianismos relacionados con el comercio o contexto cultural boliviano.
     Usa GPT para evaluar si el lenguaje usado es típico de Bolivia (feria, caserita, pahuichi, etc.).
     """
 
+    cacheado = intent_cache.obtener("detector_bolivianismo", VERSION_DETECTOR, mensaje_usuario)
+    if cacheado is not None:
+        return cacheado
+
     prompt = [
-        {"role": "system", "content": (
-            "Eres un detector de intenciones culturales. Tu tarea es analizar si el siguiente mensaje del usuario "
-            "usa palabras o expresiones características del español hablado en Bolivia, especialmente en contextos de comercio, ferias, "
-            "mercados o trato popular. Detecta si aparecen términos como:\n\n"
-            "- caserito, caserita\n"
-            "- feria, feriante\n"
-            "- pahuichi\n"
-            "- boliche, bolichero(a)\n"
-            "- almacén, almacenero(a), abarrotero(a)\n"
-            "- chola, birlocha (como comerciante)\n"
-            "- chalona, charque\n"
-            "- yapa, vendaje\n"
-            "- semillería\n"
-            "- chingana\n"
-            "- trufi\n"
-            "- changuito (cuando es contexto comercial o familiar)\n\n"
-            "Responde únicamente con 'sí' o 'no'.\n\n"
-            "Ejemplos:\n"
-            "Usuario: 'Tengo un pahuichi en El Alto y quiero vender más'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Cómo hago publicidad para mi almacén?'\nRespuesta: 'sí'\n"
-            "Usuario: 'Vendo chalona y queso en la feria'\nRespuesta: 'sí'\n"
-            "Usuario: 'Trabajo en una empresa de tecnología'\nRespuesta: 'no'\n"
-            "Usuario: '¿Qué tarjeta necesito para publicar?'\nRespuesta: 'no'\n"
-            "Usuario: 'Mi esposa es caserita en la Rodríguez y quiere vender más'\nRespuesta: 'sí'\n"
-            "Ahora analiza el siguiente mensaje."
-        )},
+        {"role": "system", "content": PROMPT_DETECTOR},
         {"role": "user", "content": mensaje_usuario}
     ]
 
     try:
-        response = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        response = llm.completar(
+            tipo="deteccion",
+            timeout_seg=timeout_seg,
             messages=prompt,
             temperature=TEMPERATURA_INTENCIONES,
             max_tokens=3
         )
         respuesta = response.choices[0].message.content.strip().lower()
-        return "sí" in respuesta
+        resultado = "sí" in respuesta
+        # Solo se cachean respuestas de GPT; los errores devuelven False sin guardar.
+        intent_cache.guardar("detector_bolivianismo", VERSION_DETECTOR, mensaje_usuario, resultado)
+        return resultado
 
     except Exception as e:
         print(f"[ERROR GPT - intención 'bolivianismo'] No se pudo procesar la intención: {e}")
@@ -58,7 +73,7 @@ def detectar_bolivianismo(mensaje, numero):
     """
     if contiene_bolivianismo_comercial(mensaje):
         print(f"[INTENCIÓN ACTIVADA] detectar_bolivianismo → {mensaje}")
-        respuesta = obtener_respuesta_bolivianismo(numero)
+        respuesta, _ = obtener_respuesta_bolivianismo(numero)
         return {
             "respuesta": respuesta,
             "inyectar_como": "assistant"
@@ -66,6 +81,35 @@ def detectar_bolivianismo(mensaje, numero):
     return None
 
 
+# === DECLARACION PARA EL REGISTRO DE INTENCIONES ===
+# El router arma el prompt del clasificador multi-etiqueta a partir de estos datos.
+INTENCION = {
+    "etiqueta": "bolivianismo",
+    "descripcion": (
+        "Usa expresiones del español de Bolivia en contexto de comercio, ferias, mercados o trato popular "
+        "(caserito/a, feria, feriante, pahuichi, boliche, almacén, abarrotero/a, chola o birlocha como "
+        "comerciante, chalona, charque, yapa, vendaje, semillería, chingana, trufi, changuito)."
+    ),
+    "ejemplos_si": [
+        "Tengo un pahuichi en El Alto y quiero vender más",
+        "Vendo chalona y queso en la feria",
+        "Mi esposa es caserita en la Rodríguez y quiere vender más",
+    ],
+    "ejemplos_no": ["Trabajo en una empresa de tecnología", "¿Qué tarjeta necesito para publicar?"],
+    # Prefiltro local: lemas que escalan a GPT aunque el modelo diga que no
+    # (una palabra suelta no alcanza para un positivo sin GPT).
+    "lemas_clave": [
+        "caserito", "caserita", "feria", "feriante", "pahuichi", "boliche", "bolichero", "bolichera",
+        "almacen", "almacenero", "almacenera", "abarrotero", "abarrotera", "chalona", "charque",
+        "yapa", "semilleria", "chingana", "trufi",
+    ],
+    "detector": contiene_bolivianismo_comercial,
+    "helper": obtener_respuesta_bolivianismo,
+    # Instrucciones del helper para la respuesta unica con varias intenciones.
+    "instrucciones": PROMPT_SISTEMA,
+}
+
+
 
 
 
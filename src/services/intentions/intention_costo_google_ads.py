@@ -1,39 +1,54 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_INTENCIONES
-from src.services.helpers.helper_costo_google_ads import obtener_respuesta_costo_google_ads
+from src.config import RUTEO_MODELOS, TEMPERATURA_INTENCIONES
+from src.services import intent_cache, llm
+from src.services.helpers.helper_costo_google_ads import PROMPT_SISTEMA, obtener_respuesta_costo_google_ads
 
-def es_pregunta_sobre_costo_google_ads(mensaje_usuario):
+# Prompt del detector si/no (fallback del clasificador multi-etiqueta).
+PROMPT_DETECTOR = (
+    "Eres un detector de intenciones. Tu tarea es analizar el siguiente mensaje del usuario y determinar "
+    "si está preguntando por el costo, precio o cuánto se debe pagar para utilizar Google Ads. "
+    "Considera variantes como: cuánto cuesta, qué precio tiene, es caro, es costoso, qué se paga, cuánto debo pagar, o cuánto se invierte. "
+    "Responde únicamente con 'sí' o 'no'.\n\n"
+    "Ejemplos:\n"
+    "Usuario: '¿Cuánto cuesta usar Google Ads?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Debo pagar algo para anunciar?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Qué precio tiene Google Ads?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Es muy caro anunciar en Google?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Qué es Google Ads?'\nRespuesta: 'no'\n"
+    "Usuario: '¿Quién te creó?'\nRespuesta: 'no'\n"
+    "Ahora analiza el siguiente mensaje."
+)
+# Cambia si cambia el prompt o la ruta de modelos: invalida el cache.
+VERSION_DETECTOR = intent_cache.version_prompt(PROMPT_DETECTOR, RUTEO_MODELOS["deteccion"]["modelos"])
+
+
+def es_pregunta_sobre_costo_google_ads(mensaje_usuario, timeout_seg=None):
     """
     Esta función determina si el mensaje del usuario está preguntando cuánto cuesta usar Google Ads.
     Usa GPT para evaluar la intención y responder con 'sí' o 'no'.
     """
 
+    cacheado = intent_cache.obtener("detector_costo_google_ads", VERSION_DETECTOR, mensaje_usuario)
+    if cacheado is not None:
+        return cacheado
+
     prompt = [
-        {"role": "system", "content": (
-            "Eres un detector de intenciones. Tu tarea es analizar el siguiente mensaje del usuario y determinar "
-            "si está preguntando por el costo, precio o cuánto se debe pagar para utilizar Google Ads. "
-            "Considera variantes como: cuánto cuesta, qué precio tiene, es caro, es costoso, qué se paga, cuánto debo pagar, o cuánto se invierte. "
-            "Responde únicamente con 'sí' o 'no'.\n\n"
-            "Ejemplos:\n"
-            "Usuario: '¿Cuánto cuesta usar Google Ads?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Debo pagar algo para anunciar?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Qué precio tiene Google Ads?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Es muy caro anunciar en Google?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Qué es Google Ads?'\nRespuesta: 'no'\n"
-            "Usuario: '¿Quién te creó?'\nRespuesta: 'no'\n"
-            "Ahora analiza el siguiente mensaje."
-        )},
+        {"role": "system", "content": PROMPT_DETECTOR},
         {"role": "user", "content": mensaje_usuario}
     ]
 
     try:
-        response = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        response = llm.completar(
+            tipo="deteccion",
+            timeout_seg=timeout_seg,
             messages=prompt,
             temperature=TEMPERATURA_INTENCIONES,
             max_tokens=3
         )
         respuesta = response.choices[0].message.content.strip().lower()
-        return "sí" in respuesta
+        resultado = "sí" in respuesta
+        # Solo se cachean respuestas de GPT; los errores devuelven False sin guardar.
+        intent_cache.guardar("detector_costo_google_ads", VERSION_DETECTOR, mensaje_usuario, resultado)
+        return resultado
 
     except Exception as e:
         print(f"[ERROR GPT - intención 'costo google ads'] No se pudo procesar la intención: {e}")
@@ -47,9 +62,33 @@ def detectar_costo_google_ads(mensaje, numero):
     """
     if es_pregunta_sobre_costo_google_ads(mensaje):
         print(f"[INTENCIÓN ACTIVADA] detectar_costo_google_ads → {mensaje}")
-        respuesta = obtener_respuesta_costo_google_ads(numero)
+        respuesta, _ = obtener_respuesta_costo_google_ads(numero)
         return {
             "respuesta": respuesta,
             "inyectar_como": "assistant"
         }
     return None
+
+
+# === DECLARACION PARA EL REGISTRO DE INTENCIONES ===
+# El router arma el prompt del clasificador multi-etiqueta a partir de estos datos.
+INTENCION = {
+    "etiqueta": "costo_google_ads",
+    "descripcion": (
+        "Pregunta por el costo, precio o cuánto se paga o invierte para usar Google Ads "
+        "(cuánto cuesta, es caro, qué se paga)."
+    ),
+    "ejemplos_si": ["¿Cuánto cuesta usar Google Ads?", "¿Debo pagar algo para anunciar?", "¿Es muy caro anunciar en Google?"],
+    "ejemplos_no": ["¿Qué es Google Ads?", "¿Quién te creó?"],
+    # Prefiltro local: patrones sobre texto normalizado (sin acentos ni puntuacion).
+    "patrones": [
+        r"\bcuanto (cuesta|cobra|vale|sale|se paga|hay que pagar)\b.*\b(google|ads|anunci\w*|publicidad|publicitar)\b",
+        r"\b(es|sera) (muy )?(caro|costoso) (anunciar|publicitar|google ads)\b",
+    ],
+    "detector": es_pregunta_sobre_costo_google_ads,
+    "helper": obtener_respuesta_costo_google_ads,
+    # Instrucciones del helper para la respuesta unica con varias intenciones.
+    "instrucciones": PROMPT_SISTEMA,
+    # Respuesta tipo FAQ: se reutiliza via cache semantico durante este tiempo.
+    "cache_semantico_ttl_seg": 12 * 3600,
+}
@@ -1,7 +1,27 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_INTENCIONES
-from src.services.helpers.helper_creador import obtener_respuesta_creador_dinamica
-
-def es_pregunta_sobre_creador(mensaje_usuario):
+from src.config import RUTEO_MODELOS, TEMPERATURA_INTENCIONES
+from src.services import intent_cache, llm
+from src.services.helpers.helper_creador import PROMPT_SISTEMA, obtener_respuesta_creador_dinamica
+
+# Prompt del detector si/no (fallback del clasificador multi-etiqueta).
+PROMPT_DETECTOR = (
+    "Eres un detector de intenciones. Tu tarea es analizar el siguiente mensaje del usuario y determinar "
+    "si está preguntando sobre el creador, diseñador, programador, desarrollador, inventor, autor o cualquier persona que haya construido este chatbot. "
+    "También considera formas informales como: papá del bot, hacedor, quien lo hizo, quien lo montó, o dueño del chatbot. "
+    "Responde únicamente con 'sí' o 'no'.\n\n"
+    "Ejemplos:\n"
+    "Usuario: '¿Quién te creó?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Quién es tu papá?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Quién fue tu hacedor?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Quién te montó?'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Cómo funciona Google Ads?'\nRespuesta: 'no'\n"
+    "Usuario: '¿Qué presupuesto necesito para una campaña?'\nRespuesta: 'no'\n"
+    "Ahora analiza el siguiente mensaje."
+)
+# Cambia si cambia el prompt o la ruta de modelos: invalida el cache.
+VERSION_DETECTOR = intent_cache.version_prompt(PROMPT_DETECTOR, RUTEO_MODELOS["deteccion"]["modelos"])
+
+
+def es_pregunta_sobre_creador(mensaje_usuario, timeout_seg=None):
     """
     Esta función determina si el mensaje del usuario es una pregunta sobre quién creó el chatbot.
 
@@ -10,34 +30,29 @@ def es_pregunta_sobre_creador(mensaje_usuario):
     GPT evaluará la intención y responderá 'sí' o 'no'.
     """
 
+    cacheado = intent_cache.obtener("detector_creador", VERSION_DETECTOR, mensaje_usuario)
+    if cacheado is not None:
+        return cacheado
+
     prompt = [
-        {"role": "system", "content": (
-            "Eres un detector de intenciones. Tu tarea es analizar el siguiente mensaje del usuario y determinar "
-            "si está preguntando sobre el creador, diseñador, programador, desarrollador, inventor, autor o cualquier persona que haya construido este chatbot. "
-            "También considera formas informales como: papá del bot, hacedor, quien lo hizo, quien lo montó, o dueño del chatbot. "
-            "Responde únicamente con 'sí' o 'no'.\n\n"
-            "Ejemplos:\n"
-            "Usuario: '¿Quién te creó?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Quién es tu papá?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Quién fue tu hacedor?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Quién te montó?'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Cómo funciona Google Ads?'\nRespuesta: 'no'\n"
-            "Usuario: '¿Qué presupuesto necesito para una campaña?'\nRespuesta: 'no'\n"
-            "Ahora analiza el siguiente mensaje."
-        )},
+        {"role": "system", "content": PROMPT_DETECTOR},
         {"role": "user", "content": mensaje_usuario}
     ]
 
 
     try:
-        response = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        response = llm.completar(
+            tipo="deteccion",
+            timeout_seg=timeout_seg,
             messages=prompt,
             temperature=TEMPERATURA_INTENCIONES,
             max_tokens=3
         )
         respuesta = response.choices[0].message.content.strip().lower()
-        return "sí" in respuesta
+        resultado = "sí" in respuesta
+        # Solo se cachean respuestas de GPT; los errores devuelven False sin guardar.
+        intent_cache.guardar("detector_creador", VERSION_DETECTOR, mensaje_usuario, resultado)
+        return resultado
 
     except Exception as e:
         print(f"[ERROR GPT - intención 'creador'] No se pudo procesar la intención: {e}")
@@ -51,7 +66,7 @@ def detectar_creador(mensaje, numero):
     """
     if es_pregunta_sobre_creador(mensaje):
         print(f"[INTENCIÓN ACTIVADA] detectar_creador → {mensaje}")
-        respuesta = obtener_respuesta_creador_dinamica(numero)
+        respuesta, _ = obtener_respuesta_creador_dinamica(numero)
         return {
             "respuesta": respuesta,
             "inyectar_como": "assistant"
@@ -59,6 +74,36 @@ def detectar_creador(mensaje, numero):
     return None
 
 
+# === DECLARACION PARA EL REGISTRO DE INTENCIONES ===
+# El router arma el prompt del clasificador multi-etiqueta a partir de estos datos.
+INTENCION = {
+    "etiqueta": "creador",
+    "descripcion": (
+        "Pregunta sobre el creador, diseñador, programador, desarrollador, inventor, autor o dueño "
+        "de este chatbot, incluidas formas informales (papá del bot, hacedor, quién lo montó)."
+    ),
+    "ejemplos_si": ["¿Quién te creó?", "¿Quién es tu papá?", "¿Quién te montó?"],
+    "ejemplos_no": ["¿Cómo funciona Google Ads?", "¿Qué presupuesto necesito para una campaña?"],
+    # Prefiltro local sobre texto normalizado (sin acentos ni puntuacion).
+    # Patrones: preguntas completas, positivo sin GPT. Lemas e indicios solo
+    # escalan a GPT ("soy creador de contenido", "tu dueno del local").
+    "patrones": [
+        r"\bquien(es)? te (creo|crearon|hizo|hicieron|programo|programaron|desarrollo|diseno|invento|monto)\b",
+        r"\bquien(es)? (es|son|fue|fueron) tus? (creador|creadores|papa|programador|programadores|desarrollador|desarrolladores|inventor|hacedor|dueno)\b",
+    ],
+    "lemas_clave": ["creador"],
+    "indicios": [
+        r"\btu (creador|papa|programador|desarrollador|inventor|hacedor|dueno)\b",
+    ],
+    "detector": es_pregunta_sobre_creador,
+    "helper": obtener_respuesta_creador_dinamica,
+    # Instrucciones del helper para la respuesta unica con varias intenciones.
+    "instrucciones": PROMPT_SISTEMA,
+    # Respuesta tipo FAQ: se reutiliza via cache semantico durante este tiempo.
+    "cache_semantico_ttl_seg": 24 * 3600,
+}
+
+
 
 '''
 from src.config import openai_client, GPT_MODEL_PRECISO, TEMPERATURA_INTENCIONES
@@ -1,38 +1,53 @@
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_INTENCIONES
-from src.services.helpers.helper_que_es_google_ads import obtener_respuesta_que_es_google_ads
-
-def es_pregunta_sobre_google_ads(mensaje_usuario):
+from src.config import RUTEO_MODELOS, TEMPERATURA_INTENCIONES
+from src.services import intent_cache, llm
+from src.services.helpers.helper_que_es_google_ads import PROMPT_SISTEMA, obtener_respuesta_que_es_google_ads
+
+# Prompt del detector si/no (fallback del clasificador multi-etiqueta).
+PROMPT_DETECTOR = (
+    "Eres un detector de intenciones. Tu tarea es analizar el siguiente mensaje del usuario y determinar "
+    "si está preguntando qué es Google Ads o solicita una explicación básica sobre esta plataforma publicitaria. "
+    "Considera variantes como: qué es google ads, cómo funciona google ads, para qué sirve google ads o si alguien quiere que se lo expliques respecto a google ads. "
+    "Responde únicamente con 'sí' o 'no'.\n\n"
+    "Ejemplos:\n"
+    "Usuario: '¿Qué es Google Ads?'\nRespuesta: 'sí'\n"
+    "Usuario: 'Explícame cómo funciona Google Ads'\nRespuesta: 'sí'\n"
+    "Usuario: 'Para qué sirve Google Ads'\nRespuesta: 'sí'\n"
+    "Usuario: '¿Quién te creó?'\nRespuesta: 'no'\n"
+    "Usuario: '¿Qué tarjeta necesito?'\nRespuesta: 'no'\n"
+    "Ahora analiza el siguiente mensaje."
+)
+# Cambia si cambia el prompt o la ruta de modelos: invalida el cache.
+VERSION_DETECTOR = intent_cache.version_prompt(PROMPT_DETECTOR, RUTEO_MODELOS["deteccion"]["modelos"])
+
+
+def es_pregunta_sobre_google_ads(mensaje_usuario, timeout_seg=None):
     """
     Esta función determina si el mensaje del usuario está preguntando qué es Google Ads.
     Usa GPT para evaluar la intención y responder con 'sí' o 'no'.
     """
 
+    cacheado = intent_cache.obtener("detector_que_es_google_ads", VERSION_DETECTOR, mensaje_usuario)
+    if cacheado is not None:
+        return cacheado
+
     prompt = [
-        {"role": "system", "content": (
-            "Eres un detector de intenciones. Tu tarea es analizar el siguiente mensaje del usuario y determinar "
-            "si está preguntando qué es Google Ads o solicita una explicación básica sobre esta plataforma publicitaria. "
-            "Considera variantes como: qué es google ads, cómo funciona google ads, para qué sirve google ads o si alguien quiere que se lo expliques respecto a google ads. "
-            "Responde únicamente con 'sí' o 'no'.\n\n"
-            "Ejemplos:\n"
-            "Usuario: '¿Qué es Google Ads?'\nRespuesta: 'sí'\n"
-            "Usuario: 'Explícame cómo funciona Google Ads'\nRespuesta: 'sí'\n"
-            "Usuario: 'Para qué sirve Google Ads'\nRespuesta: 'sí'\n"
-            "Usuario: '¿Quién te creó?'\nRespuesta: 'no'\n"
-            "Usuario: '¿Qué tarjeta necesito?'\nRespuesta: 'no'\n"
-            "Ahora analiza el siguiente mensaje."
-        )},
+        {"role": "system", "content": PROMPT_DETECTOR},
         {"role": "user", "content": mensaje_usuario}
     ]
 
     try:
-        response = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        response = llm.completar(
+            tipo="deteccion",
+            timeout_seg=timeout_seg,
             messages=prompt,
             temperature=TEMPERATURA_INTENCIONES,
             max_tokens=3
         )
         respuesta = response.choices[0].message.content.strip().lower()
-        return "sí" in respuesta
+        resultado = "sí" in respuesta
+        # Solo se cachean respuestas de GPT; los errores devuelven False sin guardar.
+        intent_cache.guardar("detector_que_es_google_ads", VERSION_DETECTOR, mensaje_usuario, resultado)
+        return resultado
 
     except Exception as e:
         print(f"[ERROR GPT - intención 'google ads'] No se pudo procesar la intención: {e}")
@@ -46,7 +61,7 @@ def detectar_que_es_google_ads(mensaje, numero):
     """
     if es_pregunta_sobre_google_ads(mensaje):
         print(f"[INTENCIÓN ACTIVADA] detectar_que_es_google_ads → {mensaje}")
-        respuesta = obtener_respuesta_que_es_google_ads(numero)
+        respuesta, _ = obtener_respuesta_que_es_google_ads(numero)
         return {
             "respuesta": respuesta,
             "inyectar_como": "assistant"
@@ -54,6 +69,31 @@ def detectar_que_es_google_ads(mensaje, numero):
     return None
 
 
+# === DECLARACION PARA EL REGISTRO DE INTENCIONES ===
+# El router arma el prompt del clasificador multi-etiqueta a partir de estos datos.
+INTENCION = {
+    "etiqueta": "que_es_google_ads",
+    "descripcion": (
+        "Pregunta qué es Google Ads o pide una explicación básica de la plataforma: "
+        "qué es, cómo funciona o para qué sirve."
+    ),
+    "ejemplos_si": ["¿Qué es Google Ads?", "Explícame cómo funciona Google Ads", "Para qué sirve Google Ads"],
+    "ejemplos_no": ["¿Quién te creó?", "¿Qué tarjeta necesito?"],
+    # Prefiltro local: patrones sobre texto normalizado (sin acentos ni puntuacion).
+    "patrones": [
+        r"\bque es (el |la )?google ads\b",
+        r"\bcomo funciona (el |la )?google ads\b",
+        r"\bpara que sirve (el |la )?google ads\b",
+    ],
+    "detector": es_pregunta_sobre_google_ads,
+    "helper": obtener_respuesta_que_es_google_ads,
+    # Instrucciones del helper para la respuesta unica con varias intenciones.
+    "instrucciones": PROMPT_SISTEMA,
+    # Respuesta tipo FAQ: se reutiliza via cache semantico durante este tiempo.
+    "cache_semantico_ttl_seg": 24 * 3600,
+}
+
+
 
 
 
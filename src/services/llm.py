@@ -0,0 +1,827 @@
+"""
+Puerta de entrada unica a OpenAI para todo el servicio.
+
+Intenciones, helpers, generar_respuesta, la fusion y el agente de campanas
+llaman a completar() en lugar de usar openai_client directamente. Cada llamada:
+
+- Tiene un plazo total segun su tipo (LLM_TIMEOUTS_SEG) que cubre la espera de
+  cupo, cada intento y los reintentos.
+- Reintenta timeouts, errores de conexion, 429 y 5xx con backoff exponencial y
+  jitter completo, sin pasarse del plazo.
+- Respeta un limite global de llamadas en vuelo (LLM_MAX_EN_VUELO).
+- Pasa por un circuit breaker: tras LLM_CIRCUITO_FALLOS fallos seguidos el
+  circuito se abre y las llamadas fallan de inmediato durante el
+  enfriamiento; luego una sola llamada de prueba decide si se cierra.
+
+Ante cualquier fallo se lanza LLMNoDisponible y el llamador usa su respuesta
+de respaldo de siempre, sin bloquear el worker. Los tokens de prompt y de
+respuesta de cada llamada (y los servidos desde el cache de prefijos del
+proveedor) se reportan en el log y se acumulan por tipo.
+
+Con LLM_HEDGING activo, las llamadas de LLM_HEDGING_TIPOS (generar_respuesta
+y el agente) se cubren contra la cola lenta: si no respondieron tras el
+percentil LLM_HEDGING_PERCENTIL de la latencia reciente de su modelo, se lanza
+un duplicado y se usa la primera respuesta. Ambas llamadas van en streaming
+para poder cancelar la perdedora: al haber ganador se devuelve su cupo en
+vuelo y se cierra su conexion (no se graba ni cuenta como exito). Los
+duplicados se limitan a LLM_HEDGING_MAX_TASA de las llamadas cubiertas.
+"""
+
+import hashlib
+import json
+import random
+import socket
+import threading
+import math
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import openai
+
+from src.config import (
+    CACHE_DETERMINISTA_MAX_ENTRADAS,
+    CACHE_DETERMINISTA_TTL_SEG,
+    LLM_BACKOFF_BASE_SEG,
+    LLM_BACKOFF_MAX_SEG,
+    LLM_CIRCUITO_ENFRIAMIENTO_SEG,
+    LLM_CIRCUITO_FALLOS,
+    LLM_GRABAR_RESPUESTAS,
+    LLM_HEDGING,
+    LLM_HEDGING_DEMORA_DEFECTO_SEG,
+    LLM_HEDGING_DEMORA_MIN_SEG,
+    LLM_HEDGING_MAX_TASA,
+    LLM_HEDGING_PERCENTIL,
+    LLM_HEDGING_TIPOS,
+    LLM_MAX_EN_VUELO,
+    LLM_REINTENTOS,
+    LLM_TIMEOUTS_SEG,
+    RUTEO_MAX_MUESTRAS,
+    RUTEO_MIN_MUESTRAS,
+    RUTEO_MODELOS,
+    RUTEO_VENTANA_SEG,
+    openai_client,
+)
+from src.services.cache import CacheTTL
+from src.services.prompt_builder import contar_tokens, huella_prompt, tokens_mensajes
+
+# Errores transitorios del proveedor que vale la pena reintentar.
+ERRORES_REINTENTABLES = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LLMNoDisponible(Exception):
+    """La llamada no se pudo completar (circuito abierto, sin cupo o sin tiempo)."""
+
+
+# === CIRCUIT BREAKER ===
+class CircuitBreaker:
+    """Circuito cerrado/abierto/semiabierto segun fallos consecutivos.
+
+    Args:
+        umbral_fallos: Fallos seguidos que abren el circuito.
+        enfriamiento_seg: Segundos abierto antes de permitir una prueba.
+    """
+
+    def __init__(self, umbral_fallos: int, enfriamiento_seg: float) -> None:
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento_seg = enfriamiento_seg
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_desde: Optional[float] = None
+        self._prueba_en_curso = False
+
+    def permitir(self) -> bool:
+        """Indica si la llamada puede salir (en semiabierto, solo una prueba)."""
+        with self._lock:
+            if self._abierto_desde is None:
+                return True
+            if time.monotonic() - self._abierto_desde < self.enfriamiento_seg:
+                return False
+            if self._prueba_en_curso:
+                return False
+            self._prueba_en_curso = True
+            return True
+
+    def registrar_exito(self) -> None:
+        with self._lock:
+            if self._abierto_desde is not None:
+                print("[LLM] Circuito cerrado: el proveedor responde de nuevo")
+            self._fallos = 0
+            self._abierto_desde = None
+            self._prueba_en_curso = False
+
+    def liberar_prueba(self) -> None:
+        """Libera la prueba en curso sin cambiar el estado (fallo ajeno al proveedor)."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self) -> None:
+        with self._lock:
+            self._fallos += 1
+            if self._prueba_en_curso or self._fallos >= self.umbral_fallos:
+                if self._abierto_desde is None or self._prueba_en_curso:
+                    print(f"[LLM] Circuito abierto tras {self._fallos} fallos seguidos")
+                self._abierto_desde = time.monotonic()
+            self._prueba_en_curso = False
+
+    def estado(self) -> str:
+        with self._lock:
+            if self._abierto_desde is None:
+                return "cerrado"
+            if time.monotonic() - self._abierto_desde < self.enfriamiento_seg:
+                return "abierto"
+            return "semiabierto"
+
+
+# === ESTADO ===
+_circuito = CircuitBreaker(LLM_CIRCUITO_FALLOS, LLM_CIRCUITO_ENFRIAMIENTO_SEG)
+_en_vuelo = threading.BoundedSemaphore(LLM_MAX_EN_VUELO)
+_lock = threading.Lock()
+_contadores: Dict[str, int] = {
+    "llamadas": 0,
+    "exitos": 0,
+    "reintentos": 0,
+    "fallos": 0,
+    "rechazadas_circuito": 0,
+    "rechazadas_sin_cupo": 0,
+    "streams_cortados": 0,
+    "streams_cancelados": 0,
+}
+_llamadas_en_vuelo = 0
+_uso: Dict[str, Dict[str, int]] = {}
+_cache_determinista = CacheTTL(CACHE_DETERMINISTA_MAX_ENTRADAS, CACHE_DETERMINISTA_TTL_SEG)
+# (tipo, modelo) -> muestras (instante, segundos) y tipo -> modelo -> veces elegido
+_latencias: Dict[Tuple[str, str], Deque[Tuple[float, float]]] = {}
+_elecciones: Dict[str, Dict[str, int]] = {}
+_lock_grabacion = threading.Lock()
+# Hedging: cada intento corre en su propio hilo (primario + duplicado).
+_ejecutor_hedging = ThreadPoolExecutor(max_workers=2 * LLM_MAX_EN_VUELO, thread_name_prefix="llm-hedging")
+_hedging: Dict[str, Any] = {
+    "cubiertas": 0,
+    "duplicadas": 0,
+    "omitidas_por_tasa": 0,
+    "ganadas_por_duplicado": 0,
+}
+
+
+def _contar(nombre: str) -> None:
+    with _lock:
+        _contadores[nombre] += 1
+
+
+def _tokens_cacheados(uso: Any) -> int:
+    """Tokens de prompt servidos desde el cache de prefijos del proveedor."""
+    detalles = getattr(uso, "prompt_tokens_details", None)
+    return getattr(detalles, "cached_tokens", None) or 0
+
+
+def _registrar_uso(
+    tipo: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_tokens: int = 0,
+    estimado: bool = False,
+) -> None:
+    """Acumula y reporta los tokens de una llamada por tipo."""
+    with _lock:
+        acumulado = _uso.setdefault(
+            tipo, {"llamadas": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        )
+        acumulado["llamadas"] += 1
+        acumulado["prompt_tokens"] += prompt_tokens
+        acumulado["completion_tokens"] += completion_tokens
+        acumulado["cached_tokens"] += cached_tokens
+    sufijo = " (estimado)" if estimado else ""
+    # Una linea por llamada: incluye el nivel de RUTEO_MODELOS que la atendio.
+    print(
+        f"[LLM] Tokens {tipo} ({model}, {_nivel_modelo(tipo, model)}): prompt={prompt_tokens} "
+        f"cacheados={cached_tokens} completion={completion_tokens}{sufijo}"
+    )
+
+
+def _grabar_respuesta(tipo: str, model: str, messages: List[Dict[str, Any]], contenido: Optional[str]) -> None:
+    """Agrega la respuesta a LLM_GRABAR_RESPUESTAS (JSONL) para reproducirla offline."""
+    if not LLM_GRABAR_RESPUESTAS or contenido is None:
+        return
+    linea = json.dumps(
+        {"huella": huella_prompt(messages), "tipo": tipo, "modelo": model, "contenido": contenido},
+        ensure_ascii=False,
+    )
+    try:
+        with _lock_grabacion, open(LLM_GRABAR_RESPUESTAS, "a", encoding="utf-8") as archivo:
+            archivo.write(linea + "\n")
+    except OSError as e:
+        print(f"[LLM] No se pudo grabar la respuesta: {e}")
+
+
+def _espera_backoff(intento: int) -> float:
+    """Backoff exponencial con jitter completo."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SEG, LLM_BACKOFF_BASE_SEG * (2 ** intento)))
+
+
+def _es_reintentable(error: Exception) -> bool:
+    return isinstance(error, ERRORES_REINTENTABLES)
+
+
+# === RUTEO DE MODELOS ===
+def _registrar_latencia(tipo: str, modelo: str, segundos: float) -> None:
+    with _lock:
+        muestras = _latencias.setdefault((tipo, modelo), deque(maxlen=RUTEO_MAX_MUESTRAS))
+        muestras.append((time.monotonic(), segundos))
+
+
+def percentil_latencia(tipo: str, modelo: str, percentil: float) -> Optional[float]:
+    """Percentil de las muestras recientes del modelo en ese tipo (None si hay pocas)."""
+    desde = time.monotonic() - RUTEO_VENTANA_SEG
+    with _lock:
+        valores = sorted(seg for instante, seg in _latencias.get((tipo, modelo), ()) if instante >= desde)
+    if len(valores) < RUTEO_MIN_MUESTRAS:
+        return None
+    return valores[max(math.ceil(percentil * len(valores)) - 1, 0)]
+
+
+def p95_latencia(tipo: str, modelo: str) -> Optional[float]:
+    return percentil_latencia(tipo, modelo, 0.95)
+
+
+def _nivel_modelo(tipo: str, modelo: str) -> str:
+    """Nivel del modelo en la ruta del tipo ("nivel 0" es el preferido)."""
+    ruta = RUTEO_MODELOS.get(tipo, RUTEO_MODELOS["general"])["modelos"]
+    return f"nivel {ruta.index(modelo)}" if modelo in ruta else "fuera de ruta"
+
+
+def elegir_modelo(tipo: str) -> str:
+    """
+    Elige el modelo para un tipo de llamada segun RUTEO_MODELOS.
+
+    Se usa el primer nivel cuyo p95 reciente entra en el presupuesto (o que
+    aun no tiene muestras suficientes). Si ninguno entra, el de menor p95.
+    """
+    ruta = RUTEO_MODELOS.get(tipo, RUTEO_MODELOS["general"])
+    medidos = []
+    elegido, nivel = None, 0
+    for nivel, modelo in enumerate(ruta["modelos"]):
+        p95 = p95_latencia(tipo, modelo)
+        if p95 is None or p95 <= ruta["p95_seg"]:
+            elegido = modelo
+            break
+        medidos.append((p95, nivel, modelo))
+    if elegido is None:
+        _, nivel, elegido = min(medidos)
+
+    with _lock:
+        por_modelo = _elecciones.setdefault(tipo, {})
+        por_modelo[elegido] = por_modelo.get(elegido, 0) + 1
+    if nivel > 0:
+        print(f"[LLM] Ruteo {tipo}: p95 fuera de presupuesto ({ruta['p95_seg']}s), se usa {elegido} (nivel {nivel})")
+    return elegido
+
+
+# === ADMISION Y REINTENTOS ===
+def _plazo(tipo: str, timeout_seg: Optional[float]) -> float:
+    if timeout_seg is not None:
+        return timeout_seg
+    return LLM_TIMEOUTS_SEG.get(tipo, LLM_TIMEOUTS_SEG["general"])
+
+
+def _admitir(tipo: str, plazo: float) -> None:
+    """Pasa el circuito y toma un cupo de llamada en vuelo (o lanza LLMNoDisponible)."""
+    global _llamadas_en_vuelo
+    _contar("llamadas")
+    if not _circuito.permitir():
+        _contar("rechazadas_circuito")
+        raise LLMNoDisponible(f"circuito abierto ({tipo})")
+
+    if not _en_vuelo.acquire(timeout=plazo):
+        _contar("rechazadas_sin_cupo")
+        # No es culpa del proveedor: no cuenta como fallo del circuito.
+        _circuito.liberar_prueba()
+        raise LLMNoDisponible(f"sin cupo de llamadas en vuelo ({tipo})")
+
+    with _lock:
+        _llamadas_en_vuelo += 1
+
+
+def _liberar() -> None:
+    global _llamadas_en_vuelo
+    with _lock:
+        _llamadas_en_vuelo -= 1
+    _en_vuelo.release()
+
+
+def _crear_con_reintentos(tipo: str, plazo: float, limite: float, **kwargs: Any) -> Any:
+    """chat.completions.create con reintentos hasta el limite (ya admitido)."""
+    intento = 0
+    while True:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            _circuito.registrar_fallo()
+            _contar("fallos")
+            raise LLMNoDisponible(f"plazo de {plazo}s agotado ({tipo})")
+        try:
+            respuesta = openai_client.chat.completions.create(timeout=restante, **kwargs)
+            _circuito.registrar_exito()
+            return respuesta
+        except Exception as e:
+            if not _es_reintentable(e):
+                # Error del pedido (400, 401...): el proveedor respondio.
+                _circuito.liberar_prueba()
+                _contar("fallos")
+                raise LLMNoDisponible(f"{type(e).__name__}: {e}") from e
+            espera = _espera_backoff(intento)
+            if intento >= LLM_REINTENTOS or time.monotonic() + espera >= limite:
+                _circuito.registrar_fallo()
+                _contar("fallos")
+                raise LLMNoDisponible(f"{type(e).__name__}: {e}") from e
+            intento += 1
+            _contar("reintentos")
+            print(f"[LLM] Reintento {intento}/{LLM_REINTENTOS} ({tipo}) en {espera:.2f}s: {type(e).__name__}")
+            time.sleep(espera)
+
+
+# === HEDGING ===
+def _usa_hedging(tipo: str) -> bool:
+    return LLM_HEDGING and tipo in LLM_HEDGING_TIPOS
+
+
+def _demora_hedging(tipo: str, modelo: str) -> float:
+    """Espera antes de duplicar: percentil reciente del modelo o el valor por defecto."""
+    demora = percentil_latencia(tipo, modelo, LLM_HEDGING_PERCENTIL)
+    if demora is None:
+        demora = LLM_HEDGING_DEMORA_DEFECTO_SEG
+    return max(demora, LLM_HEDGING_DEMORA_MIN_SEG)
+
+
+def _permitir_duplicado(tipo: str) -> bool:
+    """Reserva un duplicado si no se supera LLM_HEDGING_MAX_TASA de las llamadas cubiertas."""
+    with _lock:
+        if _hedging["duplicadas"] + 1 > LLM_HEDGING_MAX_TASA * _hedging["cubiertas"]:
+            _hedging["omitidas_por_tasa"] += 1
+            return False
+        _hedging["duplicadas"] += 1
+    print(f"[LLM] Hedging {tipo}: sin respuesta tras la espera, se lanza un duplicado")
+    return True
+
+
+def _registrar_victoria_duplicado(tipo: str, inicio: float) -> None:
+    """Cuenta una llamada resuelta por el duplicado."""
+    with _lock:
+        _hedging["ganadas_por_duplicado"] += 1
+    print(f"[LLM] Hedging {tipo}: el duplicado respondio primero ({time.monotonic() - inicio:.2f}s)")
+
+
+def _cerrar_stream(stream: Any) -> None:
+    """Cierra un stream del SDK desde cualquier hilo.
+
+    Cerrar la respuesta no despierta a un hilo bloqueado leyendo el socket
+    (recien lo notaria con el proximo fragmento), asi que antes se hace
+    shutdown del socket: la lectura falla en el acto y el proveedor ve la
+    conexion cerrada y deja de generar.
+    """
+    try:
+        red = stream.response.extensions.get("network_stream")
+        conexion = red.get_extra_info("socket") if red is not None else None
+        if conexion is not None:
+            conexion.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        stream.close()
+    except Exception:
+        pass
+
+
+class _ControlStream:
+    """Cupo de LLM_MAX_EN_VUELO y stream HTTP de un intento del hedging.
+
+    cancelar() (al haber ganador, desde el hilo del llamador) devuelve el
+    cupo del perdedor una sola vez y cierra su stream. Si el perdedor todavia
+    esta abriendo la conexion, el stream se cierra apenas se abre.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tomado = False
+        self._liberado = False
+        self._stream: Any = None
+        self.cancelado = False
+
+    def tomar(self) -> None:
+        with self._lock:
+            self._tomado = True
+
+    def liberar(self) -> None:
+        with self._lock:
+            if not self._tomado or self._liberado:
+                return
+            self._liberado = True
+        _liberar()
+
+    def asociar(self, stream: Any) -> bool:
+        """Registra el stream abierto; si ya se cancelo lo cierra y devuelve False."""
+        with self._lock:
+            if not self.cancelado:
+                self._stream = stream
+                return True
+        _cerrar_stream(stream)
+        return False
+
+    def cancelar(self) -> None:
+        with self._lock:
+            self.cancelado = True
+            stream, self._stream = self._stream, None
+        self.liberar()
+        if stream is not None:
+            _cerrar_stream(stream)
+
+
+def _completar_con_hedging(
+    messages: List[Dict[str, Any]],
+    model: str,
+    tipo: str,
+    plazo: float,
+    limite: float,
+    parametros: Dict[str, Any],
+) -> Any:
+    """
+    completar() con un duplicado si el primario tarda mas que la demora.
+
+    Una peticion HTTP bloqueante no se puede cancelar a mitad de camino, asi
+    que las dos llamadas se hacen en streaming (_stream_con_hedging): la
+    perdedora se cierra y el proveedor deja de generar. El texto del ganador
+    se devuelve con la forma de la respuesta del SDK (choices[0].message);
+    el uso de tokens ya lo registra cada stream.
+    """
+    contenido = "".join(_stream_con_hedging(messages, model, tipo, plazo, limite, parametros))
+    mensaje = SimpleNamespace(role="assistant", content=contenido)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=mensaje)], usage=None)
+
+
+def _stream_con_hedging(
+    messages: List[Dict[str, Any]],
+    model: str,
+    tipo: str,
+    plazo: float,
+    limite: float,
+    parametros: Dict[str, Any],
+) -> Iterator[str]:
+    """
+    completar_stream() con un duplicado si el primer fragmento tarda.
+
+    Cada stream corre en un hilo que deja sus fragmentos en una cola. Gana el
+    primero que entrega un fragmento (o termina): el otro se cancela en ese
+    momento (cupo devuelto y conexion cerrada), de modo que el proveedor deja
+    de generar y su hilo queda libre.
+    """
+    with _lock:
+        _hedging["cubiertas"] += 1
+    cola: "queue.Queue[Tuple[int, str, Any]]" = queue.Queue()
+    cortes = [threading.Event(), threading.Event()]
+    controles = [_ControlStream(), _ControlStream()]
+
+    def _producir(indice: int, espera_cupo: float) -> None:
+        fragmentos = _stream_simple(
+            messages, model, tipo, plazo, limite, dict(parametros), espera_cupo, controles[indice]
+        )
+        try:
+            for fragmento in fragmentos:
+                if cortes[indice].is_set():
+                    break
+                cola.put((indice, "fragmento", fragmento))
+            cola.put((indice, "fin", None))
+        except LLMNoDisponible as e:
+            cola.put((indice, "error", e))
+        except Exception as e:
+            cola.put((indice, "error", LLMNoDisponible(f"{type(e).__name__}: {e}")))
+        finally:
+            fragmentos.close()
+
+    inicio = time.monotonic()
+    demora = _demora_hedging(tipo, model)
+    _ejecutor_hedging.submit(_producir, 0, plazo)
+    activos, duplicado, ganador = 1, False, None
+    try:
+        while True:
+            if ganador is None and not duplicado:
+                espera = min(inicio + demora, limite) - time.monotonic()
+            else:
+                espera = limite - time.monotonic()
+            try:
+                indice, evento, valor = cola.get(timeout=max(espera, 0))
+            except queue.Empty:
+                if ganador is None and not duplicado and time.monotonic() < limite:
+                    duplicado = True
+                    if _permitir_duplicado(tipo):
+                        activos += 1
+                        _ejecutor_hedging.submit(_producir, 1, 0)
+                    continue
+                raise LLMNoDisponible(f"plazo de {plazo}s agotado en streaming ({tipo})")
+
+            if ganador is None:
+                if evento == "error":
+                    activos -= 1
+                    if activos == 0:
+                        raise valor
+                    continue
+                ganador = indice
+                # Primero se cancela: el perdedor que vea el corte ya lo sabe cancelado.
+                controles[1 - indice].cancelar()
+                cortes[1 - indice].set()
+                if indice == 1:
+                    _registrar_victoria_duplicado(tipo, inicio)
+
+            if indice != ganador:
+                continue
+            if evento == "fragmento":
+                yield valor
+            elif evento == "fin":
+                return
+            else:
+                raise valor
+    finally:
+        # Corte del llamador o error: los hilos cierran sus streams.
+        for corte in cortes:
+            corte.set()
+
+
+# === API PUBLICA ===
+def completar(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    tipo: str = "general",
+    timeout_seg: Optional[float] = None,
+    **parametros: Any,
+) -> Any:
+    """
+    Ejecuta chat.completions.create con plazo, reintentos, cupo y circuito.
+
+    Args:
+        messages: Mensajes del prompt.
+        model: Modelo de OpenAI; si no se indica, lo elige el ruteo por tipo.
+        tipo: Tipo de llamada (deteccion, helper, fusion, general, agente);
+            define el plazo por defecto y la ruta de modelos.
+        timeout_seg: Plazo total explicito (reemplaza al del tipo).
+        **parametros: Resto de argumentos de la API (temperature, max_tokens,
+            response_format, ...).
+
+    Returns:
+        La respuesta del SDK tal cual (choices, usage, ...).
+
+    Raises:
+        LLMNoDisponible: Si el circuito esta abierto, no hubo cupo a tiempo,
+            se agoto el plazo o el error no es reintentable.
+    """
+    model = model or elegir_modelo(tipo)
+    plazo = _plazo(tipo, timeout_seg)
+    limite = time.monotonic() + plazo
+    if _usa_hedging(tipo):
+        return _completar_con_hedging(messages, model, tipo, plazo, limite, parametros)
+    return _completar_simple(messages, model, tipo, plazo, limite, parametros, plazo)
+
+
+def _completar_simple(
+    messages: List[Dict[str, Any]],
+    model: str,
+    tipo: str,
+    plazo: float,
+    limite: float,
+    parametros: Dict[str, Any],
+    espera_cupo: float,
+) -> Any:
+    """Un intento completo de completar(): admision, reintentos, latencia y uso."""
+    _admitir(tipo, espera_cupo)
+    try:
+        inicio = time.monotonic()
+        try:
+            respuesta = _crear_con_reintentos(tipo, plazo, limite, model=model, messages=messages, **parametros)
+        finally:
+            _registrar_latencia(tipo, model, time.monotonic() - inicio)
+        _contar("exitos")
+        uso = getattr(respuesta, "usage", None)
+        if uso is not None:
+            _registrar_uso(tipo, model, uso.prompt_tokens, uso.completion_tokens, _tokens_cacheados(uso))
+        if respuesta.choices:
+            _grabar_respuesta(tipo, model, messages, respuesta.choices[0].message.content)
+        return respuesta
+    finally:
+        _liberar()
+
+
+def completar_stream(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    tipo: str = "general",
+    timeout_seg: Optional[float] = None,
+    **parametros: Any,
+) -> Iterator[str]:
+    """
+    Igual que completar() pero en streaming: produce los fragmentos de texto.
+
+    Solo se reintenta la apertura del stream (antes del primer fragmento). Si
+    el llamador deja de iterar (break), el stream se cierra y el proveedor
+    deja de generar: los tokens no leidos no se facturan.
+
+    Para el ruteo (y el hedging) se mide la latencia hasta el primer
+    fragmento.
+
+    Yields:
+        Fragmentos de texto (delta.content) a medida que llegan.
+
+    Raises:
+        LLMNoDisponible: Igual que completar(), o si el stream falla o se pasa
+            del plazo a mitad de camino.
+    """
+    model = model or elegir_modelo(tipo)
+    plazo = _plazo(tipo, timeout_seg)
+    limite = time.monotonic() + plazo
+    if _usa_hedging(tipo):
+        return _stream_con_hedging(messages, model, tipo, plazo, limite, parametros)
+    return _stream_simple(messages, model, tipo, plazo, limite, parametros, plazo)
+
+
+def _stream_simple(
+    messages: List[Dict[str, Any]],
+    model: str,
+    tipo: str,
+    plazo: float,
+    limite: float,
+    parametros: Dict[str, Any],
+    espera_cupo: float,
+    control: Optional[_ControlStream] = None,
+) -> Iterator[str]:
+    """Un stream completo de completar_stream(): admision, reintentos, latencia y uso.
+
+    Un stream cancelado por el hedging (control.cancelado) termina sin
+    error y no se graba ni cuenta como exito o fallo: su latencia tampoco se
+    registra, porque solo se sabe que iba a ser mayor que la del ganador.
+    """
+    control = control or _ControlStream()
+    _admitir(tipo, espera_cupo)
+    control.tomar()
+    try:
+        inicio = time.monotonic()
+        parametros.setdefault("stream_options", {"include_usage": True})
+        stream = _crear_con_reintentos(
+            tipo, plazo, limite, model=model, messages=messages, stream=True, **parametros
+        )
+        partes: List[str] = []
+        uso = None
+        if not control.asociar(stream):
+            inicio = None
+            _contar("streams_cancelados")
+            _registrar_uso(tipo, model, tokens_mensajes(messages, model), 0, estimado=True)
+            return
+        try:
+            for chunk in stream:
+                if inicio is not None:
+                    _registrar_latencia(tipo, model, time.monotonic() - inicio)
+                    inicio = None
+                if time.monotonic() > limite:
+                    _circuito.registrar_fallo()
+                    _contar("fallos")
+                    raise LLMNoDisponible(f"plazo de {plazo}s agotado en streaming ({tipo})")
+                if getattr(chunk, "usage", None) is not None:
+                    uso = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    partes.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            _contar("exitos")
+            _grabar_respuesta(tipo, model, messages, "".join(partes))
+        except GeneratorExit:
+            if control.cancelado:
+                inicio = None
+                _contar("streams_cancelados")
+                raise
+            # El llamador ya tiene lo que necesita y corta el stream. Se graba
+            # lo leido: al reproducirlo el llamador corta en el mismo punto.
+            _contar("exitos")
+            _contar("streams_cortados")
+            _grabar_respuesta(tipo, model, messages, "".join(partes))
+            raise
+        except LLMNoDisponible:
+            raise
+        except Exception as e:
+            if control.cancelado:
+                # La conexion la cerro cancelar(): no es un fallo del proveedor.
+                inicio = None
+                _contar("streams_cancelados")
+                return
+            _circuito.registrar_fallo()
+            _contar("fallos")
+            raise LLMNoDisponible(f"{type(e).__name__}: {e}") from e
+        finally:
+            stream.close()
+            # Si el stream se corto antes del chunk final no llega "usage":
+            # se estima con el tokenizador local.
+            if uso is not None:
+                _registrar_uso(tipo, model, uso.prompt_tokens, uso.completion_tokens, _tokens_cacheados(uso))
+            else:
+                _registrar_uso(
+                    tipo, model, tokens_mensajes(messages, model),
+                    contar_tokens("".join(partes), model), estimado=True,
+                )
+    finally:
+        if inicio is not None:
+            _registrar_latencia(tipo, model, time.monotonic() - inicio)
+        control.liberar()
+
+
+def _clave_determinista(messages: List[Dict[str, Any]], model: str, parametros: Dict[str, Any]) -> str:
+    """Hash del prompt completo, el modelo y los parametros de la llamada."""
+    contenido = json.dumps(
+        {"model": model, "messages": messages, "parametros": parametros},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def completar_determinista(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    tipo: str = "general",
+    timeout_seg: Optional[float] = None,
+    **parametros: Any,
+) -> str:
+    """
+    completar() con cache por contenido para llamadas con temperatura 0.
+
+    Reentregas de WhatsApp, reintentos del usuario y pruebas repetidas envian
+    exactamente el mismo prompt; con temperatura 0 la respuesta es la misma,
+    asi que se devuelve la guardada sin llamar a OpenAI. Cualquier cambio en
+    los mensajes (historial, datos de la hoja), el modelo o los parametros
+    produce otra clave.
+
+    Returns:
+        El texto de la respuesta (choices[0].message.content, sin espacios
+        al borde).
+
+    Raises:
+        LLMNoDisponible: Igual que completar().
+    """
+    model = model or elegir_modelo(tipo)
+    if parametros.get("temperature", 1) != 0:
+        # Con temperatura > 0 la respuesta no es repetible: no se cachea.
+        respuesta = completar(messages, model, tipo=tipo, timeout_seg=timeout_seg, **parametros)
+        return (respuesta.choices[0].message.content or "").strip()
+
+    clave = _clave_determinista(messages, model, parametros)
+    contenido = _cache_determinista.obtener(clave)
+    if contenido is not None:
+        print(f"[LLM] Respuesta determinista desde cache ({tipo})")
+        return contenido
+
+    respuesta = completar(messages, model, tipo=tipo, timeout_seg=timeout_seg, **parametros)
+    contenido = (respuesta.choices[0].message.content or "").strip()
+
+    # Solo se guardan respuestas utilizables: JSON valido si se pidio JSON.
+    if (parametros.get("response_format") or {}).get("type") == "json_object":
+        try:
+            json.loads(contenido)
+        except ValueError:
+            return contenido
+    if contenido:
+        _cache_determinista.guardar(clave, contenido)
+    return contenido
+
+
+def estadisticas() -> Dict[str, Any]:
+    """Estado del circuito, llamadas en vuelo, ruteo y contadores acumulados."""
+    p95 = {
+        tipo: {modelo: p95_latencia(tipo, modelo) for modelo in ruta["modelos"]}
+        for tipo, ruta in RUTEO_MODELOS.items()
+    }
+    with _lock:
+        return {
+            "circuito": _circuito.estado(),
+            "en_vuelo": _llamadas_en_vuelo,
+            "max_en_vuelo": LLM_MAX_EN_VUELO,
+            **_contadores,
+            "tokens_por_tipo": {
+                tipo: {
+                    **uso,
+                    "ratio_cacheados": round(uso["cached_tokens"] / uso["prompt_tokens"], 3)
+                    if uso["prompt_tokens"] else 0.0,
+                }
+                for tipo, uso in _uso.items()
+            },
+            "cache_determinista": _cache_determinista.estadisticas(),
+            "modelos_elegidos": {tipo: dict(modelos) for tipo, modelos in _elecciones.items()},
+            "p95_latencia_seg": p95,
+            "hedging": {
+                "activo": LLM_HEDGING,
+                **_hedging,
+                "tasa_duplicadas": round(_hedging["duplicadas"] / _hedging["cubiertas"], 3)
+                if _hedging["cubiertas"] else 0.0,
+            },
+        }
@@ -0,0 +1,201 @@
+"""
+Agrupacion (debounce) de mensajes entrantes por usuario.
+
+Los usuarios de WhatsApp suelen partir una idea en 2-4 mensajes. En lugar de
+ejecutar un turno completo por cada uno, los mensajes del mismo remitente que
+llegan dentro de WEBHOOK_VENTANA_AGRUPACION_SEG se acumulan y se despachan como
+un solo turno al pool de segundo plano (buzon por sender_id).
+
+La ventana se reinicia con cada mensaje nuevo, pero nunca supera
+WEBHOOK_ESPERA_MAXIMA_AGRUPACION_SEG desde el primer mensaje del grupo.
+
+Los mensajes llegan en lotes (todo el payload de un webhook): primero se fijan
+los grupos de cada remitente y se reservan sus cupos, luego se deduplica el
+lote completo y recien entonces se agregan los mensajes nuevos. Asi un 503 por
+saturacion nunca deja IDs registrados sin procesar.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.config import (
+    WEBHOOK_ESPERA_MAXIMA_AGRUPACION_SEG,
+    WEBHOOK_VENTANA_AGRUPACION_SEG,
+)
+from src.services import dispatcher
+
+# (sender_id, texto, message_id)
+Mensaje = Tuple[str, str, str]
+
+# === ESTADO ===
+_lock = threading.Lock()
+_grupos: Dict[str, Dict[str, Any]] = {}
+_mensajes_recibidos = 0
+_turnos_despachados = 0
+
+
+# === UTILIDADES INTERNAS ===
+def _programar(sender_id: str, grupo: Dict[str, Any]) -> None:
+    """(Re)inicia la ventana del grupo. Requiere tener _lock tomado."""
+    if grupo["timer"] is not None:
+        grupo["timer"].cancel()
+
+    transcurrido = time.monotonic() - grupo["inicio"]
+    espera = min(
+        WEBHOOK_VENTANA_AGRUPACION_SEG,
+        max(0.0, WEBHOOK_ESPERA_MAXIMA_AGRUPACION_SEG - transcurrido),
+    )
+    timer = threading.Timer(espera, _despachar, args=(sender_id,))
+    timer.daemon = True
+    grupo["timer"] = timer
+    timer.start()
+
+
+def _despachar(sender_id: str) -> None:
+    """Cierra el grupo del remitente y lo encola como un solo turno."""
+    global _turnos_despachados
+    with _lock:
+        grupo = _grupos.get(sender_id)
+        # Un grupo fijado esta recibiendo un lote; su timer se reinicia al soltarlo.
+        if grupo is None or grupo["fijado"] or not grupo["textos"]:
+            return
+        _grupos.pop(sender_id)
+        if grupo["timer"] is not None:
+            grupo["timer"].cancel()
+        _turnos_despachados += 1
+
+    # El cupo se reservo al abrir el grupo, por eso el encolado no puede fallar
+    # por saturacion (solo si el executor ya fue apagado).
+    try:
+        dispatcher.encolar(
+            grupo["funcion"], sender_id, grupo["textos"], grupo["ids"],
+            clave=sender_id, reservado=True,
+        )
+    except Exception as e:
+        print(f"[AGRUPADOR] No se pudo encolar el turno de {sender_id} {grupo['ids']}: {e}")
+
+
+def _fijar(funcion: Callable[..., None], remitentes: List[str]) -> bool:
+    """Fija (o abre) el grupo de cada remitente reservando cupo para los nuevos.
+
+    Returns:
+        False si el pool no tiene cupo; en ese caso no queda nada fijado.
+    """
+    fijados: List[str] = []
+    for sender_id in remitentes:
+        with _lock:
+            grupo = _grupos.get(sender_id)
+            if grupo is not None:
+                grupo["fijado"] += 1
+                fijados.append(sender_id)
+                continue
+
+        # La reserva se hace fuera del lock porque puede esperar por un cupo libre.
+        if not dispatcher.reservar():
+            _soltar(fijados)
+            return False
+
+        with _lock:
+            grupo = _grupos.get(sender_id)
+            if grupo is not None:
+                # Otro request abrio el grupo mientras se reservaba: sobra el cupo.
+                dispatcher.liberar_reserva()
+            else:
+                grupo = {
+                    "funcion": funcion,
+                    "textos": [],
+                    "ids": [],
+                    "inicio": time.monotonic(),
+                    "timer": None,
+                    "fijado": 0,
+                }
+                _grupos[sender_id] = grupo
+            grupo["fijado"] += 1
+        fijados.append(sender_id)
+    return True
+
+
+def _soltar(remitentes: List[str]) -> None:
+    """Suelta grupos fijados: descarta los vacios y reprograma o despacha el resto."""
+    inmediatos: List[str] = []
+    with _lock:
+        for sender_id in remitentes:
+            grupo = _grupos.get(sender_id)
+            if grupo is None:
+                continue
+            grupo["fijado"] -= 1
+            if grupo["fijado"]:
+                continue
+            if not grupo["textos"]:
+                # Todo el lote del remitente era duplicado: se devuelve el cupo.
+                _grupos.pop(sender_id)
+                if grupo["timer"] is not None:
+                    grupo["timer"].cancel()
+                dispatcher.liberar_reserva()
+            elif WEBHOOK_VENTANA_AGRUPACION_SEG <= 0:
+                inmediatos.append(sender_id)
+            else:
+                _programar(sender_id, grupo)
+
+    for sender_id in inmediatos:
+        _despachar(sender_id)
+
+
+# === API PUBLICA ===
+def agregar_lote(
+    funcion: Callable[[str, List[str], List[str]], None],
+    mensajes: List[Mensaje],
+    deduplicar: Optional[Callable[[List[Mensaje]], List[Mensaje]]] = None,
+) -> bool:
+    """Agrega los mensajes de un payload a los grupos de sus remitentes.
+
+    Args:
+        funcion: Procesador del turno; recibe (sender_id, textos, ids).
+        mensajes: Mensajes del payload en orden de llegada.
+        deduplicar: Filtro en bloque que devuelve solo los mensajes nuevos. Se
+            ejecuta una vez por lote, con los grupos ya reservados.
+
+    Returns:
+        False si no hay cupo en el pool para abrir los grupos (backpressure);
+        True si los mensajes nuevos quedaron agrupados o encolados.
+    """
+    global _mensajes_recibidos
+    remitentes = list(dict.fromkeys(sender_id for sender_id, _, _ in mensajes))
+    if not _fijar(funcion, remitentes):
+        return False
+
+    try:
+        nuevos = deduplicar(mensajes) if deduplicar is not None else mensajes
+        with _lock:
+            for sender_id, texto, message_id in nuevos:
+                grupo = _grupos[sender_id]
+                grupo["textos"].append(texto)
+                grupo["ids"].append(message_id)
+                _mensajes_recibidos += 1
+    finally:
+        _soltar(remitentes)
+    return True
+
+
+def vaciar() -> None:
+    """Despacha de inmediato todos los grupos abiertos (p. ej. al apagar)."""
+    with _lock:
+        pendientes = list(_grupos)
+    for sender_id in pendientes:
+        _despachar(sender_id)
+
+
+def estado() -> Dict[str, Any]:
+    """Metricas de agrupacion: mensajes recibidos vs. turnos despachados."""
+    with _lock:
+        recibidos = _mensajes_recibidos
+        despachados = _turnos_despachados
+        abiertos = len(_grupos)
+    return {
+        "ventana_seg": WEBHOOK_VENTANA_AGRUPACION_SEG,
+        "mensajes_recibidos": recibidos,
+        "turnos_despachados": despachados,
+        "grupos_abiertos": abiertos,
+        "mensajes_por_turno": round(recibidos / despachados, 2) if despachados else 0.0,
+    }
@@ -0,0 +1,202 @@
+"""
+Armado de prompts con presupuesto de tokens.
+
+Reemplaza los recortes por cantidad de mensajes (ultimos 3, ultimos 6 + 6)
+por un presupuesto de tokens por modelo (PRESUPUESTO_TOKENS_PROMPT): se cuentan
+los tokens localmente con tiktoken y se agrega historial desde el mensaje mas
+reciente hacia atras hasta llenar el presupuesto. Los mensajes repetidos
+(mismo rol y mismo texto normalizado) se incluyen una sola vez.
+
+Los prompts siguen un orden pensado para el cache de prefijos del proveedor:
+primero un prefijo estatico (identico para todos los usuarios y versionado con
+prefijo_estatico), despues el contexto del usuario, el historial y el mensaje
+actual. Asi los primeros tokens de cada llamada se repiten byte a byte y el
+proveedor puede reutilizarlos.
+
+Si tiktoken no esta instalado se estima 1 token cada 4 caracteres.
+"""
+
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from src.config import PRESUPUESTO_TOKENS_DEFECTO, PRESUPUESTO_TOKENS_PROMPT
+from src.services.texto import normalizar_texto
+
+# Tokens extra por mensaje (rol y separadores) y por respuesta, segun OpenAI.
+TOKENS_POR_MENSAJE = 4
+TOKENS_POR_RESPUESTA = 3
+
+# === ESTADO ===
+# Prefijos estaticos registrados: nombre -> modelo y texto.
+_prefijos: Dict[str, Dict[str, str]] = {}
+_lock = threading.Lock()
+
+
+# === CONTEO DE TOKENS ===
+@lru_cache(maxsize=None)
+def _codificador(modelo: str) -> Any:
+    """Codificador tiktoken del modelo (o None si tiktoken no esta disponible)."""
+    try:
+        import tiktoken
+    except ImportError:
+        print("[PROMPT] tiktoken no disponible, se estiman tokens por caracteres")
+        return None
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def contar_tokens(texto: str, modelo: str) -> int:
+    """Tokens de un texto para el modelo indicado."""
+    codificador = _codificador(modelo)
+    if codificador is None:
+        return (len(texto) + 3) // 4
+    return len(codificador.encode(texto))
+
+
+def tokens_mensajes(mensajes: List[Dict[str, Any]], modelo: str) -> int:
+    """Tokens de prompt de una lista de mensajes de chat."""
+    total = TOKENS_POR_RESPUESTA
+    for mensaje in mensajes:
+        total += TOKENS_POR_MENSAJE + contar_tokens(str(mensaje.get("content") or ""), modelo)
+    return total
+
+
+def presupuesto_prompt(modelo: str) -> int:
+    """Presupuesto de tokens de prompt configurado para el modelo."""
+    return PRESUPUESTO_TOKENS_PROMPT.get(modelo, PRESUPUESTO_TOKENS_DEFECTO)
+
+
+# === PREFIJOS ESTATICOS ===
+def prefijo_estatico(nombre: str, modelo: str, texto: str) -> str:
+    """
+    Registra un prompt del sistema que debe ser identico para todos los usuarios.
+
+    No se puede interpolar nada por usuario en el texto: los datos dinamicos se
+    pasan como contexto en construir_prompt. La version (hash del texto) se
+    expone en /metricas para saber cuando cambio el prefijo cacheado.
+
+    Returns:
+        El mismo texto, para asignarlo a la constante del modulo.
+    """
+    with _lock:
+        _prefijos[nombre] = {"modelo": modelo, "texto": texto}
+    return texto
+
+
+def prefijos() -> Dict[str, Dict[str, Any]]:
+    """Version y tamanio en tokens de cada prefijo estatico registrado."""
+    with _lock:
+        registrados = dict(_prefijos)
+    return {
+        nombre: {
+            "version": hashlib.sha1(datos["texto"].encode("utf-8")).hexdigest()[:10],
+            "modelo": datos["modelo"],
+            "tokens": contar_tokens(datos["texto"], datos["modelo"]),
+        }
+        for nombre, datos in sorted(registrados.items())
+    }
+
+
+def huella_prompt(mensajes: List[Dict[str, Any]]) -> str:
+    """
+    Huella de los mensajes de un prompt (rol y texto, sin otros campos).
+
+    Es la clave con que se graban las respuestas (LLM_GRABAR_RESPUESTAS) y con
+    que fake_openai_server.py las reproduce; no depende del modelo elegido por
+    el ruteo ni de los parametros de la llamada.
+    """
+    contenido = json.dumps(
+        [[m.get("role"), m.get("content")] for m in mensajes],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+# === HISTORIAL ===
+def historial_valido(historial: List[Any]) -> List[Dict[str, str]]:
+    """Mensajes con role/content, solo con esas claves (sin timestamp)."""
+    return [
+        {"role": m["role"], "content": m["content"]}
+        for m in historial or []
+        if isinstance(m, dict) and "role" in m and "content" in m and m["content"]
+    ]
+
+
+def ajustar_historial(
+    historial: List[Any],
+    modelo: str,
+    presupuesto: int,
+    excluir: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """
+    Selecciona el historial mas reciente que entra en el presupuesto.
+
+    Args:
+        historial: Mensajes en orden cronologico.
+        modelo: Modelo para contar tokens.
+        presupuesto: Tokens disponibles para el historial.
+        excluir: Texto que ya va en el prompt (p. ej. el mensaje actual) y no
+            debe repetirse.
+
+    Returns:
+        Mensajes elegidos, en orden cronologico y sin repetidos.
+    """
+    vistos = set()
+    if excluir:
+        vistos.add(("user", normalizar_texto(excluir)))
+
+    elegidos: List[Dict[str, str]] = []
+    usados = 0
+    for mensaje in reversed(historial_valido(historial)):
+        clave = (mensaje["role"], normalizar_texto(mensaje["content"]))
+        if clave in vistos:
+            continue
+        costo = TOKENS_POR_MENSAJE + contar_tokens(mensaje["content"], modelo)
+        if usados + costo > presupuesto:
+            break
+        vistos.add(clave)
+        elegidos.append(mensaje)
+        usados += costo
+    elegidos.reverse()
+    return elegidos
+
+
+# === API PUBLICA ===
+def construir_prompt(
+    sistema: str,
+    historial: List[Any],
+    modelo: str,
+    mensaje_usuario: Optional[str] = None,
+    presupuesto: Optional[int] = None,
+    contexto: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """
+    Arma system + contexto + historial ajustado + mensaje actual.
+
+    Args:
+        sistema: Prompt del sistema estatico (prefijo cacheable).
+        historial: Historial completo (cronologico).
+        modelo: Modelo destino (define tokenizador y presupuesto).
+        mensaje_usuario: Mensaje actual; si se pasa, va al final y no se
+            repite desde el historial.
+        presupuesto: Tokens de prompt (por defecto, el del modelo).
+        contexto: Datos propios del usuario; van en un mensaje de sistema
+            aparte, despues del prefijo estatico.
+
+    Returns:
+        Lista de mensajes lista para la API.
+    """
+    fijos = [{"role": "system", "content": sistema}]
+    if contexto:
+        fijos.append({"role": "system", "content": contexto})
+    final = [{"role": "user", "content": mensaje_usuario}] if mensaje_usuario else []
+    disponible = (presupuesto or presupuesto_prompt(modelo)) - tokens_mensajes(fijos + final, modelo)
+
+    medio = ajustar_historial(historial, modelo, max(disponible, 0), excluir=mensaje_usuario)
+    return fijos + medio + final
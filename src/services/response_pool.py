@@ -0,0 +1,273 @@
+"""
+Pool de respuestas pre-generadas para intenciones de contenido fijo.
+
+Las intenciones "creador", "que_es_google_ads" y "costo_google_ads" explican
+siempre lo mismo. Un job offline (generate_response_pools.py) genera K
+variantes con tonos distintos por intencion y las guarda en Firestore; los
+helpers responden eligiendo una variante al azar, sin esperar a GPT.
+
+Cada pool guarda la huella (version) del prompt del sistema y del modelo con
+que se genero. Si el helper cambia su prompt, la version deja de coincidir: el
+helper vuelve a generar en vivo. La regeneracion va en el job offline; el
+servicio solo la intenta en segundo plano como respaldo, a lo sumo una vez por
+intencion cada POOL_RESPUESTAS_REINTENTO_SEG (con espera creciente tras cada
+fallo, para no sumar llamadas durante una caida de OpenAI).
+
+Opcionalmente (POOL_RESPUESTAS_PUENTE) una llamada corta al modelo general
+agrega una frase que conecta la variante con el historial reciente.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from src.config import (
+    GPT_MODEL_AVANZADO,
+    GPT_MODEL_GENERAL,
+    POOL_RESPUESTAS,
+    POOL_RESPUESTAS_K,
+    POOL_RESPUESTAS_PUENTE,
+    POOL_RESPUESTAS_REFRESCO_SEG,
+    POOL_RESPUESTAS_REINTENTO_MAX_SEG,
+    POOL_RESPUESTAS_REINTENTO_SEG,
+    TEMPERATURA_CONVERSACION,
+)
+from src.data.firestore_storage import (
+    guardar_pool_respuestas,
+    leer_historial,
+    leer_pool_respuestas,
+)
+from src.services import llm
+from src.services.intent_cache import version_prompt
+
+# Tonos con que se generan las variantes (se recorren en ciclo hasta K).
+TONOS = [
+    "cercano y cálido, como un amigo que sabe del tema",
+    "directo y práctico, en pocas frases",
+    "entusiasta, destacando la oportunidad para el negocio",
+    "tranquilo y paciente, para alguien que recién empieza",
+    "con un ejemplo concreto de un negocio boliviano",
+    "breve y con un toque de humor amable",
+]
+
+# === ESTADO ===
+_lock = threading.Lock()
+_pools: Dict[str, Dict[str, Any]] = {}
+_regenerando: set = set()
+# Antes de este instante (monotonic) no se vuelve a regenerar la intencion.
+_proximo_intento: Dict[str, float] = {}
+_fallos_regeneracion: Dict[str, int] = {}
+_servidas: Dict[str, int] = {}
+_fallos: Dict[str, int] = {}
+
+
+# === UTILIDADES ===
+def version_pool(prompt_sistema: str) -> str:
+    """Huella del prompt del sistema y del modelo con que se generan variantes."""
+    return version_prompt(prompt_sistema, GPT_MODEL_AVANZADO)
+
+
+def _obtener_pool(etiqueta: str, forzar: bool = False) -> Optional[Dict[str, Any]]:
+    """Pool en memoria, releido desde Firestore cada POOL_RESPUESTAS_REFRESCO_SEG (o si se fuerza)."""
+    ahora = time.monotonic()
+    with _lock:
+        pool = _pools.get(etiqueta)
+    if not forzar and pool is not None and ahora - pool["leido"] < POOL_RESPUESTAS_REFRESCO_SEG:
+        return pool
+
+    try:
+        datos = leer_pool_respuestas(etiqueta)
+    except Exception as e:
+        print(f"[POOL RESPUESTAS] Error al leer pool '{etiqueta}': {e}")
+        datos = None
+
+    pool = {
+        "version": (datos or {}).get("version"),
+        "variantes": (datos or {}).get("variantes", []),
+        "leido": ahora,
+    }
+    with _lock:
+        _pools[etiqueta] = pool
+    return pool
+
+
+def _generar_variante(prompt_sistema: str, pregunta: str, tono: str) -> Optional[str]:
+    """Genera una respuesta con el prompt del helper y un tono indicado."""
+    mensajes = [
+        {"role": "system", "content": prompt_sistema},
+        {"role": "system", "content": f"Tono de esta respuesta: {tono}. No menciones el tono."},
+        {"role": "user", "content": pregunta},
+    ]
+    try:
+        respuesta = llm.completar(
+            model=GPT_MODEL_AVANZADO,
+            tipo="helper",
+            messages=mensajes,
+            temperature=TEMPERATURA_CONVERSACION,
+            max_tokens=220
+        )
+        return respuesta.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"[ERROR GPT - response_pool] {e}")
+        return None
+
+
+def _frase_puente(numero_usuario: str, variante: str) -> Optional[str]:
+    """Frase corta que conecta la variante con lo ultimo que se hablo."""
+    historial = leer_historial(numero_usuario)[-4:]
+    if not historial:
+        return None
+    mensajes = [
+        {
+            "role": "system",
+            "content": (
+                "Escribe UNA sola frase corta (máximo 15 palabras) que conecte lo último que se habló "
+                "con la respuesta que se enviará a continuación. No repitas la respuesta ni saludes."
+            ),
+        },
+        *({"role": m["role"], "content": m["content"]} for m in historial),
+        {"role": "system", "content": f"Respuesta que se enviará:\n{variante}"},
+    ]
+    try:
+        respuesta = llm.completar(
+            model=GPT_MODEL_GENERAL,
+            tipo="helper",
+            messages=mensajes,
+            temperature=TEMPERATURA_CONVERSACION,
+            max_tokens=40
+        )
+        return respuesta.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"[ERROR GPT - response_pool puente] {e}")
+        return None
+
+
+# === API PUBLICA ===
+def regenerar_pool(etiqueta: str, prompt_sistema: str, pregunta: str, k: int = POOL_RESPUESTAS_K) -> List[str]:
+    """
+    Genera K variantes de tono para una intencion y reemplaza su pool.
+
+    Args:
+        etiqueta: Intencion del pool.
+        prompt_sistema: Prompt del sistema del helper (define la version).
+        pregunta: Pregunta representativa de la intencion.
+        k: Cantidad de variantes.
+
+    Returns:
+        Lista de variantes guardadas (vacia si no se pudo generar ninguna).
+    """
+    version = version_pool(prompt_sistema)
+    variantes = []
+    for i in range(k):
+        variante = _generar_variante(prompt_sistema, pregunta, TONOS[i % len(TONOS)])
+        if variante is None:
+            # GPT no responde: no se insiste con el resto de las variantes.
+            break
+        if variante and variante not in variantes:
+            variantes.append(variante)
+
+    if not variantes:
+        print(f"[POOL RESPUESTAS] No se generaron variantes para '{etiqueta}'")
+        return []
+
+    guardar_pool_respuestas(etiqueta, version, variantes)
+    with _lock:
+        _pools[etiqueta] = {"version": version, "variantes": variantes, "leido": time.monotonic()}
+    print(f"[POOL RESPUESTAS] Pool '{etiqueta}' regenerado: {len(variantes)} variantes (version {version})")
+    return variantes
+
+
+def _regenerar_en_segundo_plano(etiqueta: str, prompt_sistema: str, pregunta: str) -> None:
+    """
+    Intenta regenerar el pool en segundo plano, con espera entre intentos.
+
+    Una sola regeneracion a la vez por intencion y, como maximo, una cada
+    POOL_RESPUESTAS_REINTENTO_SEG; si falla o no genera variantes la espera
+    se duplica (hasta POOL_RESPUESTAS_REINTENTO_MAX_SEG). Antes de generar se
+    relee Firestore por si otra instancia o el job offline ya lo regeneraron.
+    """
+    with _lock:
+        if etiqueta in _regenerando or time.monotonic() < _proximo_intento.get(etiqueta, 0.0):
+            return
+        _regenerando.add(etiqueta)
+
+    def _ejecutar() -> None:
+        exito = False
+        try:
+            pool = _obtener_pool(etiqueta, forzar=True)
+            if pool["version"] == version_pool(prompt_sistema) and pool["variantes"]:
+                exito = True
+            else:
+                exito = bool(regenerar_pool(etiqueta, prompt_sistema, pregunta))
+        except Exception as e:
+            print(f"[POOL RESPUESTAS] Error al regenerar pool '{etiqueta}': {e}")
+        finally:
+            with _lock:
+                _regenerando.discard(etiqueta)
+                if exito:
+                    _fallos_regeneracion.pop(etiqueta, None)
+                    espera = POOL_RESPUESTAS_REINTENTO_SEG
+                else:
+                    fallos = _fallos_regeneracion[etiqueta] = _fallos_regeneracion.get(etiqueta, 0) + 1
+                    espera = min(POOL_RESPUESTAS_REINTENTO_SEG * 2 ** fallos, POOL_RESPUESTAS_REINTENTO_MAX_SEG)
+                    print(f"[POOL RESPUESTAS] Regeneracion de '{etiqueta}' fallida, proximo intento en {espera:.0f}s")
+                _proximo_intento[etiqueta] = time.monotonic() + espera
+
+    threading.Thread(target=_ejecutar, daemon=True).start()
+
+
+def responder_desde_pool(etiqueta: str, prompt_sistema: str, pregunta: str, numero_usuario: str) -> Optional[str]:
+    """
+    Devuelve una variante pre-generada vigente para la intencion.
+
+    Args:
+        etiqueta: Intencion del pool.
+        prompt_sistema: Prompt actual del helper (para validar la version).
+        pregunta: Pregunta representativa (por si hay que regenerar).
+        numero_usuario: Numero del usuario (para la frase puente opcional).
+
+    Returns:
+        La respuesta lista para enviar, o None si el pool no existe o esta
+        desactualizado (en ese caso el helper genera en vivo).
+    """
+    if not POOL_RESPUESTAS:
+        return None
+
+    pool = _obtener_pool(etiqueta)
+    if pool["version"] != version_pool(prompt_sistema) or not pool["variantes"]:
+        with _lock:
+            _fallos[etiqueta] = _fallos.get(etiqueta, 0) + 1
+        print(f"[POOL RESPUESTAS] Pool '{etiqueta}' ausente o desactualizado, se responde en vivo")
+        _regenerar_en_segundo_plano(etiqueta, prompt_sistema, pregunta)
+        return None
+
+    variante = random.choice(pool["variantes"])
+    with _lock:
+        _servidas[etiqueta] = _servidas.get(etiqueta, 0) + 1
+    print(f"[POOL RESPUESTAS] Respuesta servida desde el pool '{etiqueta}'")
+
+    if POOL_RESPUESTAS_PUENTE:
+        puente = _frase_puente(numero_usuario, variante)
+        if puente:
+            return f"{puente}\n{variante}"
+    return variante
+
+
+def estadisticas() -> Dict[str, Any]:
+    """Variantes cargadas, respuestas servidas/no servidas y regeneraciones por intencion."""
+    ahora = time.monotonic()
+    with _lock:
+        etiquetas = set(_pools) | set(_servidas) | set(_fallos)
+        return {
+            etiqueta: {
+                "version": _pools.get(etiqueta, {}).get("version"),
+                "variantes": len(_pools.get(etiqueta, {}).get("variantes", [])),
+                "servidas": _servidas.get(etiqueta, 0),
+                "sin_pool": _fallos.get(etiqueta, 0),
+                "regenerando": etiqueta in _regenerando,
+                "regeneraciones_fallidas": _fallos_regeneracion.get(etiqueta, 0),
+                "proximo_intento_seg": round(max(_proximo_intento.get(etiqueta, ahora) - ahora, 0.0), 1),
+            }
+            for etiqueta in sorted(etiquetas)
+        }
@@ -2,10 +2,32 @@
 Modulo de generacion de respuestas con OpenAI.
 
 Construye el prompt con historial filtrado y aplica un recorte duro
-para adecuar la respuesta a WhatsApp.
+para adecuar la respuesta a WhatsApp. La respuesta se lee en streaming y se
+corta en cuanto el recorte queda decidido.
 """
 
-from src.config import openai_client, GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
+from src.config import GPT_MODEL_AVANZADO, TEMPERATURA_CONVERSACION
+from src.services import conversation_summary, llm
+from src.services.prompt_builder import construir_prompt, prefijo_estatico
+from src.services.texto import RecorteIncremental
+
+# === PROMPT DEL SISTEMA ===
+# Prefijo estatico (identico para todos los usuarios); el historial va despues.
+PROMPT_SISTEMA_GENERAL = prefijo_estatico("respuesta_general", GPT_MODEL_AVANZADO, (
+    "Eres Chatbot Ads Manager, un guía conversacional que ayuda a personas sin experiencia a comprender y aprovechar la publicidad digital, "
+    "en especial a través de Google Ads. Tu rol es acompañar al usuario con explicaciones simples, ejemplos prácticos y pasos concretos, "
+    "como si fueras alguien de confianza que le enseña con calma y buena onda.\n\n"
+    "- Responde siempre con naturalidad, como si conversaras por WhatsApp.\n"
+    "- Si te saludan, responde con un saludo breve y cálido.\n"
+    "- Si te hacen una pregunta o te dan una instrucción, responde directo al tema, con amabilidad.\n"
+    "- No digas frases como 'soy un asistente' o 'fui creado para ayudarte', a menos que te lo pregunten.\n"
+    "- Usa respuestas muy breves: máximo 3 líneas de WhatsApp (35 a 45 palabras).\n"
+    "- Evita párrafos largos. Sé directo, claro y humano.\n"
+    "- Puedes incluir listas cortas si ayudan, pero que ocupen máximo 3 líneas.\n"
+    "- Usa emojis con moderación (máximo uno), solo si aportan cercanía o confianza.\n"
+    "- Nunca uses más de una exclamación seguida.\n"
+    "- Siempre responde en el idioma del usuario, con naturalidad y buena onda."
+))
 
 
 def generar_respuesta(mensaje_usuario, numero, historial):
@@ -24,67 +46,41 @@ def generar_respuesta(mensaje_usuario, numero, historial):
 
     Nota:
         Aplica recorte duro a 3 lineas no vacias y maximo 45 palabras.
+        El historial entra segun el presupuesto de tokens del modelo.
     """
     print("[GPT] Generando respuesta personalizada...")
 
-    # Extraer solo los últimos 3 mensajes útiles para el historial resumido
-    historial_resumido = historial[-3:] if len(historial) > 3 else historial
-
-    print("[DEBUG] Historial resumido usado en el system prompt:")
-    for i, h in enumerate(historial_resumido):
-        print(f"[{i}] ({h.get('role')}) → {h.get('content')}")
-
-    mensaje_system = (
-        "Eres Chatbot Ads Manager, un guía conversacional que ayuda a personas sin experiencia a comprender y aprovechar la publicidad digital, "
-        "en especial a través de Google Ads. Tu rol es acompañar al usuario con explicaciones simples, ejemplos prácticos y pasos concretos, "
-        "como si fueras alguien de confianza que le enseña con calma y buena onda.\n\n"
-        
-        f"Estás interactuando con un usuario mediante un historial como este: {historial_resumido}.\n\n"
-        
-        "- Responde siempre con naturalidad, como si conversaras por WhatsApp.\n"
-        "- Si te saludan, responde con un saludo breve y cálido.\n"
-        "- Si te hacen una pregunta o te dan una instrucción, responde directo al tema, con amabilidad.\n"
-        "- No digas frases como 'soy un asistente' o 'fui creado para ayudarte', a menos que te lo pregunten.\n"
-        "- Usa respuestas muy breves: máximo 3 líneas de WhatsApp (35 a 45 palabras).\n"
-        "- Evita párrafos largos. Sé directo, claro y humano.\n"
-        "- Puedes incluir listas cortas si ayudan, pero que ocupen máximo 3 líneas.\n"
-        "- Usa emojis con moderación (máximo uno), solo si aportan cercanía o confianza.\n"
-        "- Nunca uses más de una exclamación seguida.\n"
-        "- Siempre responde en el idioma del usuario, con naturalidad y buena onda."
+    # Lo ya resumido va como resumen; el resto del historial va una sola vez,
+    # como mensajes, dentro del presupuesto de tokens
+    historial, resumen = conversation_summary.preparar_contexto(numero, historial)
+    modelo = llm.elegir_modelo("general")
+    mensajes = construir_prompt(
+        PROMPT_SISTEMA_GENERAL, historial, modelo, mensaje_usuario, contexto=resumen
     )
-
-    mensajes = [{"role": "system", "content": mensaje_system}]
-
-    # Filtrar historial para asegurar dicts con role/content y evitar errores
-    historial_filtrado = [
-        mensaje for mensaje in historial
-        if isinstance(mensaje, dict)
-        and "role" in mensaje
-        and "content" in mensaje
-    ]
-    mensajes.extend(historial_filtrado)
+    print(f"[DEBUG] Prompt con {len(mensajes) - (3 if resumen else 2)} mensajes de historial.")
 
     try:
-        response = openai_client.chat.completions.create(
-            model=GPT_MODEL_AVANZADO,
+        # === STREAMING CON CORTE ANTICIPADO ===
+        # Se deja de leer (y se cierra el stream) apenas el recorte a 3 lineas
+        # no vacias / 45 palabras queda decidido: el resto se descartaria igual.
+        recorte = RecorteIncremental(max_lineas=3, max_palabras=45)
+        fragmentos = llm.completar_stream(
+            model=modelo,
+            tipo="general",
             messages=mensajes,
             temperature=TEMPERATURA_CONVERSACION,
             max_tokens=200,  # puedes bajar esto si quieres
         )
-
-        # === TEXTO ORIGINAL DEL MODELO ===
-        respuesta = response.choices[0].message.content.strip()
-
-        # === RECORTE DURO A 3 LÍNEAS ===
-        # 1) cortar por líneas
-        lineas = [l for l in respuesta.splitlines() if l.strip() != ""]
-        lineas = lineas[:3]  # solo las primeras 3 líneas
-        respuesta_corta = "\n".join(lineas)
-
-        # 2) opcional: limitar también palabras (ej. 45)
-        palabras = respuesta_corta.split()
-        if len(palabras) > 45:
-            respuesta_corta = " ".join(palabras[:45])
+        try:
+            for fragmento in fragmentos:
+                if recorte.agregar(fragmento):
+                    break
+        finally:
+            fragmentos.close()
+
+        respuesta_corta = recorte.resultado()
+        if not respuesta_corta:
+            raise ValueError("respuesta vacia del modelo")
 
         print("[GPT] Respuesta generada y recortada a 3 líneas.")
         return respuesta_corta
@@ -0,0 +1,106 @@
+"""
+Cache semantico de respuestas para intenciones tipo FAQ.
+
+Las intenciones de contenido fijo (creador, que es Google Ads, costo) generan
+casi la misma explicacion en cada activacion. Este cache guarda las respuestas
+generadas junto con un embedding TF-IDF (n-gramas de caracteres, sin
+entrenamiento) de la pregunta normalizada; si llega una consulta casi igual
+(similitud coseno >= CACHE_SEMANTICO_UMBRAL) se devuelve al azar una de las
+variantes guardadas, sin llamar a GPT.
+
+Las variantes se sirven a cualquier usuario: solo deben guardarse respuestas
+generadas sin historial ni resumen de la conversacion (el router guarda solo
+las de origen "generica").
+
+Cada intencion define su TTL (cache_semantico_ttl_seg en su INTENCION) y tiene
+un maximo de entradas; al superarlo se descarta la mas antigua.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from src.config import CACHE_SEMANTICO_MAX_POR_INTENCION, CACHE_SEMANTICO_UMBRAL
+from src.services.texto import normalizar_texto
+
+# Vectorizador sin estado: no requiere ajuste y produce vectores con norma L2,
+# por lo que el producto punto es directamente la similitud coseno.
+_vectorizador = HashingVectorizer(
+    analyzer="char_wb",
+    ngram_range=(3, 5),
+    n_features=2 ** 18,
+    alternate_sign=False,
+    norm="l2",
+)
+
+# === ESTADO ===
+_lock = threading.Lock()
+_entradas: Dict[str, List[Dict[str, Any]]] = {}
+_aciertos: Dict[str, int] = {}
+_fallos: Dict[str, int] = {}
+
+
+def _embedding(pregunta: str) -> Any:
+    """Vector de la pregunta normalizada."""
+    return _vectorizador.transform([normalizar_texto(pregunta)])
+
+
+# === API PUBLICA ===
+def buscar(etiqueta: str, pregunta: str) -> Optional[str]:
+    """Busca una respuesta cacheada para una consulta casi igual.
+
+    Args:
+        etiqueta: Intencion (cada una tiene su propio espacio).
+        pregunta: Mensaje del usuario.
+
+    Returns:
+        Una variante cacheada al azar entre las que superan el umbral, o None.
+    """
+    vector = _embedding(pregunta)
+    ahora = time.monotonic()
+    with _lock:
+        vigentes = [e for e in _entradas.get(etiqueta, []) if e["expira"] > ahora]
+        _entradas[etiqueta] = vigentes
+        candidatas = [
+            e["respuesta"] for e in vigentes
+            if float(vector.multiply(e["vector"]).sum()) >= CACHE_SEMANTICO_UMBRAL
+        ]
+        if candidatas:
+            _aciertos[etiqueta] = _aciertos.get(etiqueta, 0) + 1
+            return random.choice(candidatas)
+        _fallos[etiqueta] = _fallos.get(etiqueta, 0) + 1
+        return None
+
+
+def guardar(etiqueta: str, pregunta: str, respuesta: str, ttl_seg: float) -> None:
+    """Guarda una respuesta generica (sin datos del usuario) para consultas similares."""
+    entrada = {
+        "vector": _embedding(pregunta),
+        "respuesta": respuesta,
+        "expira": time.monotonic() + ttl_seg,
+    }
+    with _lock:
+        entradas = _entradas.setdefault(etiqueta, [])
+        entradas.append(entrada)
+        # Desalojo FIFO: se descarta la variante mas antigua.
+        del entradas[:-CACHE_SEMANTICO_MAX_POR_INTENCION]
+
+
+def estadisticas() -> Dict[str, Any]:
+    """Tasa de aciertos y entradas por intencion."""
+    with _lock:
+        etiquetas = set(_entradas) | set(_aciertos) | set(_fallos)
+        resultado = {}
+        for etiqueta in sorted(etiquetas):
+            aciertos = _aciertos.get(etiqueta, 0)
+            consultas = aciertos + _fallos.get(etiqueta, 0)
+            resultado[etiqueta] = {
+                "entradas": len(_entradas.get(etiqueta, [])),
+                "aciertos": aciertos,
+                "consultas": consultas,
+                "tasa_aciertos": round(aciertos / consultas, 3) if consultas else 0.0,
+            }
+    return resultado
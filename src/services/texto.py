@@ -0,0 +1,85 @@
+"""
+Utilidades de normalizacion de texto compartidas por los servicios.
+
+Normaliza mensajes de WhatsApp para compararlos de forma estable: minusculas,
+sin acentos, sin signos de puntuacion y con espacios colapsados. Tambien
+recorta respuestas a un maximo de lineas y palabras, incluso mientras llegan
+por fragmentos (streaming).
+"""
+
+import re
+import unicodedata
+from typing import List
+
+_NO_ALFANUMERICO = re.compile(r"[^\w\s]", flags=re.UNICODE)
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza un texto para comparaciones (acentos, mayusculas, puntuacion).
+
+    Args:
+        texto: Texto original del usuario.
+
+    Returns:
+        Texto en minusculas, sin acentos ni puntuacion y con espacios simples.
+        La enie se conserva como "n" (p. ej. "campaña" -> "campana").
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    sin_puntuacion = _NO_ALFANUMERICO.sub(" ", sin_acentos).replace("_", " ")
+    return _ESPACIOS.sub(" ", sin_puntuacion).strip()
+
+
+def recortar_texto(texto: str, max_lineas: int, max_palabras: int) -> str:
+    """Recorte duro para WhatsApp: primeras lineas no vacias y maximo de palabras.
+
+    Args:
+        texto: Texto generado por el modelo.
+        max_lineas: Lineas no vacias que se conservan.
+        max_palabras: Palabras maximas; si se superan, se unen con espacios.
+
+    Returns:
+        Texto recortado.
+    """
+    lineas = [l for l in texto.strip().splitlines() if l.strip() != ""]
+    recortado = "\n".join(lineas[:max_lineas])
+    palabras = recortado.split()
+    if len(palabras) > max_palabras:
+        recortado = " ".join(palabras[:max_palabras])
+    return recortado
+
+
+class RecorteIncremental:
+    """Aplica recortar_texto a un texto que llega por fragmentos.
+
+    agregar() indica cuando el recorte ya esta decidido (empezo una linea no
+    vacia de mas o una palabra de mas); desde ese punto el resto del texto se
+    descartaria igual, asi que se puede dejar de leer el stream.
+
+    Args:
+        max_lineas: Lineas no vacias que se conservan.
+        max_palabras: Palabras maximas.
+    """
+
+    def __init__(self, max_lineas: int, max_palabras: int) -> None:
+        self.max_lineas = max_lineas
+        self.max_palabras = max_palabras
+        self._partes: List[str] = []
+        self.completo = False
+
+    def agregar(self, fragmento: str) -> bool:
+        """Suma un fragmento; devuelve True cuando ya no hace falta leer mas."""
+        if self.completo:
+            return True
+        self._partes.append(fragmento)
+        lineas = [l for l in "".join(self._partes).splitlines() if l.strip() != ""]
+        if len(lineas) > self.max_lineas:
+            self.completo = True
+        elif sum(len(l.split()) for l in lineas) > self.max_palabras:
+            self.completo = True
+        return self.completo
+
+    def resultado(self) -> str:
+        """Texto recortado con lo recibido hasta ahora."""
+        return recortar_texto("".join(self._partes), self.max_lineas, self.max_palabras)
@@ -0,0 +1,50 @@
+"""
+Configuracion comun de las pruebas.
+
+Las pruebas no usan credenciales ni red: antes de importar src se define una
+API key de prueba y se reemplazan por mocks las conexiones que los modulos
+abren al importarse (Firebase y Google Sheets). Los clientes no se usan; cada
+prueba parchea lo que necesita.
+
+Si una dependencia no esta instalada su parche se omite, y los modulos de
+prueba que la necesitan se saltan con pytest.importorskip.
+
+Uso (desde la raiz del repositorio):
+    python -m pytest -q
+"""
+
+import os
+from unittest import mock
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-prueba")
+
+try:
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+except ImportError:
+    firebase_admin = None
+else:
+    mock.patch.object(credentials, "Certificate").start()
+    mock.patch.object(firebase_admin, "initialize_app").start()
+    mock.patch.object(firestore, "client").start()
+
+try:
+    import gspread
+    from google.oauth2.service_account import Credentials
+except ImportError:
+    gspread = None
+else:
+    mock.patch.object(Credentials, "from_service_account_file").start()
+    mock.patch.object(gspread, "authorize").start()
+
+
+@pytest.fixture(autouse=True)
+def tokens_sin_red(monkeypatch):
+    """tiktoken descarga sus tablas en el primer uso: se cuenta por caracteres."""
+    try:
+        from src.services import prompt_builder
+    except ImportError:
+        return
+    monkeypatch.setattr(prompt_builder, "_codificador", lambda modelo: None)
@@ -0,0 +1,105 @@
+"""Pruebas del resumen incremental de la conversacion (sin Firestore ni OpenAI)."""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from src.services import conversation_summary  # noqa: E402
+from src.services.cache import CacheTTL  # noqa: E402
+
+NUMERO = "59170000000"
+
+
+def _historial(cantidad):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"mensaje {i}", "timestamp": f"{i:04d}"}
+        for i in range(cantidad)
+    ]
+
+
+@pytest.fixture
+def resumenes(monkeypatch):
+    """Resumenes y mensajes en memoria en lugar de Firestore."""
+    guardados = {}
+    mensajes = _historial(10)
+    monkeypatch.setattr(conversation_summary, "RESUMEN_CONVERSACION", True)
+    monkeypatch.setattr(conversation_summary, "RESUMEN_MENSAJES_RECIENTES", 2)
+    monkeypatch.setattr(conversation_summary, "_cache", CacheTTL(10, 60))
+    monkeypatch.setattr(conversation_summary, "_turnos", {})
+    monkeypatch.setattr(conversation_summary, "_actualizando", set())
+    monkeypatch.setattr(conversation_summary, "leer_resumen", lambda numero: guardados.get(numero))
+    monkeypatch.setattr(
+        conversation_summary, "guardar_resumen",
+        lambda numero, texto, hasta: guardados.__setitem__(numero, {"texto": texto, "hasta": hasta}),
+    )
+    monkeypatch.setattr(
+        conversation_summary, "leer_mensajes_desde",
+        lambda numero, desde, limite: [m for m in mensajes if m["timestamp"] > desde][:limite],
+    )
+    return guardados
+
+
+def test_sin_resumen_el_historial_queda_igual(resumenes):
+    historial = _historial(6)
+
+    assert conversation_summary.preparar_contexto(NUMERO, historial) == (historial, None)
+
+
+def test_lo_resumido_se_reemplaza_por_el_resumen(resumenes):
+    resumenes[NUMERO] = {"texto": "Rosa tiene una panadería en El Alto.", "hasta": "0005"}
+    historial = _historial(10) + [{"role": "user", "content": "mensaje actual"}]
+
+    recortado, contexto = conversation_summary.preparar_contexto(NUMERO, historial)
+
+    # Quedan los posteriores al resumen y siempre los ultimos RESUMEN_MENSAJES_RECIENTES.
+    assert [m["content"] for m in recortado] == [f"mensaje {i}" for i in range(6, 10)] + ["mensaje actual"]
+    assert "Rosa tiene una panadería en El Alto." in contexto
+
+
+def test_actualizar_incorpora_solo_los_mensajes_nuevos(resumenes, monkeypatch):
+    resumenes[NUMERO] = {"texto": "Resumen viejo.", "hasta": "0007"}
+    prompts = []
+
+    def completar(**kwargs):
+        prompts.append(kwargs["messages"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Resumen nuevo."))])
+
+    monkeypatch.setattr(conversation_summary.llm, "completar", completar)
+
+    resumen = conversation_summary.actualizar_resumen(NUMERO)
+
+    assert resumen == {"texto": "Resumen nuevo.", "hasta": "0009"}
+    assert resumenes[NUMERO] == resumen
+    assert "Resumen viejo." in prompts[0][1]["content"]
+    assert "mensaje 7" not in prompts[0][2]["content"]
+    assert "mensaje 8" in prompts[0][2]["content"] and "mensaje 9" in prompts[0][2]["content"]
+    # El cache ya tiene el resumen nuevo para el proximo prompt.
+    assert conversation_summary.obtener_resumen(NUMERO) == resumen
+
+
+def test_fallo_de_gpt_conserva_el_resumen_anterior(resumenes, monkeypatch):
+    resumenes[NUMERO] = {"texto": "Resumen viejo.", "hasta": "0007"}
+
+    def completar_caido(**kwargs):
+        raise TimeoutError("OpenAI no responde")
+
+    monkeypatch.setattr(conversation_summary.llm, "completar", completar_caido)
+
+    assert conversation_summary.actualizar_resumen(NUMERO) is None
+    assert resumenes[NUMERO] == {"texto": "Resumen viejo.", "hasta": "0007"}
+
+
+def test_se_actualiza_cada_n_turnos(resumenes, monkeypatch):
+    actualizados = []
+    monkeypatch.setattr(conversation_summary, "actualizar_resumen", actualizados.append)
+    monkeypatch.setattr(
+        conversation_summary, "threading",
+        SimpleNamespace(Thread=lambda target, daemon: SimpleNamespace(start=target)),
+    )
+
+    for _ in range(2 * conversation_summary.RESUMEN_CADA_TURNOS + 1):
+        conversation_summary.registrar_turno(NUMERO)
+
+    assert actualizados == [NUMERO, NUMERO]
@@ -0,0 +1,135 @@
+"""Pruebas del pool de segundo plano del webhook."""
+
+import os
+import threading
+
+import pytest
+
+from src.services import dispatcher
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Dispatcher con estado limpio (2 workers, 4 cupos) que se apaga al final."""
+    monkeypatch.setattr(dispatcher, "WEBHOOK_WORKERS", 2)
+    monkeypatch.setattr(dispatcher, "WEBHOOK_MAX_PENDIENTES", 4)
+    monkeypatch.setattr(dispatcher, "WEBHOOK_ESPERA_COLA_SEG", 0.05)
+    monkeypatch.setattr(dispatcher, "_executor", None)
+    monkeypatch.setattr(dispatcher, "_cupos", threading.BoundedSemaphore(4))
+    monkeypatch.setattr(dispatcher, "_pendientes", 0)
+    monkeypatch.setattr(dispatcher, "_rechazadas", 0)
+    monkeypatch.setattr(dispatcher, "_buzones", {})
+    yield dispatcher
+    dispatcher.apagar(esperar=True, timeout=10)
+
+
+def _bloqueante(evento, hechas):
+    evento.wait(5)
+    hechas.append(threading.current_thread().name)
+
+
+# === BACKPRESSURE ===
+def test_pool_saturado_rechaza_y_cuenta_el_rechazo(pool):
+    evento, hechas = threading.Event(), []
+    assert all(pool.encolar(_bloqueante, evento, hechas) for _ in range(4))
+
+    assert not pool.encolar(_bloqueante, evento, hechas)
+    assert not pool.reservar()
+    estado = pool.estado_cola()
+    assert estado["pendientes"] == 4
+    assert estado["en_cola"] == 2
+    assert estado["rechazadas"] == 2
+
+    evento.set()
+    pool.apagar(esperar=True, timeout=5)
+    assert len(hechas) == 4
+    assert pool.estado_cola()["pendientes"] == 0
+
+
+def test_liberar_reserva_devuelve_el_cupo(pool):
+    assert all(pool.reservar() for _ in range(4))
+    assert not pool.reservar()
+
+    pool.liberar_reserva()
+
+    assert pool.reservar()
+    assert pool.estado_cola()["pendientes"] == 4
+    for _ in range(4):
+        pool.liberar_reserva()
+
+
+def test_apagar_drena_las_tareas_pendientes(pool):
+    hechas = []
+    evento = threading.Event()
+    evento.set()
+    for _ in range(3):
+        assert pool.encolar(_bloqueante, evento, hechas)
+
+    pool.apagar(esperar=True, timeout=5)
+
+    assert len(hechas) == 3
+    assert pool._executor is None
+
+
+def test_modo_procesos_usa_spawn_e_importa_el_modulo_de_la_tarea(pool, monkeypatch):
+    monkeypatch.setattr(dispatcher, "WEBHOOK_MODO_POOL", "processes")
+    resultados = []
+
+    assert dispatcher.encolar(os.getpid)
+    executor = dispatcher._executor
+    executor.submit(os.getpid).add_done_callback(lambda future: resultados.append(future.result()))
+    dispatcher.apagar(esperar=True, timeout=30)
+
+    assert executor._mp_context.get_start_method() == "spawn"
+    assert executor._initializer is dispatcher._iniciar_proceso
+    assert executor._initargs == (os.getpid.__module__,)
+    assert resultados and resultados[0] != os.getpid()
+
+
+# === BUZONES POR CLAVE ===
+def _registrar_turno(registro, clave, indice, demora):
+    registro.append(("inicio", clave, indice))
+    threading.Event().wait(demora)
+    registro.append(("fin", clave, indice))
+
+
+def test_buzon_ejecuta_los_turnos_de_una_clave_en_orden_y_de_a_uno(pool):
+    registro = []
+    for indice in range(3):
+        assert pool.encolar(_registrar_turno, registro, "a", indice, 0.05, clave="a")
+    assert pool.estado_cola()["esperando_en_buzones"] == 2
+
+    pool.apagar(esperar=True, timeout=5)
+
+    assert registro == [
+        ("inicio", "a", 0), ("fin", "a", 0),
+        ("inicio", "a", 1), ("fin", "a", 1),
+        ("inicio", "a", 2), ("fin", "a", 2),
+    ]
+    assert pool._buzones == {}
+
+
+def test_claves_distintas_avanzan_en_paralelo(pool):
+    registro = []
+    assert pool.encolar(_registrar_turno, registro, "a", 0, 0.2, clave="a")
+    assert pool.encolar(_registrar_turno, registro, "b", 0, 0.0, clave="b")
+
+    pool.apagar(esperar=True, timeout=5)
+
+    # "b" termina mientras "a" sigue corriendo.
+    assert registro.index(("fin", "b", 0)) < registro.index(("fin", "a", 0))
+
+
+def test_error_en_un_turno_no_frena_el_buzon(pool):
+    registro = []
+
+    def fallar():
+        raise RuntimeError("turno roto")
+
+    assert pool.encolar(fallar, clave="a")
+    assert pool.encolar(_registrar_turno, registro, "a", 1, 0.0, clave="a")
+
+    pool.apagar(esperar=True, timeout=5)
+
+    assert registro == [("inicio", "a", 1), ("fin", "a", 1)]
+    assert pool.estado_cola()["pendientes"] == 0
@@ -0,0 +1,95 @@
+"""Pruebas del servidor local compatible con OpenAI, usado desde el SDK real."""
+
+import json
+
+import httpx
+import openai
+import pytest
+
+import fake_openai_server as servidor
+from src.services import llm
+
+MENSAJES = [{"role": "system", "content": "Eres un asistente."}, {"role": "user", "content": "¿Cuánto cuesta?"}]
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente del SDK que habla con la app Flask en memoria (sin red ni latencia)."""
+    monkeypatch.setattr(servidor, "CONFIGURACION", {
+        **servidor.CONFIGURACION, "latencia": "fija:0", "demora_fragmento_seg": 0.0,
+        "tasa_errores": 0.0, "tasa_cuelgues": 0.0,
+    })
+    monkeypatch.setattr(servidor, "_grabaciones", {})
+    monkeypatch.setattr(servidor, "_guion", [])
+    monkeypatch.setattr(servidor, "_contadores", {clave: 0 for clave in servidor._contadores})
+    return openai.OpenAI(
+        api_key="falsa",
+        base_url="http://falso/v1",
+        max_retries=0,
+        http_client=httpx.Client(transport=httpx.WSGITransport(app=servidor.app)),
+    )
+
+
+def _contenido(cliente, **kwargs):
+    parametros = {"model": "gpt-4o-mini", "messages": MENSAJES, **kwargs}
+    return cliente.chat.completions.create(**parametros).choices[0].message.content
+
+
+def test_respuestas_por_defecto_segun_el_tipo_de_llamada(cliente):
+    assert _contenido(cliente) == servidor.RESPUESTA_TEXTO_DEFECTO
+    assert _contenido(cliente, max_tokens=3) == "no"
+    clasificador = [{"role": "system", "content": "Responde {\"intenciones\": [...]}"}, MENSAJES[1]]
+    assert json.loads(_contenido(cliente, messages=clasificador, response_format={"type": "json_object"})) == {
+        "intenciones": []
+    }
+
+
+def test_guion_por_texto_del_usuario(cliente, tmp_path):
+    guion = tmp_path / "guion.json"
+    guion.write_text(json.dumps([{"si_contiene": "cuesta", "respuesta": {"intenciones": ["costo_google_ads"]}}]))
+    servidor.cargar_guion(str(guion))
+
+    assert json.loads(_contenido(cliente)) == {"intenciones": ["costo_google_ads"]}
+    assert servidor._contadores["guion"] == 1
+
+
+def test_reproduce_lo_grabado_por_el_servicio(cliente, tmp_path, monkeypatch):
+    grabacion = tmp_path / "respuestas.jsonl"
+    monkeypatch.setattr(llm, "LLM_GRABAR_RESPUESTAS", str(grabacion))
+    llm._grabar_respuesta("general", "gpt-4o-mini", MENSAJES, "Desde Bs 5 al día.")
+
+    servidor.cargar_grabaciones(str(grabacion))
+
+    # La huella no depende del modelo ni de los parametros de la llamada.
+    assert _contenido(cliente, model="otro-modelo", temperature=0.7) == "Desde Bs 5 al día."
+    assert servidor._contadores["grabadas"] == 1
+
+
+def test_streaming_con_uso(cliente):
+    stream = cliente.chat.completions.create(
+        model="gpt-4o-mini", messages=MENSAJES, stream=True, stream_options={"include_usage": True}
+    )
+    chunks = list(stream)
+
+    texto = "".join(c.choices[0].delta.content or "" for c in chunks if c.choices)
+    assert texto == servidor.RESPUESTA_TEXTO_DEFECTO
+    assert chunks[-1].usage.completion_tokens > 0
+
+
+def test_errores_inyectados_con_formato_de_openai(cliente, monkeypatch):
+    monkeypatch.setitem(servidor.CONFIGURACION, "tasa_errores", 1.0)
+    monkeypatch.setitem(servidor.CONFIGURACION, "codigos_error", [429])
+
+    with pytest.raises(openai.RateLimitError):
+        _contenido(cliente)
+    assert servidor._contadores["errores"] == 1
+
+
+@pytest.mark.parametrize("especificacion", ["fija:0.2", "uniforme:0.1,0.3", "normal:0.2,0.05", "lognormal:-1.5,0.3"])
+def test_distribuciones_de_latencia(especificacion):
+    assert all(servidor.muestrear_latencia(especificacion) >= 0 for _ in range(20))
+
+
+def test_distribucion_desconocida():
+    with pytest.raises(ValueError):
+        servidor.muestrear_latencia("exponencial:1")
@@ -0,0 +1,417 @@
+"""Pruebas del almacenamiento de conversaciones (sin Firestore real)."""
+
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from google.api_core.exceptions import AlreadyExists  # noqa: E402
+
+from src.data import firestore_storage  # noqa: E402
+from src.services.cache import CacheTTL  # noqa: E402
+
+NUMERO = "59170000000"
+
+
+class FirestoreFalso:
+    """Ventana reciente en memoria en lugar de los documentos de Firestore."""
+
+    def __init__(self):
+        self.ventanas = {}
+        self.commits = []
+
+    def escribir(self, numero, mensajes):
+        ventana = self.ventanas.setdefault(numero, {"user": [], "assistant": []})
+        for mensaje in mensajes:
+            role = mensaje["role"]
+            ventana[role] = (ventana[role] + [mensaje])[-firestore_storage.VENTANA_MAX_POR_ROL:]
+        self.commits.append((numero, list(mensajes)))
+
+    def leer(self, numero):
+        ventana = self.ventanas.get(numero)
+        if ventana is None:
+            return None
+        return {role: list(mensajes) for role, mensajes in ventana.items()}
+
+
+class SnapFalso:
+    def __init__(self, datos):
+        self.exists = datos is not None
+        self._datos = datos
+
+    def to_dict(self):
+        return dict(self._datos)
+
+
+class RefFalsa:
+    """Coleccion o documento: la ruta completa es la clave en BaseFalsa.docs."""
+
+    def __init__(self, base, ruta):
+        self.base = base
+        self.ruta = ruta
+
+    def collection(self, nombre):
+        return RefFalsa(self.base, self.ruta + (nombre,))
+
+    def document(self, id_doc):
+        return RefFalsa(self.base, self.ruta + (id_doc,))
+
+    def get(self, transaction=None):
+        self.base.lecturas.append(self.ruta)
+        return SnapFalso(self.base.docs.get(self.ruta))
+
+    def set(self, datos, merge=False):
+        actual = self.base.docs.get(self.ruta) if merge else None
+        self.base.docs[self.ruta] = {**(actual or {}), **datos}
+
+    def create(self, datos):
+        if self.ruta in self.base.docs:
+            raise AlreadyExists(f"{self.ruta} ya existe")
+        self.set(datos)
+
+
+class EscrituraFalsa:
+    """Transaccion o batch: aplica las escrituras al confirmar."""
+
+    def __init__(self, base):
+        self.base = base
+        self.operaciones = []
+
+    def set(self, ref, datos, merge=False):
+        self.operaciones.append(("set", ref, datos, merge))
+        ref.set(datos, merge=merge)
+
+    def create(self, ref, datos):
+        self.operaciones.append(("create", ref, datos, False))
+
+    def commit(self):
+        if any(op == "create" and ref.ruta in self.base.docs for op, ref, _, _ in self.operaciones):
+            raise AlreadyExists("el lote tiene un documento existente")
+        for op, ref, datos, _ in self.operaciones:
+            if op == "create":
+                ref.set(datos)
+        self.base.commits += 1
+
+
+class BaseFalsa:
+    """Cliente de Firestore en memoria con lo que usa firestore_storage."""
+
+    def __init__(self):
+        self.docs = {}
+        self.lecturas = []
+        self.commits = 0
+
+    def collection(self, nombre):
+        return RefFalsa(self, (nombre,))
+
+    def transaction(self):
+        return EscrituraFalsa(self)
+
+    def batch(self):
+        return EscrituraFalsa(self)
+
+    def archivo(self, numero):
+        ruta = (firestore_storage.COLECCION_CONVERSACIONES, numero, firestore_storage.SUBCOLECCION_MENSAJES)
+        return [datos for clave, datos in sorted(self.docs.items()) if clave[:-1] == ruta]
+
+    def ventana(self, numero):
+        return self.docs.get((firestore_storage.COLECCION_VENTANA_RECIENTE, numero))
+
+
+@pytest.fixture
+def base(monkeypatch):
+    """Firestore en memoria, escritura inmediata y sin cache de historial."""
+    falsa = BaseFalsa()
+    monkeypatch.setattr(firestore_storage, "db", falsa)
+    # Sin la maquinaria de reintentos de @firestore.transactional.
+    monkeypatch.setattr(firestore_storage, "_agregar_en_transaccion", firestore_storage._agregar_en_transaccion.to_wrap)
+    monkeypatch.setattr(firestore_storage, "ESCRITURA_DIFERIDA", False)
+    monkeypatch.setattr(firestore_storage, "HISTORIAL_CACHE", False)
+    monkeypatch.setattr(firestore_storage, "_pendientes", {})
+    monkeypatch.setattr(firestore_storage, "_en_escritura", {})
+    # La consulta por rol sobre el archivo (indice compuesto) se resuelve en memoria.
+    monkeypatch.setattr(
+        firestore_storage, "_ultimos_por_rol",
+        lambda numero, role, maximo: [m for m in reversed(falsa.archivo(numero)) if m["role"] == role][:maximo],
+    )
+    return falsa
+
+
+@pytest.fixture
+def almacen(monkeypatch):
+    """Estado del modulo limpio, escritura diferida y cache activos."""
+    falso = FirestoreFalso()
+    monkeypatch.setattr(firestore_storage, "ESCRITURA_DIFERIDA", True)
+    monkeypatch.setattr(firestore_storage, "HISTORIAL_CACHE", True)
+    monkeypatch.setattr(firestore_storage, "_pendientes", {})
+    monkeypatch.setattr(firestore_storage, "_en_escritura", {})
+    monkeypatch.setattr(firestore_storage, "_guardados_por_usuario", {})
+    monkeypatch.setattr(firestore_storage, "_cache_historial", CacheTTL(100, 300))
+    # Un valor cualquiera evita que _encolar arranque el hilo de vaciado.
+    monkeypatch.setattr(firestore_storage, "_hilo_vaciado", object())
+    monkeypatch.setattr(firestore_storage, "_escribir_mensajes", falso.escribir)
+    monkeypatch.setattr(firestore_storage, "_leer_ventana", falso.leer)
+    monkeypatch.setattr(
+        firestore_storage, "_ventana_desde_archivo", lambda numero: {"user": [], "assistant": []}
+    )
+    return falso
+
+
+def _contenidos(historial):
+    return [(m["role"], m["content"]) for m in historial]
+
+
+# === CACHE DE HISTORIAL ===
+def test_vaciado_a_mitad_de_turno_no_pierde_la_respuesta_anterior(almacen):
+    firestore_storage.guardar_mensaje(NUMERO, "user", "hola")
+    firestore_storage.guardar_mensaje(NUMERO, "assistant", "respuesta anterior")
+
+    # Inicio del turno siguiente: la respuesta del bot sigue en la cola.
+    inicio = firestore_storage.leer_historial(NUMERO, refrescar=True)
+    firestore_storage.vaciar_pendientes()
+    durante = firestore_storage.leer_historial(NUMERO)
+
+    esperado = [("user", "hola"), ("assistant", "respuesta anterior")]
+    assert _contenidos(inicio) == esperado
+    assert _contenidos(durante) == esperado
+    assert firestore_storage._pendientes_de(NUMERO) == []
+
+
+def test_lectura_concurrente_con_el_vaciado_no_pierde_pendientes(almacen, monkeypatch):
+    firestore_storage.guardar_mensaje(NUMERO, "assistant", "respuesta anterior")
+    leer = almacen.leer
+
+    def leer_mientras_se_vacia(numero):
+        # Firestore responde con la ventana previa y el vaciado confirma y
+        # saca el mensaje de la cola antes de que la lectura vuelva.
+        previa = leer(numero)
+        firestore_storage.vaciar_pendientes()
+        return previa
+
+    monkeypatch.setattr(firestore_storage, "_leer_ventana", leer_mientras_se_vacia)
+
+    historial = firestore_storage.leer_historial(NUMERO, refrescar=True)
+
+    assert _contenidos(historial) == [("assistant", "respuesta anterior")]
+    assert _contenidos(firestore_storage.leer_historial(NUMERO)) == [("assistant", "respuesta anterior")]
+
+
+def test_ventana_cacheada_no_duplica_lo_ya_escrito(almacen):
+    firestore_storage.guardar_mensaje(NUMERO, "user", "hola")
+    firestore_storage.vaciar_pendientes()
+    firestore_storage.guardar_mensaje(NUMERO, "assistant", "respuesta")
+
+    firestore_storage.leer_historial(NUMERO, refrescar=True)
+    firestore_storage.vaciar_pendientes()
+    historial = firestore_storage.leer_historial(NUMERO)
+
+    assert _contenidos(historial) == [("user", "hola"), ("assistant", "respuesta")]
+
+
+# === ARCHIVO: UN DOCUMENTO POR MENSAJE ===
+def test_cada_mensaje_es_un_documento_nuevo_del_archivo(base):
+    base.docs[(firestore_storage.COLECCION_CONVERSACIONES, NUMERO)] = {"nombre": "Rosa"}
+
+    firestore_storage.guardar_mensaje(NUMERO, "user", "hola")
+    firestore_storage.guardar_mensaje(NUMERO, "assistant", "¿Cómo se llama tu empresa?")
+
+    assert _contenidos(base.archivo(NUMERO)) == [("user", "hola"), ("assistant", "¿Cómo se llama tu empresa?")]
+    padre = base.docs[(firestore_storage.COLECCION_CONVERSACIONES, NUMERO)]
+    assert padre["nombre"] == "Rosa"
+    assert padre["ultima_actualizacion"] == base.archivo(NUMERO)[-1]["timestamp"]
+    # Cada escritura lee solo la ventana, nunca el archivo ni el padre.
+    assert set(base.lecturas) == {(firestore_storage.COLECCION_VENTANA_RECIENTE, NUMERO)}
+
+
+def test_ids_del_archivo_ordenan_cronologicamente():
+    ids = [
+        firestore_storage._id_mensaje("2026-10-18T09:59:59.900000"),
+        firestore_storage._id_mensaje("2026-10-18T10:00:00.100000"),
+        firestore_storage._id_mensaje("2026-10-18T10:00:01"),
+    ]
+
+    assert sorted(ids) == ids
+
+
+# === VENTANA RECIENTE (BUFFER CIRCULAR POR ROL) ===
+def test_ventana_guarda_solo_los_ultimos_de_cada_rol(base):
+    maximo = firestore_storage.VENTANA_MAX_POR_ROL
+    for i in range(maximo + 3):
+        firestore_storage.guardar_mensaje(NUMERO, "user", f"pregunta {i}")
+    firestore_storage.guardar_mensaje(NUMERO, "assistant", "respuesta")
+
+    ventana = base.ventana(NUMERO)
+    assert [m["content"] for m in ventana["user"]] == [f"pregunta {i}" for i in range(3, maximo + 3)]
+    assert [m["content"] for m in ventana["assistant"]] == ["respuesta"]
+    assert len(base.archivo(NUMERO)) == maximo + 4
+
+
+def test_ventana_nueva_se_arma_desde_el_archivo(base):
+    anteriores = [
+        {"role": "user", "content": "hola", "timestamp": "2026-01-01T00:00:00"},
+        {"role": "assistant", "content": "¿Cómo se llama tu empresa?", "timestamp": "2026-01-01T00:00:01"},
+    ]
+    for mensaje in anteriores:
+        base.collection(firestore_storage.COLECCION_CONVERSACIONES).document(NUMERO).collection(
+            firestore_storage.SUBCOLECCION_MENSAJES
+        ).document(firestore_storage._id_mensaje(mensaje["timestamp"])).set(mensaje)
+
+    firestore_storage.guardar_mensaje(NUMERO, "user", "Panadería Rosa")
+
+    ventana = base.ventana(NUMERO)
+    assert [m["content"] for m in ventana["user"]] == ["hola", "Panadería Rosa"]
+    assert [m["content"] for m in ventana["assistant"]] == ["¿Cómo se llama tu empresa?"]
+
+
+def test_sin_ventana_ni_semilla_no_escribe(base):
+    mensaje = {"role": "user", "content": "hola", "timestamp": "2026-01-01T00:00:00"}
+
+    assert not firestore_storage._agregar_en_transaccion(base.transaction(), NUMERO, [mensaje], None)
+    assert base.docs == {}
+
+
+def test_historial_lee_un_solo_documento(base, monkeypatch):
+    for i in range(3):
+        firestore_storage.guardar_mensaje(NUMERO, "user", f"pregunta {i}")
+        firestore_storage.guardar_mensaje(NUMERO, "assistant", f"respuesta {i}")
+
+    def archivo_no_esperado(*args):
+        raise AssertionError("no deberia consultar el archivo")
+
+    monkeypatch.setattr(firestore_storage, "_ultimos_por_rol", archivo_no_esperado)
+    base.lecturas.clear()
+
+    historial = firestore_storage.leer_historial(NUMERO, max_user=2, max_bot=2)
+
+    assert _contenidos(historial) == [
+        ("user", "pregunta 1"), ("assistant", "respuesta 1"), ("user", "pregunta 2"), ("assistant", "respuesta 2"),
+    ]
+    assert base.lecturas == [(firestore_storage.COLECCION_VENTANA_RECIENTE, NUMERO)]
+
+
+def test_mas_mensajes_que_la_ventana_consulta_el_archivo(base):
+    maximo = firestore_storage.VENTANA_MAX_POR_ROL
+    for i in range(maximo + 2):
+        firestore_storage.guardar_mensaje(NUMERO, "user", f"pregunta {i}")
+
+    historial = firestore_storage.leer_historial(NUMERO, max_user=maximo + 2, max_bot=0)
+
+    assert [m["content"] for m in historial] == [f"pregunta {i}" for i in range(maximo + 2)]
+
+
+# === ESCRITURA DIFERIDA ===
+@pytest.fixture
+def diferida(base, monkeypatch):
+    """Escritura diferida sobre la base en memoria, sin hilo de vaciado."""
+    monkeypatch.setattr(firestore_storage, "ESCRITURA_DIFERIDA", True)
+    monkeypatch.setattr(firestore_storage, "ESCRITURA_DIFERIDA_MAX_PENDIENTES", 100)
+    monkeypatch.setattr(firestore_storage, "_hilo_vaciado", object())
+    monkeypatch.setattr(firestore_storage, "_contadores_escritura", {clave: 0 for clave in firestore_storage._contadores_escritura})
+    return base
+
+
+def test_encolado_no_escribe_hasta_el_vaciado(diferida):
+    firestore_storage.guardar_mensaje(NUMERO, "user", "hola")
+    firestore_storage.guardar_mensaje(NUMERO, "assistant", "respuesta")
+    firestore_storage.guardar_mensaje("59171111111", "user", "buenas")
+
+    assert diferida.docs == {}
+    # El mismo proceso ve lo encolado (read-your-writes).
+    assert _contenidos(firestore_storage.leer_historial(NUMERO)) == [("user", "hola"), ("assistant", "respuesta")]
+
+    assert firestore_storage.vaciar_pendientes() == 3
+
+    assert _contenidos(diferida.archivo(NUMERO)) == [("user", "hola"), ("assistant", "respuesta")]
+    assert firestore_storage.estadisticas_escritura()["commits"] == 2
+
+
+def test_fallo_de_escritura_reencola_antes_de_lo_nuevo(diferida, monkeypatch):
+    escribir = firestore_storage._escribir_mensajes
+
+    def caido(numero, mensajes):
+        raise ConnectionError("Firestore no responde")
+
+    firestore_storage.guardar_mensaje(NUMERO, "user", "primero")
+    monkeypatch.setattr(firestore_storage, "_escribir_mensajes", caido)
+    assert firestore_storage.vaciar_pendientes() == 0
+
+    firestore_storage.guardar_mensaje(NUMERO, "user", "segundo")
+    assert [m["content"] for m in firestore_storage._pendientes_de(NUMERO)] == ["primero", "segundo"]
+
+    monkeypatch.setattr(firestore_storage, "_escribir_mensajes", escribir)
+    assert firestore_storage.vaciar_pendientes() == 2
+    assert [m["content"] for m in diferida.archivo(NUMERO)] == ["primero", "segundo"]
+    assert firestore_storage.estadisticas_escritura()["errores"] == 1
+
+
+def test_cola_llena_vacia_en_el_momento(diferida, monkeypatch):
+    monkeypatch.setattr(firestore_storage, "ESCRITURA_DIFERIDA_MAX_PENDIENTES", 2)
+
+    firestore_storage.guardar_mensaje(NUMERO, "user", "hola")
+    assert diferida.archivo(NUMERO) == []
+    firestore_storage.guardar_mensaje(NUMERO, "assistant", "respuesta")
+
+    assert len(diferida.archivo(NUMERO)) == 2
+    assert firestore_storage._pendientes_de(NUMERO) == []
+
+
+# === DEDUPLICACION DE MESSAGE_ID ===
+@pytest.fixture
+def ids(base, monkeypatch):
+    """Registro de IDs procesados sobre la base en memoria, con cache limpio."""
+    monkeypatch.setattr(firestore_storage, "_ids_vistos", CacheTTL(100, 300))
+    monkeypatch.setattr(
+        firestore_storage, "_contadores_deduplicacion",
+        {clave: 0 for clave in firestore_storage._contadores_deduplicacion},
+    )
+    return base
+
+
+def _registrado(base, message_id):
+    return base.docs.get((firestore_storage.COLECCION_MENSAJES_PROCESADOS, message_id))
+
+
+def test_registro_atomico_con_expiracion(ids):
+    assert firestore_storage.registrar_id_procesado("wamid.1", NUMERO)
+
+    datos = _registrado(ids, "wamid.1")
+    assert datos["numero"] == NUMERO
+    assert datos["expira_en"] > datetime.now(timezone.utc)
+    assert firestore_storage.ya_procesado("wamid.1")
+
+
+def test_reentrega_en_otra_instancia_la_rechaza_firestore(ids, monkeypatch):
+    ids.collection(firestore_storage.COLECCION_MENSAJES_PROCESADOS).document("wamid.1").set({"numero": NUMERO})
+
+    assert not firestore_storage.registrar_id_procesado("wamid.1", NUMERO)
+    assert firestore_storage.estadisticas_deduplicacion()["duplicados_firestore"] == 1
+
+    # La segunda reentrega se descarta en memoria, sin ir a Firestore.
+    monkeypatch.setattr(firestore_storage, "db", None)
+    assert not firestore_storage.registrar_id_procesado("wamid.1", NUMERO)
+    assert firestore_storage.ya_procesado("wamid.1")
+    assert firestore_storage.estadisticas_deduplicacion()["duplicados_memoria"] == 1
+
+
+def test_registro_en_bloque_un_solo_commit(ids):
+    nuevos = firestore_storage.registrar_ids_procesados(
+        [("wamid.1", NUMERO), ("wamid.2", NUMERO), ("wamid.1", NUMERO)]
+    )
+
+    assert nuevos == {"wamid.1", "wamid.2"}
+    assert ids.commits == 1
+    assert firestore_storage.registrar_ids_procesados([("wamid.1", NUMERO)]) == set()
+    assert ids.commits == 1
+
+
+def test_bloque_con_un_id_existente_registra_el_resto_de_a_uno(ids):
+    ids.collection(firestore_storage.COLECCION_MENSAJES_PROCESADOS).document("wamid.2").set({"numero": NUMERO})
+
+    nuevos = firestore_storage.registrar_ids_procesados([("wamid.1", NUMERO), ("wamid.2", NUMERO), ("wamid.3", NUMERO)])
+
+    assert nuevos == {"wamid.1", "wamid.3"}
+    assert _registrado(ids, "wamid.3") is not None
+    estadisticas = firestore_storage.estadisticas_deduplicacion()
+    assert estadisticas["registrados"] == 2
+    assert estadisticas["duplicados_firestore"] == 1
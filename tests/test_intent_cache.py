@@ -0,0 +1,77 @@
+"""Pruebas del cache de deteccion de intenciones (clasificador y detectores)."""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from src.services import intent_cache, intention_router  # noqa: E402
+from src.services.cache import CacheTTL  # noqa: E402
+from src.services.intentions import intention_costo_google_ads, intention_creador  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def cache_local(monkeypatch):
+    """Cache vacio y solo en memoria (sin Firestore)."""
+    monkeypatch.setattr(intent_cache, "_cache_local", CacheTTL(100, 300))
+    monkeypatch.setattr(intent_cache, "CACHE_INTENCIONES_COMPARTIDO", False)
+
+
+class GPTFalso:
+    """llm.completar falso: cuenta las llamadas y responde siempre lo mismo."""
+
+    def __init__(self, contenido):
+        self.contenido = contenido
+        self.llamadas = 0
+
+    def __call__(self, **kwargs):
+        self.llamadas += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.contenido))])
+
+
+@pytest.mark.parametrize("contenido, esperado", [("sí", True), ("no", False)])
+def test_detector_reutiliza_la_respuesta_para_el_mismo_texto_normalizado(monkeypatch, contenido, esperado):
+    gpt = GPTFalso(contenido)
+    monkeypatch.setattr(intention_costo_google_ads.llm, "completar", gpt)
+
+    primera = intention_costo_google_ads.es_pregunta_sobre_costo_google_ads("¿Cuánto cuesta Google Ads?")
+    segunda = intention_costo_google_ads.es_pregunta_sobre_costo_google_ads("cuanto cuesta google ads")
+
+    assert primera is esperado
+    assert segunda is esperado
+    assert gpt.llamadas == 1
+
+
+def test_detectores_no_comparten_entradas(monkeypatch):
+    gpt = GPTFalso("no")
+    monkeypatch.setattr(intention_creador.llm, "completar", gpt)
+
+    intention_creador.es_pregunta_sobre_creador("¿Quién te creó?")
+    intention_costo_google_ads.es_pregunta_sobre_costo_google_ads("¿Quién te creó?")
+
+    assert gpt.llamadas == 2
+
+
+def test_error_del_detector_no_se_cachea(monkeypatch):
+    def completar_caido(**kwargs):
+        raise TimeoutError("OpenAI no responde")
+
+    monkeypatch.setattr(intention_creador.llm, "completar", completar_caido)
+    assert not intention_creador.es_pregunta_sobre_creador("¿Quién te creó?")
+
+    gpt = GPTFalso("sí")
+    monkeypatch.setattr(intention_creador.llm, "completar", gpt)
+    assert intention_creador.es_pregunta_sobre_creador("¿Quién te creó?")
+    assert gpt.llamadas == 1
+
+
+def test_clasificador_reutiliza_las_etiquetas(monkeypatch):
+    gpt = GPTFalso('{"intenciones": ["costo_google_ads", "inventada"]}')
+    monkeypatch.setattr(intention_router.llm, "completar", gpt)
+
+    primera = intention_router.clasificar_intenciones("¿Cuánto cuesta Google Ads?")
+    segunda = intention_router.clasificar_intenciones("cuanto cuesta google ads")
+
+    assert primera == segunda == {"costo_google_ads"}
+    assert gpt.llamadas == 1
@@ -0,0 +1,70 @@
+"""Pruebas del prefiltro local de intenciones (reglas y umbrales, sin GPT)."""
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from src.services import intent_prefilter  # noqa: E402
+from src.services.intentions import (  # noqa: E402
+    intention_bolivianismo,
+    intention_costo_google_ads,
+    intention_creador,
+    intention_que_es_google_ads,
+)
+
+INTENCIONES = [
+    intention_creador.INTENCION,
+    intention_que_es_google_ads.INTENCION,
+    intention_bolivianismo.INTENCION,
+    intention_costo_google_ads.INTENCION,
+]
+
+
+@pytest.fixture(autouse=True)
+def sin_modelo(monkeypatch):
+    """Sin modelo entrenado: lo que no resuelven las reglas queda ambiguo."""
+    monkeypatch.setattr(intent_prefilter, "_probabilidades", lambda texto: {})
+
+
+@pytest.mark.parametrize("mensaje", ["¿Quién te creó?", "quien te hizo", "¿Quién es tu creador?"])
+def test_pregunta_completa_es_positivo_seguro(mensaje):
+    positivas, ambiguas = intent_prefilter.prefiltrar(mensaje, INTENCIONES)
+
+    assert "creador" in positivas
+    assert "creador" not in ambiguas
+
+
+@pytest.mark.parametrize("mensaje", [
+    "Soy creador de contenido y quiero anuncios",
+    "Tu dueño del local me recomendó esta página",
+])
+def test_palabra_suelta_se_escala_a_gpt(mensaje):
+    positivas, ambiguas = intent_prefilter.prefiltrar(mensaje, INTENCIONES)
+
+    assert "creador" not in positivas
+    assert "creador" in ambiguas
+
+
+def test_indicio_no_lo_descarta_el_modelo(monkeypatch):
+    monkeypatch.setattr(intent_prefilter, "_probabilidades", lambda texto: {"creador": 0.0, "bolivianismo": 0.0})
+
+    positivas, ambiguas = intent_prefilter.prefiltrar("Vendo ropa en la feria, soy creador de contenido", INTENCIONES)
+
+    assert positivas == set()
+    assert {"creador", "bolivianismo"} <= ambiguas
+
+
+def test_charla_trivial_no_escala_nada():
+    assert intent_prefilter.prefiltrar("Hola, muchas gracias", INTENCIONES) == (set(), set())
+
+
+def test_umbrales_del_modelo(monkeypatch):
+    monkeypatch.setattr(
+        intent_prefilter, "_probabilidades",
+        lambda texto: {"creador": 0.01, "que_es_google_ads": 0.95, "bolivianismo": 0.5, "costo_google_ads": 0.01},
+    )
+
+    positivas, ambiguas = intent_prefilter.prefiltrar("¿Para qué sirve esa plataforma?", INTENCIONES)
+
+    assert positivas == {"que_es_google_ads"}
+    assert ambiguas == {"bolivianismo"}
@@ -0,0 +1,226 @@
+"""Pruebas del router de intenciones (sin OpenAI ni Firestore)."""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from src.services import intention_router, semantic_cache  # noqa: E402
+from src.services.helpers import helper_costo_google_ads  # noqa: E402
+from src.services.intentions import intention_costo_google_ads  # noqa: E402
+
+INTENCION = intention_costo_google_ads.INTENCION
+PREGUNTA = "¿Cuánto cuesta poner un anuncio en Google?"
+
+
+@pytest.fixture(autouse=True)
+def helper_sin_io(monkeypatch):
+    """Cache semantico vacio y helper sin pool ni Firestore."""
+    monkeypatch.setattr(semantic_cache, "_entradas", {})
+    monkeypatch.setattr(helper_costo_google_ads.response_pool, "responder_desde_pool", lambda *args: None)
+    monkeypatch.setattr(helper_costo_google_ads, "leer_historial", lambda numero: [])
+    monkeypatch.setattr(
+        helper_costo_google_ads.conversation_summary, "preparar_contexto", lambda numero, historial: (historial, None)
+    )
+
+
+def _respuesta_gpt(texto):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=texto))])
+
+
+def test_fallo_del_helper_no_llena_el_cache(monkeypatch):
+    def completar_caido(**kwargs):
+        raise TimeoutError("OpenAI no responde")
+
+    monkeypatch.setattr(helper_costo_google_ads.llm, "completar", completar_caido)
+
+    respuesta = intention_router._generar_respuesta_intencion(INTENCION, PREGUNTA, "59170000000")
+
+    assert respuesta.startswith("Google Ads no tiene un costo fijo")
+    assert semantic_cache._entradas.get(INTENCION["etiqueta"], []) == []
+    assert semantic_cache.buscar(INTENCION["etiqueta"], PREGUNTA) is None
+
+
+def test_respuesta_del_pool_no_se_cachea(monkeypatch):
+    monkeypatch.setattr(
+        helper_costo_google_ads.response_pool, "responder_desde_pool", lambda *args: "Puente del usuario.\nVariante"
+    )
+
+    intention_router._generar_respuesta_intencion(INTENCION, PREGUNTA, "59170000000")
+
+    assert semantic_cache._entradas.get(INTENCION["etiqueta"], []) == []
+
+
+def test_respuesta_con_historial_del_usuario_no_se_cachea(monkeypatch):
+    historial = [{"role": "user", "content": "Tengo la Panadería Doña Rosa", "timestamp": "1"}]
+    monkeypatch.setattr(helper_costo_google_ads, "leer_historial", lambda numero: historial)
+    monkeypatch.setattr(
+        helper_costo_google_ads.llm, "completar", lambda **kwargs: _respuesta_gpt("Para Doña Rosa, desde Bs 5 al día.")
+    )
+
+    respuesta = intention_router._generar_respuesta_intencion(INTENCION, PREGUNTA, "59170000000")
+
+    assert respuesta == "Para Doña Rosa, desde Bs 5 al día."
+    assert semantic_cache._entradas.get(INTENCION["etiqueta"], []) == []
+
+
+def test_respuesta_generica_se_reutiliza_con_otro_usuario(monkeypatch):
+    monkeypatch.setattr(helper_costo_google_ads.llm, "completar", lambda **kwargs: _respuesta_gpt("Desde Bs 5 al día."))
+    intention_router._generar_respuesta_intencion(INTENCION, PREGUNTA, "59170000000")
+
+    def completar_no_esperado(**kwargs):
+        raise AssertionError("no deberia llamar a GPT")
+
+    monkeypatch.setattr(helper_costo_google_ads.llm, "completar", completar_no_esperado)
+    respuesta = intention_router._generar_respuesta_intencion(
+        INTENCION, "cuanto cuesta poner un anuncio en google", "59171111111"
+    )
+
+    assert respuesta == "Desde Bs 5 al día."
+
+
+def test_respuesta_generica_se_cachea(monkeypatch):
+    monkeypatch.setattr(helper_costo_google_ads.llm, "completar", lambda **kwargs: _respuesta_gpt("Desde Bs 5 al día."))
+
+    respuesta = intention_router._generar_respuesta_intencion(INTENCION, PREGUNTA, "59170000000")
+
+    assert respuesta == "Desde Bs 5 al día."
+    assert semantic_cache.buscar(INTENCION["etiqueta"], PREGUNTA) == "Desde Bs 5 al día."
+
+
+# === DETECTORES EN PARALELO ===
+def _intencion_falsa(etiqueta, detector):
+    return {"etiqueta": etiqueta, "detector": detector}
+
+
+def test_detectores_corren_en_paralelo(monkeypatch):
+    iniciados = threading.Barrier(2, timeout=1.0)
+
+    def detector(mensaje, timeout_seg=None):
+        # Solo pasa si los dos detectores estan corriendo a la vez.
+        iniciados.wait()
+        return True
+
+    monkeypatch.setattr(intention_router, "INTENCIONES", [_intencion_falsa("a", detector), _intencion_falsa("b", detector)])
+
+    assert intention_router._detectar_con_detectores(PREGUNTA, {"a", "b"}) == {"a", "b"}
+
+
+def test_detector_fuera_de_plazo_cuenta_como_no(monkeypatch):
+    monkeypatch.setattr(intention_router, "INTENCIONES_DEADLINE_SEG", 0.2)
+    plazos = []
+
+    def lento(mensaje, timeout_seg=None):
+        plazos.append(timeout_seg)
+        time.sleep(0.5)
+        return True
+
+    monkeypatch.setattr(intention_router, "INTENCIONES", [
+        _intencion_falsa("lenta", lento),
+        _intencion_falsa("rapida", lambda mensaje, timeout_seg=None: True),
+        _intencion_falsa("no_pedida", lambda mensaje, timeout_seg=None: True),
+    ])
+
+    inicio = time.monotonic()
+    positivas = intention_router._detectar_con_detectores(PREGUNTA, {"lenta", "rapida"})
+
+    assert positivas == {"rapida"}
+    assert time.monotonic() - inicio < 0.45
+    # La llamada a GPT recibe como timeout lo que queda del plazo del turno.
+    assert 0 < plazos[0] <= 0.2
+
+
+def test_plazo_vencido_en_la_cola_no_llama_al_detector():
+    def detector(mensaje, timeout_seg=None):
+        raise AssertionError("no deberia llamarse")
+
+    assert intention_router._con_plazo(detector, PREGUNTA, time.monotonic() - 1, False) is False
+
+
+# === CLASIFICADOR MULTI-ETIQUETA ===
+def test_prompt_del_clasificador_incluye_todo_el_registro():
+    for intencion in intention_router.INTENCIONES:
+        assert f"- {intencion['etiqueta']}: " in intention_router.PROMPT_CLASIFICADOR
+
+
+def test_clasificador_con_json_invalido_devuelve_none(monkeypatch):
+    monkeypatch.setattr(intention_router.intent_cache, "obtener", lambda *args: None)
+    monkeypatch.setattr(intention_router.llm, "completar", lambda **kwargs: _respuesta_gpt("costo_google_ads"))
+
+    assert intention_router.clasificar_intenciones(PREGUNTA) is None
+
+
+def test_sin_clasificador_se_usan_los_detectores(monkeypatch):
+    monkeypatch.setattr(intention_router, "PREFILTRO_LOCAL", False)
+    monkeypatch.setattr(intention_router, "INTENCIONES_CLASIFICADOR_UNICO", True)
+    monkeypatch.setattr(intention_router, "clasificar_intenciones", lambda mensaje, timeout_seg=None: None)
+    monkeypatch.setattr(
+        intention_router, "_detectar_con_detectores", lambda mensaje, etiquetas: {"costo_google_ads"} & etiquetas
+    )
+
+    positivas = intention_router._detectar_intenciones(PREGUNTA)
+
+    assert [intencion["etiqueta"] for intencion in positivas] == ["costo_google_ads"]
+
+
+def test_etiquetas_del_clasificador_en_orden_del_registro(monkeypatch):
+    monkeypatch.setattr(intention_router, "PREFILTRO_LOCAL", False)
+    monkeypatch.setattr(intention_router, "INTENCIONES_CLASIFICADOR_UNICO", True)
+    monkeypatch.setattr(
+        intention_router, "clasificar_intenciones",
+        lambda mensaje, timeout_seg=None: {"costo_google_ads", "creador"},
+    )
+
+    positivas = intention_router._detectar_intenciones(PREGUNTA)
+
+    assert [intencion["etiqueta"] for intencion in positivas] == ["creador", "costo_google_ads"]
+
+
+# === VARIAS INTENCIONES EN UNA LLAMADA ===
+@pytest.fixture
+def dos_intenciones(monkeypatch):
+    """Mensaje con dos intenciones y un GPT que registra cada llamada."""
+    llamadas = []
+    positivas = [intention_router.INTENCIONES[0], INTENCION]
+    monkeypatch.setattr(intention_router, "INTENCIONES_GENERACION_UNICA", True)
+    monkeypatch.setattr(intention_router, "_detectar_intenciones", lambda mensaje: positivas)
+    monkeypatch.setattr(intention_router, "leer_historial", lambda numero: [])
+    monkeypatch.setattr(
+        intention_router.conversation_summary, "preparar_contexto", lambda numero, historial: (historial, None)
+    )
+    monkeypatch.setattr(intention_router.llm, "elegir_modelo", lambda tipo: f"modelo-{tipo}")
+
+    def completar(**kwargs):
+        llamadas.append(kwargs)
+        return _respuesta_gpt("Me creó Jesús y cuesta desde Bs 5 al día.")
+
+    monkeypatch.setattr(intention_router.llm, "completar", completar)
+    return llamadas
+
+
+def test_varias_intenciones_se_responden_con_una_sola_llamada(dos_intenciones, monkeypatch):
+    def helper_no_esperado(*args):
+        raise AssertionError("no deberia llamar a los helpers")
+
+    monkeypatch.setattr(intention_router, "_generar_respuestas", helper_no_esperado)
+
+    resultado = intention_router.preparar_historial_con_inyeccion("¿Quién te creó y cuánto cuesta?", "59170000000")
+
+    assert resultado["respuesta_directa"] == "Me creó Jesús y cuesta desde Bs 5 al día."
+    assert len(dos_intenciones) == 1
+    assert dos_intenciones[0]["tipo"] == "fusion"
+    assert dos_intenciones[0]["model"] == "modelo-fusion"
+
+
+def test_el_prompt_lleva_las_instrucciones_de_cada_intencion_en_orden(dos_intenciones):
+    intention_router.preparar_historial_con_inyeccion("¿Quién te creó y cuánto cuesta?", "59170000000")
+
+    mensajes = dos_intenciones[0]["messages"]
+    contexto = mensajes[1]["content"]
+    assert mensajes[0]["content"] == intention_router.PROMPT_MULTI_INTENCION
+    assert contexto.index("### Intención 'creador'") < contexto.index("### Intención 'costo_google_ads'")
+    assert INTENCION["instrucciones"] in contexto
+    assert mensajes[-1] == {"role": "user", "content": "¿Quién te creó y cuánto cuesta?"}
@@ -0,0 +1,331 @@
+"""Pruebas de la puerta de entrada a OpenAI (con un cliente falso)."""
+
+import json
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from src.services import llm
+from src.services.cache import CacheTTL
+
+MENSAJES = [{"role": "user", "content": "¿Cuánto cuesta un anuncio?"}]
+
+
+def _chunk(texto):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=texto))], usage=None)
+
+
+class StreamFalso:
+    """Stream del SDK: un fragmento cada `demora` segundos hasta que lo cierran."""
+
+    def __init__(self, textos, demora):
+        self.textos = textos
+        self.demora = demora
+        self.cerrado = threading.Event()
+        self.response = SimpleNamespace(extensions={})
+
+    def __iter__(self):
+        for texto in self.textos:
+            if self.cerrado.wait(self.demora):
+                raise OSError("conexion cerrada")
+            yield _chunk(texto)
+
+    def close(self):
+        self.cerrado.set()
+
+
+class ClienteFalso:
+    """openai_client falso: cada llamada a create devuelve el siguiente stream."""
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        return self.streams.pop(0)
+
+
+@pytest.fixture
+def gateway(monkeypatch, tmp_path):
+    """Contadores limpios, hedging activo para "general" y grabacion en un archivo temporal."""
+    monkeypatch.setattr(llm, "_contadores", {clave: 0 for clave in llm._contadores})
+    monkeypatch.setattr(llm, "_hedging", {clave: 0 for clave in llm._hedging})
+    monkeypatch.setattr(llm, "_latencias", {})
+    monkeypatch.setattr(llm, "_circuito", llm.CircuitBreaker(5, 30))
+    monkeypatch.setattr(llm, "LLM_HEDGING", True)
+    monkeypatch.setattr(llm, "LLM_HEDGING_TIPOS", ("general",))
+    monkeypatch.setattr(llm, "LLM_HEDGING_MAX_TASA", 1.0)
+    monkeypatch.setattr(llm, "_demora_hedging", lambda tipo, modelo: 0.05)
+    grabacion = tmp_path / "respuestas.jsonl"
+    monkeypatch.setattr(llm, "LLM_GRABAR_RESPUESTAS", str(grabacion))
+    return grabacion
+
+
+def _esperar(condicion, timeout=2.0):
+    limite = time.monotonic() + timeout
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicion()
+
+
+# === HEDGING ===
+def test_hedging_cancela_al_perdedor_sin_grabarlo_ni_contarlo(gateway, monkeypatch):
+    primario = StreamFalso(["lento"], demora=5.0)
+    duplicado = StreamFalso(["rapido", " y listo"], demora=0.01)
+    monkeypatch.setattr(llm, "openai_client", ClienteFalso([primario, duplicado]))
+
+    inicio = time.monotonic()
+    respuesta = llm.completar(MENSAJES, model="modelo-prueba", tipo="general")
+
+    assert respuesta.choices[0].message.content == "rapido y listo"
+    assert time.monotonic() - inicio < 1.0
+    assert primario.cerrado.is_set()
+    assert _esperar(lambda: llm._contadores["streams_cancelados"] == 1)
+    assert _esperar(lambda: llm._llamadas_en_vuelo == 0)
+    assert llm._contadores["exitos"] == 1
+    assert llm._contadores["fallos"] == 0
+    assert llm._hedging["ganadas_por_duplicado"] == 1
+    assert llm._circuito.estado() == "cerrado"
+    grabadas = [json.loads(linea) for linea in gateway.read_text(encoding="utf-8").splitlines()]
+    assert [g["contenido"] for g in grabadas] == ["rapido y listo"]
+
+
+def test_hedging_sin_duplicado_si_el_primario_responde_a_tiempo(gateway, monkeypatch):
+    monkeypatch.setattr(llm, "openai_client", ClienteFalso([StreamFalso(["hola"], demora=0.0)]))
+
+    respuesta = llm.completar(MENSAJES, model="modelo-prueba", tipo="general")
+
+    assert respuesta.choices[0].message.content == "hola"
+    assert llm._hedging["duplicadas"] == 0
+    assert llm._contadores["streams_cancelados"] == 0
+
+
+# === STREAMING ===
+def test_cortar_la_lectura_cierra_el_stream_del_proveedor(gateway, monkeypatch):
+    stream = StreamFalso(["uno", " dos", " tres"], demora=0.0)
+    monkeypatch.setattr(llm, "openai_client", ClienteFalso([stream]))
+
+    fragmentos = llm.completar_stream(MENSAJES, model="modelo-prueba", tipo="deteccion")
+    assert next(fragmentos) == "uno"
+    fragmentos.close()
+
+    assert stream.cerrado.is_set()
+    assert llm._llamadas_en_vuelo == 0
+    assert llm._contadores["exitos"] == 1
+
+
+def test_cerrar_stream_despierta_la_lectura_bloqueada():
+    local, remoto = socket.socketpair()
+    leido = []
+    lector = threading.Thread(target=lambda: leido.append(local.recv(10)))
+    lector.start()
+    red = SimpleNamespace(get_extra_info=lambda clave: local if clave == "socket" else None)
+    stream = SimpleNamespace(response=SimpleNamespace(extensions={"network_stream": red}), close=lambda: None)
+
+    try:
+        llm._cerrar_stream(stream)
+        lector.join(timeout=1.0)
+        assert not lector.is_alive()
+        assert leido == [b""]
+    finally:
+        local.close()
+        remoto.close()
+
+
+# === REINTENTOS Y CIRCUITO ===
+def _respuesta(texto):
+    uso = SimpleNamespace(prompt_tokens=10, completion_tokens=1, prompt_tokens_details=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=texto))], usage=uso)
+
+
+def _timeout():
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+class ClienteSecuencia:
+    """openai_client falso: cada create devuelve (o lanza) el siguiente resultado."""
+
+    def __init__(self, resultados):
+        self.resultados = list(resultados)
+        self.llamadas = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.llamadas += 1
+        resultado = self.resultados.pop(0) if len(self.resultados) > 1 else self.resultados[0]
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+
+@pytest.fixture
+def sin_espera(monkeypatch):
+    monkeypatch.setattr(llm, "_espera_backoff", lambda intento: 0.0)
+
+
+def test_reintenta_errores_transitorios(gateway, sin_espera, monkeypatch):
+    cliente = ClienteSecuencia([_timeout(), _timeout(), _respuesta("sí")])
+    monkeypatch.setattr(llm, "openai_client", cliente)
+
+    respuesta = llm.completar(MENSAJES, model="modelo-prueba", tipo="deteccion")
+
+    assert respuesta.choices[0].message.content == "sí"
+    assert cliente.llamadas == 3
+    assert llm._contadores["reintentos"] == 2
+    assert llm._contadores["exitos"] == 1
+    assert llm._circuito.estado() == "cerrado"
+
+
+def test_error_del_pedido_no_se_reintenta_ni_abre_el_circuito(gateway, sin_espera, monkeypatch):
+    cliente = ClienteSecuencia([ValueError("parametro invalido")])
+    monkeypatch.setattr(llm, "openai_client", cliente)
+    monkeypatch.setattr(llm, "_circuito", llm.CircuitBreaker(1, 30))
+
+    with pytest.raises(llm.LLMNoDisponible):
+        llm.completar(MENSAJES, model="modelo-prueba", tipo="deteccion")
+
+    assert cliente.llamadas == 1
+    assert llm._circuito.estado() == "cerrado"
+    assert llm._llamadas_en_vuelo == 0
+
+
+def test_circuito_abierto_rechaza_sin_llamar_al_proveedor(gateway, sin_espera, monkeypatch):
+    cliente = ClienteSecuencia([_timeout()])
+    monkeypatch.setattr(llm, "openai_client", cliente)
+    monkeypatch.setattr(llm, "_circuito", llm.CircuitBreaker(2, 30))
+
+    for _ in range(2):
+        with pytest.raises(llm.LLMNoDisponible):
+            llm.completar(MENSAJES, model="modelo-prueba", tipo="deteccion")
+    llamadas = cliente.llamadas
+
+    with pytest.raises(llm.LLMNoDisponible, match="circuito abierto"):
+        llm.completar(MENSAJES, model="modelo-prueba", tipo="deteccion")
+
+    assert llm._circuito.estado() == "abierto"
+    assert cliente.llamadas == llamadas
+    assert llm._contadores["rechazadas_circuito"] == 1
+
+
+def test_circuito_semiabierto_deja_pasar_una_sola_prueba():
+    circuito = llm.CircuitBreaker(1, 0.05)
+    circuito.registrar_fallo()
+    assert not circuito.permitir()
+
+    time.sleep(0.06)
+    assert circuito.estado() == "semiabierto"
+    assert circuito.permitir()
+    assert not circuito.permitir()
+
+    circuito.registrar_fallo()
+    assert circuito.estado() == "abierto"
+
+    time.sleep(0.06)
+    assert circuito.permitir()
+    circuito.registrar_exito()
+    assert circuito.estado() == "cerrado"
+    assert circuito.permitir() and circuito.permitir()
+
+
+# === RUTEO ===
+RUTA = {"prueba": {"modelos": ["rapido-caro", "rapido-barato"], "p95_seg": 1.0}, "general": {"modelos": ["general"], "p95_seg": 3.0}}
+
+
+@pytest.fixture
+def ruteo(gateway, monkeypatch):
+    monkeypatch.setattr(llm, "RUTEO_MODELOS", RUTA)
+    monkeypatch.setattr(llm, "_elecciones", {})
+
+    def medir(modelo, segundos, cantidad=llm.RUTEO_MIN_MUESTRAS):
+        for _ in range(cantidad):
+            llm._registrar_latencia("prueba", modelo, segundos)
+
+    return medir
+
+
+def test_sin_muestras_se_usa_el_primer_nivel(ruteo):
+    ruteo("rapido-caro", 5.0, cantidad=llm.RUTEO_MIN_MUESTRAS - 1)
+
+    assert llm.elegir_modelo("prueba") == "rapido-caro"
+
+
+def test_p95_fuera_de_presupuesto_baja_de_nivel(ruteo):
+    ruteo("rapido-caro", 2.0)
+    ruteo("rapido-barato", 0.5)
+
+    assert llm.elegir_modelo("prueba") == "rapido-barato"
+    assert llm.estadisticas()["modelos_elegidos"] == {"prueba": {"rapido-barato": 1}}
+
+
+def test_ningun_nivel_en_presupuesto_usa_el_de_menor_p95(ruteo):
+    ruteo("rapido-caro", 2.0)
+    ruteo("rapido-barato", 3.0)
+
+    assert llm.elegir_modelo("prueba") == "rapido-caro"
+
+
+def test_tipo_desconocido_usa_la_ruta_general(ruteo):
+    assert llm.elegir_modelo("otro") == "general"
+
+
+def test_cada_llamada_registra_nivel_y_modelo(gateway, monkeypatch, capsys):
+    respuesta = _respuesta("no")
+    cliente = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: respuesta)))
+    monkeypatch.setattr(llm, "openai_client", cliente)
+    ruta = llm.RUTEO_MODELOS["deteccion"]["modelos"]
+
+    llm.completar(MENSAJES, model=ruta[-1], tipo="deteccion")
+    llm.completar(MENSAJES, model="modelo-fijo", tipo="deteccion")
+
+    salida = capsys.readouterr().out
+    assert f"[LLM] Tokens deteccion ({ruta[-1]}, nivel {len(ruta) - 1})" in salida
+    assert "[LLM] Tokens deteccion (modelo-fijo, fuera de ruta)" in salida
+
+
+# === CACHE DETERMINISTA ===
+@pytest.fixture
+def determinista(gateway, monkeypatch):
+    monkeypatch.setattr(llm, "_cache_determinista", CacheTTL(10, 60))
+    cliente = ClienteSecuencia([_respuesta(' {"accion": "crear"} ')])
+    monkeypatch.setattr(llm, "openai_client", cliente)
+    return cliente
+
+
+def test_temperatura_cero_reutiliza_la_respuesta(determinista):
+    primera = llm.completar_determinista(MENSAJES, model="modelo-prueba", tipo="agente", temperature=0)
+    segunda = llm.completar_determinista(list(MENSAJES), model="modelo-prueba", tipo="agente", temperature=0)
+
+    assert primera == segunda == '{"accion": "crear"}'
+    assert determinista.llamadas == 1
+
+
+def test_otro_prompt_modelo_o_parametro_es_otra_clave(determinista):
+    llm.completar_determinista(MENSAJES, model="modelo-prueba", tipo="agente", temperature=0)
+    llm.completar_determinista(MENSAJES + [{"role": "user", "content": "y?"}], model="modelo-prueba", tipo="agente", temperature=0)
+    llm.completar_determinista(MENSAJES, model="otro-modelo", tipo="agente", temperature=0)
+    llm.completar_determinista(MENSAJES, model="modelo-prueba", tipo="agente", temperature=0, max_tokens=10)
+
+    assert determinista.llamadas == 4
+
+
+def test_temperatura_mayor_a_cero_no_se_cachea(determinista):
+    for _ in range(2):
+        llm.completar_determinista(MENSAJES, model="modelo-prueba", tipo="agente", temperature=0.7)
+
+    assert determinista.llamadas == 2
+
+
+def test_json_invalido_no_se_cachea(determinista):
+    determinista.resultados = [_respuesta("no es json")]
+
+    for _ in range(2):
+        assert llm.completar_determinista(
+            MENSAJES, model="modelo-prueba", tipo="agente", temperature=0, response_format={"type": "json_object"}
+        ) == "no es json"
+
+    assert determinista.llamadas == 2
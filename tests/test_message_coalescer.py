@@ -0,0 +1,100 @@
+"""Pruebas de la agrupacion de rafagas por remitente (dispatcher falso)."""
+
+import threading
+
+import pytest
+
+from src.services import message_coalescer
+
+NUMERO = "59170000000"
+OTRO = "59171111111"
+
+
+class DispatcherFalso:
+    """Cupos contados y turnos encolados en memoria, sin pool real."""
+
+    def __init__(self, cupos):
+        self.cupos = cupos
+        self.reservas = 0
+        self.turnos = []
+        self.encolado = threading.Event()
+
+    def reservar(self):
+        if self.reservas >= self.cupos:
+            return False
+        self.reservas += 1
+        return True
+
+    def liberar_reserva(self):
+        self.reservas -= 1
+
+    def encolar(self, funcion, *args, clave=None, reservado=False):
+        assert reservado
+        self.turnos.append(args)
+        self.encolado.set()
+        return True
+
+
+@pytest.fixture
+def agrupador(monkeypatch):
+    """Agrupador limpio con ventana corta y dos cupos en el pool."""
+    falso = DispatcherFalso(cupos=2)
+    monkeypatch.setattr(message_coalescer, "dispatcher", falso)
+    monkeypatch.setattr(message_coalescer, "_grupos", {})
+    monkeypatch.setattr(message_coalescer, "WEBHOOK_VENTANA_AGRUPACION_SEG", 0.1)
+    monkeypatch.setattr(message_coalescer, "WEBHOOK_ESPERA_MAXIMA_AGRUPACION_SEG", 1.0)
+    return falso
+
+
+def _turno(*args):
+    raise AssertionError("el dispatcher falso no ejecuta turnos")
+
+
+def test_rafaga_del_mismo_remitente_es_un_solo_turno(agrupador):
+    assert message_coalescer.agregar_lote(_turno, [(NUMERO, "Hola", "wamid.1")])
+    assert message_coalescer.agregar_lote(_turno, [(NUMERO, "Tengo una panadería", "wamid.2")])
+
+    assert agrupador.encolado.wait(2)
+    assert agrupador.turnos == [(NUMERO, ["Hola", "Tengo una panadería"], ["wamid.1", "wamid.2"])]
+    # Un solo cupo por grupo, aunque lleguen dos mensajes.
+    assert agrupador.reservas == 1
+    assert message_coalescer._grupos == {}
+
+
+def test_lote_duplicado_devuelve_el_cupo(agrupador):
+    assert message_coalescer.agregar_lote(_turno, [(NUMERO, "Hola", "wamid.1")], lambda mensajes: [])
+
+    assert agrupador.reservas == 0
+    assert message_coalescer._grupos == {}
+    assert not agrupador.encolado.wait(0.2)
+
+
+def test_sin_cupo_no_deduplica_ni_deja_grupos_fijados(agrupador):
+    deduplicados = []
+    lote = [(NUMERO, "Hola", "wamid.1"), (OTRO, "Buenas", "wamid.2"), ("59172222222", "Qué tal", "wamid.3")]
+
+    aceptado = message_coalescer.agregar_lote(_turno, lote, lambda mensajes: deduplicados.extend(mensajes) or mensajes)
+
+    assert not aceptado
+    assert deduplicados == []
+    # Los grupos abiertos antes de quedarse sin cupo se descartan y devuelven su cupo.
+    assert agrupador.reservas == 0
+    assert message_coalescer._grupos == {}
+
+
+def test_vaciar_despacha_sin_esperar_la_ventana(agrupador, monkeypatch):
+    monkeypatch.setattr(message_coalescer, "WEBHOOK_VENTANA_AGRUPACION_SEG", 30.0)
+    message_coalescer.agregar_lote(_turno, [(NUMERO, "Hola", "wamid.1"), (OTRO, "Buenas", "wamid.2")])
+
+    message_coalescer.vaciar()
+
+    assert sorted(agrupador.turnos) == [(NUMERO, ["Hola"], ["wamid.1"]), (OTRO, ["Buenas"], ["wamid.2"])]
+    assert message_coalescer._grupos == {}
+
+
+def test_ventana_cero_despacha_al_soltar_el_lote(agrupador, monkeypatch):
+    monkeypatch.setattr(message_coalescer, "WEBHOOK_VENTANA_AGRUPACION_SEG", 0.0)
+
+    message_coalescer.agregar_lote(_turno, [(NUMERO, "Hola", "wamid.1"), (NUMERO, "Una consulta", "wamid.2")])
+
+    assert agrupador.turnos == [(NUMERO, ["Hola", "Una consulta"], ["wamid.1", "wamid.2"])]
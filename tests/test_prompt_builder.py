@@ -0,0 +1,87 @@
+"""Pruebas del armado de prompts con presupuesto de tokens."""
+
+from src.services import prompt_builder
+from src.services.prompt_builder import ajustar_historial, construir_prompt, tokens_mensajes
+
+MODELO = "gpt-4o-mini"
+
+
+def _mensaje(role, content):
+    return {"role": role, "content": content, "timestamp": "1"}
+
+
+def _costo(texto):
+    # Sin tiktoken (ver conftest) se estima 1 token cada 4 caracteres.
+    return prompt_builder.TOKENS_POR_MENSAJE + prompt_builder.contar_tokens(texto, MODELO)
+
+
+# === PRESUPUESTO DE HISTORIAL ===
+def test_historial_se_llena_desde_lo_mas_reciente_en_orden_cronologico():
+    historial = [_mensaje("user", f"mensaje numero {i}") for i in range(10)]
+    presupuesto = 3 * _costo("mensaje numero 9")
+
+    elegidos = ajustar_historial(historial, MODELO, presupuesto)
+
+    assert [m["content"] for m in elegidos] == ["mensaje numero 7", "mensaje numero 8", "mensaje numero 9"]
+    assert all(set(m) == {"role", "content"} for m in elegidos)
+
+
+def test_historial_sin_repetidos_ni_el_mensaje_actual():
+    historial = [
+        _mensaje("user", "¿Cuánto cuesta?"),
+        _mensaje("assistant", "Desde Bs 5 al día."),
+        _mensaje("user", "cuanto cuesta"),
+        _mensaje("assistant", "Desde Bs 5 al día."),
+        _mensaje("user", "Hola"),
+        {"role": "user"},
+        _mensaje("user", ""),
+    ]
+
+    elegidos = ajustar_historial(historial, MODELO, 1000, excluir="¿Hola?")
+
+    assert elegidos == [
+        {"role": "user", "content": "cuanto cuesta"},
+        {"role": "assistant", "content": "Desde Bs 5 al día."},
+    ]
+
+
+def test_prompt_completo_respeta_el_presupuesto():
+    historial = [_mensaje("user" if i % 2 else "assistant", "texto de relleno " * 20) for i in range(40)]
+    historial += [_mensaje("assistant", f"respuesta {i}") for i in range(3)]
+
+    prompt = construir_prompt("sistema", historial, MODELO, mensaje_usuario="Hola", presupuesto=300)
+
+    assert tokens_mensajes(prompt, MODELO) <= 300
+    assert prompt[0] == {"role": "system", "content": "sistema"}
+    assert prompt[-1] == {"role": "user", "content": "Hola"}
+    assert prompt[-2] == {"role": "assistant", "content": "respuesta 2"}
+
+
+def test_presupuesto_agotado_deja_solo_sistema_y_mensaje():
+    prompt = construir_prompt("sistema " * 100, [_mensaje("user", "viejo")], MODELO, mensaje_usuario="Hola", presupuesto=10)
+
+    assert [m["content"] for m in prompt] == ["sistema " * 100, "Hola"]
+
+
+# === PREFIJO CACHEABLE ===
+def test_prefijo_estatico_va_primero_y_el_contexto_del_usuario_despues():
+    historial = [_mensaje("assistant", "¿Cómo se llama tu empresa?")]
+
+    prompt_a = construir_prompt("prefijo fijo", historial, MODELO, "Panadería Rosa", contexto="Resumen de Rosa")
+    prompt_b = construir_prompt("prefijo fijo", [], MODELO, "Hola", contexto="Resumen de Juan")
+
+    assert [m["role"] for m in prompt_a] == ["system", "system", "assistant", "user"]
+    assert prompt_a[0] == prompt_b[0]
+    assert prompt_a[1]["content"] == "Resumen de Rosa"
+
+
+def test_prefijos_registrados_exponen_su_version(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "_prefijos", {})
+
+    texto = prompt_builder.prefijo_estatico("prueba", MODELO, "Eres un asistente.")
+    version = prompt_builder.prefijos()["prueba"]["version"]
+    prompt_builder.prefijo_estatico("prueba", MODELO, "Eres un asistente breve.")
+
+    assert texto == "Eres un asistente."
+    assert prompt_builder.prefijos()["prueba"]["version"] != version
+
@@ -0,0 +1,108 @@
+"""Pruebas de los pools de respuestas pre-generadas (sin Firestore ni OpenAI)."""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from src.services import response_pool  # noqa: E402
+
+PROMPT = "Explica qué es Google Ads."
+PREGUNTA = "¿Qué es Google Ads?"
+NUMERO = "59170000000"
+
+
+class HiloInmediato:
+    """threading.Thread que ejecuta el objetivo al llamar a start()."""
+
+    def __init__(self, target, daemon=None):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+class GPTFalso:
+    """llm.completar falso: numera las variantes o falla si no hay servicio."""
+
+    def __init__(self, caido=False):
+        self.caido = caido
+        self.llamadas = 0
+
+    def __call__(self, **kwargs):
+        self.llamadas += 1
+        if self.caido:
+            raise TimeoutError("OpenAI no responde")
+        contenido = f"Variante {self.llamadas}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=contenido))])
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """Estado limpio, pools en memoria en lugar de Firestore y regeneracion sincrona."""
+    guardados = {}
+    monkeypatch.setattr(response_pool, "_pools", {})
+    monkeypatch.setattr(response_pool, "_regenerando", set())
+    monkeypatch.setattr(response_pool, "_proximo_intento", {})
+    monkeypatch.setattr(response_pool, "_fallos_regeneracion", {})
+    monkeypatch.setattr(response_pool, "_servidas", {})
+    monkeypatch.setattr(response_pool, "_fallos", {})
+    monkeypatch.setattr(response_pool, "POOL_RESPUESTAS", True)
+    monkeypatch.setattr(response_pool, "POOL_RESPUESTAS_PUENTE", False)
+    monkeypatch.setattr(response_pool, "threading", SimpleNamespace(Thread=HiloInmediato))
+    monkeypatch.setattr(response_pool, "leer_pool_respuestas", lambda etiqueta: guardados.get(etiqueta))
+    monkeypatch.setattr(
+        response_pool, "guardar_pool_respuestas",
+        lambda etiqueta, version, variantes: guardados.__setitem__(etiqueta, {"version": version, "variantes": variantes}),
+    )
+    return guardados
+
+
+def test_pool_vigente_responde_sin_llamar_a_gpt(pools, monkeypatch):
+    pools["que_es_google_ads"] = {"version": response_pool.version_pool(PROMPT), "variantes": ["A", "B"]}
+    monkeypatch.setattr(response_pool.llm, "completar", GPTFalso(caido=True))
+
+    respuesta = response_pool.responder_desde_pool("que_es_google_ads", PROMPT, PREGUNTA, NUMERO)
+
+    assert respuesta in {"A", "B"}
+    assert response_pool.llm.completar.llamadas == 0
+
+
+def test_pool_desactualizado_se_regenera_en_segundo_plano(pools, monkeypatch):
+    pools["que_es_google_ads"] = {"version": "vieja", "variantes": ["A"]}
+    monkeypatch.setattr(response_pool.llm, "completar", GPTFalso())
+
+    assert response_pool.responder_desde_pool("que_es_google_ads", PROMPT, PREGUNTA, NUMERO) is None
+
+    pool = pools["que_es_google_ads"]
+    assert pool["version"] == response_pool.version_pool(PROMPT)
+    assert pool["variantes"] == [f"Variante {i}" for i in range(1, response_pool.POOL_RESPUESTAS_K + 1)]
+    assert response_pool.responder_desde_pool("que_es_google_ads", PROMPT, PREGUNTA, NUMERO).startswith("Variante")
+
+
+def test_regeneracion_fallida_espera_antes_de_reintentar(pools, monkeypatch):
+    gpt = GPTFalso(caido=True)
+    monkeypatch.setattr(response_pool.llm, "completar", gpt)
+
+    for _ in range(3):
+        assert response_pool.responder_desde_pool("que_es_google_ads", PROMPT, PREGUNTA, NUMERO) is None
+
+    # Un solo intento (corta en la primera variante fallida) y luego espera.
+    assert gpt.llamadas == 1
+    estado = response_pool.estadisticas()["que_es_google_ads"]
+    assert estado["sin_pool"] == 3
+    assert estado["regeneraciones_fallidas"] == 1
+    assert estado["proximo_intento_seg"] > response_pool.POOL_RESPUESTAS_REINTENTO_SEG
+
+
+def test_la_espera_crece_hasta_el_maximo(pools, monkeypatch):
+    monkeypatch.setattr(response_pool.llm, "completar", GPTFalso(caido=True))
+
+    for _ in range(10):
+        response_pool._proximo_intento.clear()
+        response_pool.responder_desde_pool("que_es_google_ads", PROMPT, PREGUNTA, NUMERO)
+
+    estado = response_pool.estadisticas()["que_es_google_ads"]
+    assert estado["regeneraciones_fallidas"] == 10
+    assert estado["proximo_intento_seg"] == pytest.approx(response_pool.POOL_RESPUESTAS_REINTENTO_MAX_SEG, abs=1)
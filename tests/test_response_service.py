@@ -0,0 +1,63 @@
+"""Pruebas de la respuesta general en streaming (sin OpenAI)."""
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+from src.services import response_service  # noqa: E402
+
+NUMERO = "59170000000"
+
+
+class FragmentosFalsos:
+    """Generador de completar_stream: cuenta lo leido y si lo cerraron."""
+
+    def __init__(self, fragmentos):
+        self.fragmentos = fragmentos
+        self.leidos = 0
+        self.cerrado = False
+
+    def __iter__(self):
+        for fragmento in self.fragmentos:
+            self.leidos += 1
+            yield fragmento
+
+    def close(self):
+        self.cerrado = True
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    """Contexto sin resumen y un stream que el test llena."""
+    falso = FragmentosFalsos([])
+    monkeypatch.setattr(
+        response_service.conversation_summary, "preparar_contexto", lambda numero, historial: (historial, None)
+    )
+    monkeypatch.setattr(response_service.llm, "elegir_modelo", lambda tipo: "modelo-prueba")
+    monkeypatch.setattr(response_service.llm, "completar_stream", lambda **kwargs: falso)
+    return falso
+
+
+def test_deja_de_leer_cuando_el_recorte_esta_decidido(stream):
+    stream.fragmentos = ["Primera línea.\n", "Segunda línea.\n", "Tercera línea.\n", "Cuarta", " línea.\n"] + ["relleno "] * 50
+
+    respuesta = response_service.generar_respuesta("Hola", NUMERO, [])
+
+    assert respuesta == "Primera línea.\nSegunda línea.\nTercera línea."
+    assert stream.leidos == 4
+    assert stream.cerrado
+
+
+def test_respuesta_corta_se_lee_completa(stream):
+    stream.fragmentos = ["¡Hola! ", "¿En qué te ayudo?"]
+
+    assert response_service.generar_respuesta("Hola", NUMERO, []) == "¡Hola! ¿En qué te ayudo?"
+    assert stream.leidos == 2
+    assert stream.cerrado
+
+
+def test_stream_vacio_responde_el_mensaje_de_error(stream):
+    respuesta = response_service.generar_respuesta("Hola", NUMERO, [])
+
+    assert respuesta.startswith("Lo siento, hubo un problema")
+    assert stream.cerrado
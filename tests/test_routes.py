@@ -0,0 +1,152 @@
+"""Pruebas del turno del webhook (sin Firestore, OpenAI ni WhatsApp)."""
+
+import threading
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+pytest.importorskip("gspread")
+
+from flask import Flask  # noqa: E402
+
+from src import routes  # noqa: E402
+from src.services import dispatcher, message_coalescer  # noqa: E402
+from src.services.prompt_builder import construir_prompt  # noqa: E402
+
+NUMERO = "59170000000"
+
+
+@pytest.fixture
+def turno(monkeypatch):
+    """Historial en memoria y registro de lo que el turno guarda y responde."""
+    registro = {
+        "historial": [{"role": "assistant", "content": "¿Cómo se llama tu empresa?", "timestamp": "1"}],
+        "recibidos": [],
+        "enviados": [],
+    }
+
+    def agregar_mensaje(numero, role, mensaje):
+        registro["historial"].append({"role": role, "content": mensaje, "timestamp": str(len(registro["historial"]) + 1)})
+
+    def get_response(mensaje, numero):
+        registro["recibidos"].append(mensaje)
+        return "respuesta"
+
+    monkeypatch.setattr(routes, "leer_historial", lambda numero, refrescar=False: list(registro["historial"]))
+    monkeypatch.setattr(routes, "agregar_mensaje", agregar_mensaje)
+    monkeypatch.setattr(routes, "get_response", get_response)
+    monkeypatch.setattr(routes, "send_message", lambda numero, texto: registro["enviados"].append(texto))
+    monkeypatch.setattr(routes.conversation_summary, "registrar_turno", lambda numero: None)
+    return registro
+
+
+def test_rafaga_se_guarda_y_responde_como_un_solo_mensaje(turno):
+    routes.procesar_turno(NUMERO, ["Hola", "Tengo una panadería"], ["wamid.1", "wamid.2"])
+
+    usuario = [m["content"] for m in turno["historial"] if m["role"] == "user"]
+    assert usuario == ["Hola\nTengo una panadería"]
+    assert turno["recibidos"] == ["Hola\nTengo una panadería"]
+    assert turno["enviados"] == ["respuesta"]
+
+
+def test_rafaga_llega_una_sola_vez_al_prompt(turno):
+    routes.procesar_turno(NUMERO, ["Hola", "Tengo una panadería"], ["wamid.1", "wamid.2"])
+
+    prompt = construir_prompt("sistema", turno["historial"], "gpt-4o-mini", mensaje_usuario=turno["recibidos"][0])
+
+    contenidos = [m["content"] for m in prompt]
+    assert contenidos == ["sistema", "¿Cómo se llama tu empresa?", "Hola\nTengo una panadería"]
+
+
+def test_primer_mensaje_responde_bienvenida(turno, monkeypatch):
+    turno["historial"].clear()
+    registrados = []
+    monkeypatch.setattr(routes, "create_user_if_not_exists", registrados.append)
+
+    routes.procesar_turno(NUMERO, ["Hola"], ["wamid.1"])
+
+    assert registrados == [NUMERO]
+    assert turno["enviados"] == [routes.MENSAJE_BIENVENIDA]
+    assert turno["recibidos"] == []
+
+
+# === WEBHOOK ===
+def _payload(*mensajes):
+    return {"entry": [{"changes": [{"value": {"messages": [
+        {"from": numero, "id": message_id, "text": {"body": texto}} for numero, texto, message_id in mensajes
+    ]}}]}]}
+
+
+def test_extrae_todas_las_entries_y_omite_lo_que_no_es_texto():
+    data = _payload((NUMERO, "Hola", "wamid.1"), ("59171111111", "Buenas", "wamid.2"))
+    data["entry"].append({"changes": [
+        {"value": {"statuses": [{"id": "wamid.0", "status": "read"}]}},
+        {"value": {"messages": [
+            {"from": NUMERO, "id": "wamid.3", "type": "image", "image": {}},
+            {"from": NUMERO, "id": "wamid.4", "text": {"body": "¿Cuánto cuesta?"}},
+        ]}},
+    ]})
+
+    assert routes.extraer_mensajes(data) == [
+        (NUMERO, "Hola", "wamid.1"),
+        ("59171111111", "Buenas", "wamid.2"),
+        (NUMERO, "¿Cuánto cuesta?", "wamid.4"),
+    ]
+
+
+def test_deduplica_en_bloque_con_un_id_repetido(monkeypatch):
+    consultas = []
+
+    def registrar_ids_procesados(ids):
+        consultas.append(ids)
+        return {"wamid.1", "wamid.3"}
+
+    monkeypatch.setattr(routes, "registrar_ids_procesados", registrar_ids_procesados)
+    mensajes = [
+        (NUMERO, "Hola", "wamid.1"),
+        (NUMERO, "Hola", "wamid.1"),
+        (NUMERO, "Ya visto", "wamid.2"),
+        (NUMERO, "Nuevo", "wamid.3"),
+    ]
+
+    nuevos = routes.deduplicar_mensajes(mensajes)
+
+    assert nuevos == [(NUMERO, "Hola", "wamid.1"), (NUMERO, "Nuevo", "wamid.3")]
+    assert len(consultas) == 1
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente HTTP del blueprint con el pool saturado (sin cupos libres)."""
+    cupos = threading.BoundedSemaphore(1)
+    cupos.acquire()
+    monkeypatch.setattr(dispatcher, "_cupos", cupos)
+    monkeypatch.setattr(dispatcher, "WEBHOOK_ESPERA_COLA_SEG", 0.01)
+    monkeypatch.setattr(message_coalescer, "_grupos", {})
+    registrados = []
+    monkeypatch.setattr(routes, "registrar_ids_procesados", lambda ids: registrados.extend(ids) or set())
+    app = Flask(__name__)
+    app.register_blueprint(routes.webhook_bp)
+    return app.test_client(), registrados
+
+
+def test_pool_saturado_responde_503_sin_registrar_ids(cliente):
+    http, registrados = cliente
+
+    respuesta = http.post("/webhook", json=_payload((NUMERO, "Hola", "wamid.1")))
+
+    assert respuesta.status_code == 503
+    assert registrados == []
+    assert message_coalescer._grupos == {}
+
+
+def test_turno_en_un_proceso_del_pool_vacia_la_escritura_diferida(turno, monkeypatch):
+    vaciados = []
+    monkeypatch.setattr(routes, "vaciar_pendientes", lambda: vaciados.append(True))
+
+    routes.procesar_turno(NUMERO, ["Hola"], ["wamid.1"])
+    assert vaciados == []
+
+    monkeypatch.setattr(routes.multiprocessing, "parent_process", lambda: object())
+    routes.procesar_turno(NUMERO, ["Hola"], ["wamid.2"])
+    assert vaciados == [True]
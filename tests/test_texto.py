@@ -0,0 +1,52 @@
+"""Pruebas de las utilidades de texto (normalizacion y recorte)."""
+
+import pytest
+
+from src.services.texto import RecorteIncremental, normalizar_texto, recortar_texto
+
+LARGO = (
+    "Google Ads te permite aparecer cuando buscan tu negocio.\n\n"
+    "Pagas solo cuando alguien hace clic en tu anuncio.\n"
+    "Puedes empezar con un presupuesto pequeño.\n"
+    "Esta cuarta línea ya no entra."
+)
+
+
+def test_normalizar_quita_acentos_puntuacion_y_espacios():
+    assert normalizar_texto("  ¿Cuánto   CUESTA Google Ads?! ") == "cuanto cuesta google ads"
+
+
+def _fragmentar(texto, tamano):
+    return [texto[i:i + tamano] for i in range(0, len(texto), tamano)]
+
+
+@pytest.mark.parametrize("tamano", [1, 3, 7, 20])
+def test_recorte_incremental_coincide_con_el_recorte_completo(tamano):
+    recorte = RecorteIncremental(max_lineas=3, max_palabras=45)
+    leidos = 0
+    for fragmento in _fragmentar(LARGO, tamano):
+        leidos += 1
+        if recorte.agregar(fragmento):
+            break
+
+    assert recorte.resultado() == recortar_texto(LARGO, 3, 45)
+    # Se deja de leer antes de recibir todo el texto.
+    assert leidos < len(_fragmentar(LARGO, tamano))
+
+
+def test_recorte_incremental_corta_por_palabras():
+    recorte = RecorteIncremental(max_lineas=3, max_palabras=5)
+    fragmentos = ["uno dos ", "tres cuatro ", "cinco ", "seis ", "siete"]
+
+    leidos = [f for f in fragmentos if not recorte.agregar(f)]
+
+    assert recorte.completo
+    assert len(leidos) == 3
+    assert recorte.resultado() == "uno dos tres cuatro cinco"
+
+
+def test_recorte_incremental_sin_limite_alcanzado_lee_todo():
+    recorte = RecorteIncremental(max_lineas=3, max_palabras=45)
+
+    assert not any(recorte.agregar(f) for f in ["Hola, ", "¿en qué te ayudo?"])
+    assert recorte.resultado() == "Hola, ¿en qué te ayudo?"
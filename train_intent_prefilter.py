@@ -0,0 +1,116 @@
+"""
+Entrena el modelo TF-IDF del prefiltro local de intenciones.
+
+Lee las conversaciones exportadas por export_firestore_conversations.py
+(carpeta firestore_exports), etiqueta cada mensaje de usuario una sola vez con
+el clasificador multi-etiqueta GPT (las etiquetas se guardan en
+etiquetas_intenciones.json para no volver a pagarlas), agrega los ejemplos
+declarados en cada INTENCION y entrena una regresion logistica por intencion
+sobre texto lematizado. El resultado se guarda en RUTA_MODELO_PREFILTRO.
+
+Uso:
+    python export_firestore_conversations.py
+    python train_intent_prefilter.py
+"""
+
+import glob
+import json
+import os
+
+import joblib
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from src.config import RUTA_MODELO_PREFILTRO
+from src.services.intent_prefilter import preprocesar
+from src.services.intention_router import INTENCIONES, clasificar_intenciones
+
+# Carpeta generada por export_firestore_conversations.py
+EXPORT_FOLDER = "firestore_exports"
+ARCHIVO_ETIQUETAS = os.path.join(EXPORT_FOLDER, "etiquetas_intenciones.json")
+
+# Minimo de ejemplos positivos para entrenar el modelo de una intencion.
+MIN_POSITIVOS = 5
+
+
+def cargar_mensajes_usuario():
+    """Devuelve los textos unicos de usuario de todas las conversaciones exportadas."""
+    mensajes = set()
+    for ruta in glob.glob(os.path.join(EXPORT_FOLDER, "*.json")):
+        if ruta == ARCHIVO_ETIQUETAS:
+            continue
+        with open(ruta, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        for mensaje in datos.get("historial", []):
+            if isinstance(mensaje, dict) and mensaje.get("role") == "user" and mensaje.get("content"):
+                mensajes.add(mensaje["content"].strip())
+    return sorted(mensajes)
+
+
+def etiquetar(mensajes):
+    """Etiqueta con GPT los mensajes nuevos y reutiliza las etiquetas ya guardadas."""
+    etiquetas = {}
+    if os.path.exists(ARCHIVO_ETIQUETAS):
+        with open(ARCHIVO_ETIQUETAS, "r", encoding="utf-8") as f:
+            etiquetas = json.load(f)
+
+    pendientes = [m for m in mensajes if m not in etiquetas]
+    print(f"Etiquetando {len(pendientes)} mensajes nuevos con GPT ({len(etiquetas)} en cache)...")
+    for i, mensaje in enumerate(pendientes, start=1):
+        resultado = clasificar_intenciones(mensaje)
+        if resultado is None:
+            continue
+        etiquetas[mensaje] = sorted(resultado)
+        if i % 50 == 0:
+            print(f"  {i}/{len(pendientes)}")
+
+    with open(ARCHIVO_ETIQUETAS, "w", encoding="utf-8") as f:
+        json.dump(etiquetas, f, ensure_ascii=False, indent=2)
+    return etiquetas
+
+
+def construir_dataset(etiquetas):
+    """Une mensajes etiquetados y ejemplos declarados en un solo dataset."""
+    dataset = dict(etiquetas)
+    for intencion in INTENCIONES:
+        for ejemplo in intencion["ejemplos_si"]:
+            dataset.setdefault(ejemplo, [])
+            if intencion["etiqueta"] not in dataset[ejemplo]:
+                dataset[ejemplo].append(intencion["etiqueta"])
+        for ejemplo in intencion["ejemplos_no"]:
+            dataset.setdefault(ejemplo, [])
+    return dataset
+
+
+def entrenar(dataset):
+    """Entrena vectorizador + un clasificador binario por intencion."""
+    textos = list(dataset)
+    preprocesados = [preprocesar(t) for t in textos]
+
+    vectorizador = TfidfVectorizer(ngram_range=(1, 2), min_df=1, sublinear_tf=True)
+    matriz = vectorizador.fit_transform(preprocesados)
+
+    modelos = {}
+    for intencion in INTENCIONES:
+        etiqueta = intencion["etiqueta"]
+        y = [1 if etiqueta in dataset[t] else 0 for t in textos]
+        positivos = sum(y)
+        if positivos < MIN_POSITIVOS or positivos == len(y):
+            print(f"- {etiqueta}: {positivos} positivos, se omite (queda como ambigua -> GPT)")
+            continue
+        clasificador = LogisticRegression(class_weight="balanced", max_iter=1000)
+        clasificador.fit(matriz, y)
+        modelos[etiqueta] = clasificador
+        print(f"- {etiqueta}: {positivos} positivos / {len(y)} ejemplos")
+
+    return {"vectorizador": vectorizador, "modelos": modelos}
+
+
+if __name__ == "__main__":
+    mensajes = cargar_mensajes_usuario()
+    print(f"Mensajes de usuario exportados: {len(mensajes)}")
+    modelo = entrenar(construir_dataset(etiquetar(mensajes)))
+
+    os.makedirs(os.path.dirname(RUTA_MODELO_PREFILTRO), exist_ok=True)
+    joblib.dump(modelo, RUTA_MODELO_PREFILTRO)
+    print(f"\n✅ Modelo guardado en: {RUTA_MODELO_PREFILTRO}")